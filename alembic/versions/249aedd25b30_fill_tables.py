@@ -11,8 +11,6 @@ from alembic import op
 import sqlalchemy as sa
 from sqlalchemy import insert, text
 
-from data_interpretations.numbers_interpretations import numbers_interpretations
-from data_interpretations.time_interpretations import time_interpretations
 from db_helpers.models import NumberChoice, TimeChoice, TimeRange
 
 # revision identifiers, used by Alembic.
@@ -23,6 +21,10 @@ depends_on: Union[str, Sequence[str], None] = None
 
 
 def upgrade():
+    # alembic импортирует все ревизии при каждом запуске, словари нужны только этой миграции
+    from data_interpretations.numbers_interpretations import numbers_interpretations
+    from data_interpretations.time_interpretations import time_interpretations
+
     for time_key, time_data in time_interpretations.items():
         time_range = time_data["time_range"]
 
@@ -0,0 +1,42 @@
+"""selection user/timestamp indexes
+
+Revision ID: 3f1c9a7d2e04
+Revises: 249aedd25b30
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d2e04'
+down_revision: Union[str, None] = '249aedd25b30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_time_selections_user_id_timestamp', 'time_selections', ['user_id', 'timestamp', 'time_choice_id']),
+    ('ix_number_selections_user_id_timestamp', 'number_selections', ['user_id', 'timestamp', 'number_choice_id']),
+]
+
+
+def index_exists(table_name: str, index_name: str) -> bool:
+    """Проверяет существование индекса (его мог уже создать Base.metadata.create_all)"""
+    inspector = sa.inspect(op.get_bind())
+    return index_name in {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def upgrade() -> None:
+    for index_name, table_name, columns in INDEXES:
+        if not index_exists(table_name, index_name):
+            op.create_index(index_name, table_name, columns, unique=False)
+
+
+def downgrade() -> None:
+    for index_name, table_name, _ in INDEXES:
+        if index_exists(table_name, index_name):
+            op.drop_index(index_name, table_name=table_name)
@@ -0,0 +1,53 @@
+"""user choice counters
+
+Revision ID: 8b4e0d6a51c7
+Revises: 3f1c9a7d2e04
+Create Date: 2026-10-18 10:03:54.118243
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4e0d6a51c7'
+down_revision: Union[str, None] = '3f1c9a7d2e04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def table_exists(table_name: str) -> bool:
+    """Проверяет существование таблицы"""
+    return table_name in sa.inspect(op.get_bind()).get_table_names()
+
+
+def upgrade() -> None:
+    if not table_exists('user_choice_counters'):
+        op.create_table('user_choice_counters',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(), nullable=False),
+            sa.Column('choice_id', sa.Integer(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('user_id', 'kind', 'choice_id')
+        )
+
+    # Заполняем счётчики по уже накопленной истории
+    op.execute("DELETE FROM user_choice_counters")
+    op.execute(
+        "INSERT INTO user_choice_counters (user_id, kind, choice_id, count) "
+        "SELECT user_id, 'time', time_choice_id, COUNT(*) FROM time_selections "
+        "WHERE time_choice_id IS NOT NULL GROUP BY user_id, time_choice_id"
+    )
+    op.execute(
+        "INSERT INTO user_choice_counters (user_id, kind, choice_id, count) "
+        "SELECT user_id, 'numbers', number_choice_id, COUNT(*) FROM number_selections "
+        "GROUP BY user_id, number_choice_id"
+    )
+
+
+def downgrade() -> None:
+    if table_exists('user_choice_counters'):
+        op.drop_table('user_choice_counters')
@@ -0,0 +1,31 @@
+"""users tg_id bigint
+
+Revision ID: a4f2c8e61d93
+Revises: e7a3d91c4b62
+Create Date: 2026-10-18 14:20:17.553904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4f2c8e61d93'
+down_revision: Union[str, None] = 'e7a3d91c4b62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # В SQLite INTEGER и так 64-битный, менять тип нужно только в PostgreSQL
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('users', 'tg_id', type_=sa.BigInteger(), existing_type=sa.Integer(),
+                        existing_nullable=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('users', 'tg_id', type_=sa.Integer(), existing_type=sa.BigInteger(),
+                        existing_nullable=True)
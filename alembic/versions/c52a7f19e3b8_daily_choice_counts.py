@@ -0,0 +1,56 @@
+"""daily choice counts
+
+Revision ID: c52a7f19e3b8
+Revises: 8b4e0d6a51c7
+Create Date: 2026-10-18 11:20:07.553914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52a7f19e3b8'
+down_revision: Union[str, None] = '8b4e0d6a51c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def table_exists(table_name: str) -> bool:
+    """Проверяет существование таблицы"""
+    return table_name in sa.inspect(op.get_bind()).get_table_names()
+
+
+def upgrade() -> None:
+    if not table_exists('daily_choice_counts'):
+        op.create_table('daily_choice_counts',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('kind', sa.String(), nullable=False),
+            sa.Column('choice_id', sa.Integer(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('user_id', 'kind', 'day', 'choice_id')
+        )
+
+    # Заполняем дневные агрегаты по уже накопленной истории
+    op.execute("DELETE FROM daily_choice_counts")
+    op.execute(
+        "INSERT INTO daily_choice_counts (user_id, day, kind, choice_id, count) "
+        "SELECT user_id, date(timestamp), 'time', time_choice_id, COUNT(*) FROM time_selections "
+        "WHERE time_choice_id IS NOT NULL AND timestamp IS NOT NULL "
+        "GROUP BY user_id, date(timestamp), time_choice_id"
+    )
+    op.execute(
+        "INSERT INTO daily_choice_counts (user_id, day, kind, choice_id, count) "
+        "SELECT user_id, date(timestamp), 'numbers', number_choice_id, COUNT(*) FROM number_selections "
+        "WHERE timestamp IS NOT NULL "
+        "GROUP BY user_id, date(timestamp), number_choice_id"
+    )
+
+
+def downgrade() -> None:
+    if table_exists('daily_choice_counts'):
+        op.drop_table('daily_choice_counts')
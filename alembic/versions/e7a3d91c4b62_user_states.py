@@ -0,0 +1,40 @@
+"""user states
+
+Revision ID: e7a3d91c4b62
+Revises: c52a7f19e3b8
+Create Date: 2026-10-18 12:05:41.208377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3d91c4b62'
+down_revision: Union[str, None] = 'c52a7f19e3b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def table_exists(table_name: str) -> bool:
+    """Проверяет существование таблицы"""
+    return table_name in sa.inspect(op.get_bind()).get_table_names()
+
+
+def upgrade() -> None:
+    if not table_exists('user_states'):
+        op.create_table('user_states',
+            sa.Column('chat_id', sa.BigInteger(), autoincrement=False, nullable=False),
+            sa.Column('data', sa.Text(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('chat_id')
+        )
+        op.create_index(op.f('ix_user_states_expires_at'), 'user_states', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    if table_exists('user_states'):
+        op.drop_index(op.f('ix_user_states_expires_at'), table_name='user_states')
+        op.drop_table('user_states')
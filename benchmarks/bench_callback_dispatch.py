@@ -0,0 +1,90 @@
+"""
+Микробенчмарк выбора обработчика callback-запроса в TeleBot.
+
+Сравнивает прежнюю цепочку callback_query_handler(func=lambda call: call.data.startswith(...)),
+которую telebot перебирает по порядку до первого совпадения, с одним обработчиком CallbackRouter
+(разбор callback_data и поиск в словаре). Для цепочки время растёт с позицией обработчика, для маршрутизатора — нет.
+
+Запуск: python -m benchmarks.bench_callback_dispatch [--number 50000]
+"""
+import argparse
+import logging
+import timeit
+
+import telebot
+from telebot import types
+
+from utils.callback_codec import CallbackRouter, SCHEMA, encode, ACTION_TIME_RANGE, ACTION_TIME_CHOICE, \
+    ACTION_BACK, ACTION_CALENDAR_DAY, ACTION_STAT_RANGE, ACTION_STAT_TYPE, ACTION_NUMBER, ACTION_ALL_STAT, ACTION_LIST
+
+# Предикаты в порядке регистрации до перехода на кодек
+LEGACY_PREDICATES = [
+    lambda call: call.data.startswith('range_'),
+    lambda call: call.data.startswith('time_'),
+    lambda call: call.data in ['back', 'add_more'],
+    lambda call: call.data.startswith(("day_", "prev_", "next_")),
+    lambda call: call.data.startswith("stat_range_"),
+    lambda call: call.data.startswith("stat_type_"),
+    lambda call: call.data.startswith("choose_number:"),
+    lambda call: call.data.startswith("all_stat_"),
+    lambda call: call.data.startswith("list_"),
+]
+
+# Нажатия от первого обработчика цепочки к последнему: (старые данные, новые данные)
+SAMPLES = [
+    ('range_3', encode(ACTION_TIME_RANGE, 3)),
+    ('time_3_40', encode(ACTION_TIME_CHOICE, 3, 40)),
+    ('back', encode(ACTION_BACK)),
+    ('day_17', encode(ACTION_CALENDAR_DAY, 17)),
+    ('stat_range_this_week', encode(ACTION_STAT_RANGE, 'this_week')),
+    ('stat_type_numbers', encode(ACTION_STAT_TYPE, 'numbers')),
+    ('choose_number:12', encode(ACTION_NUMBER, 12)),
+    ('all_stat_time', encode(ACTION_ALL_STAT, 'time')),
+    ('list_numbers', encode(ACTION_LIST, 'numbers')),
+]
+
+
+def make_call(data: str) -> types.CallbackQuery:
+    return types.CallbackQuery.de_json({'id': '1', 'chat_instance': 'bench', 'data': data,
+                                        'from': {'id': 1, 'is_bot': False, 'first_name': 'bench'}})
+
+
+def build_legacy_bot() -> telebot.TeleBot:
+    bot = telebot.TeleBot('1:bench', threaded=False)
+    for predicate in LEGACY_PREDICATES:
+        bot.register_callback_query_handler(lambda call: None, func=predicate)
+    return bot
+
+
+def build_router_bot() -> telebot.TeleBot:
+    bot = telebot.TeleBot('1:bench', threaded=False)
+    router = CallbackRouter()
+    for action in SCHEMA:
+        router.route(action)(lambda call, *args: None)
+    router.attach(bot)
+    return bot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=50000)
+    args = parser.parse_args()
+
+    logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
+    logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.WARNING)
+
+    legacy_bot, router_bot = build_legacy_bot(), build_router_bot()
+
+    def measure(bot, call):
+        return timeit.timeit(lambda: bot._notify_command_handlers(bot.callback_query_handlers, [call], 'callback_query'),
+                             number=args.number) / args.number
+
+    print(f"{'кнопка':<22}{'предикаты, мкс':>16}{'словарь, мкс':>14}")
+    for legacy_data, data in SAMPLES:
+        legacy = measure(legacy_bot, make_call(legacy_data))
+        current = measure(router_bot, make_call(data))
+        print(f"{legacy_data:<22}{legacy * 1e6:>16.2f}{current * 1e6:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Бенчмарк часто выполняемых запросов: построение выражения на каждый вызов против собранных
+один раз запросов из db_helpers.queries.
+
+Для каждого запроса три варианта, все выполняются на соединении сессии (session.connection()),
+так что разница — только в построении и кэшировании выражения, а не в пути выполнения:
+  каждый раз — select(...) собирается заново при каждом вызове, как было в users.py и stat_utils.py;
+  lambda     — тот же запрос через lambda_stmt (кэш по коду лямбды);
+  собранный  — запрос с bindparam из db_helpers.queries.
+
+«Статистика за неделю» — запрос range_counts, которым stat_utils строит статистику за промежуток
+(целые дни из daily_choice_counts и сырые выборы крайних дней, UNION ALL); для сравнения
+отдельно показан подсчёт по сырым выборам (choice_counts).
+
+Запуск: python -m benchmarks.bench_hot_queries [--users 100] [--per-user 200] [--repeat 2000]
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, time as day_time, timedelta
+
+from sqlalchemy import create_engine, func, lambda_stmt, select
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_stat_indexes import fill_database
+from db_helpers.models import Base, User, TimeSelection, TimeChoice, UserChoiceCounter
+from db_helpers.queries import all_time_counts, choice_counts, range_counts, user_id_by_tg_id, _range_counts_stmt
+from db_helpers.selections import backfill_choice_counters, backfill_daily_counts
+
+
+def fresh_user_id(session, tg_id, start_date):
+    return session.connection().execute(select(User.id).where(User.tg_id == tg_id)).scalar()
+
+
+def lambda_user_id(session, tg_id, start_date):
+    return session.connection().execute(lambda_stmt(lambda: select(User.id).where(User.tg_id == tg_id))).scalar()
+
+
+def prebuilt_user_id(session, tg_id, start_date):
+    return user_id_by_tg_id(session, tg_id)
+
+
+def _all_time_stmt(user_id):
+    return (select(TimeChoice.choice, UserChoiceCounter.count, TimeChoice.interpretation)
+            .select_from(UserChoiceCounter)
+            .join(TimeChoice, UserChoiceCounter.choice_id == TimeChoice.id)
+            .where(UserChoiceCounter.user_id == user_id,
+                   UserChoiceCounter.kind == 'time',
+                   UserChoiceCounter.count > 0)
+            .order_by(UserChoiceCounter.count.desc(), TimeChoice.choice))
+
+
+def fresh_all_time(session, user_id, start_date):
+    return [(row[0], row[1], row[2]) for row in session.connection().execute(_all_time_stmt(user_id))]
+
+
+def lambda_all_time(session, user_id, start_date):
+    stmt = lambda_stmt(lambda: select(TimeChoice.choice, UserChoiceCounter.count, TimeChoice.interpretation)
+                       .select_from(UserChoiceCounter)
+                       .join(TimeChoice, UserChoiceCounter.choice_id == TimeChoice.id)
+                       .where(UserChoiceCounter.user_id == user_id,
+                              UserChoiceCounter.kind == 'time',
+                              UserChoiceCounter.count > 0)
+                       .order_by(UserChoiceCounter.count.desc(), TimeChoice.choice))
+    return [(row[0], row[1], row[2]) for row in session.connection().execute(stmt)]
+
+
+def prebuilt_all_time(session, user_id, start_date):
+    return all_time_counts(session, user_id, 'time')
+
+
+def _choice_counts_stmt(user_id, start_date):
+    count = func.count().label("count")
+    return (select(TimeChoice.choice, count, TimeChoice.interpretation)
+            .select_from(TimeSelection)
+            .join(TimeChoice, TimeSelection.time_choice_id == TimeChoice.id)
+            .where(TimeSelection.user_id == user_id, TimeSelection.timestamp >= start_date)
+            .group_by(TimeChoice.id, TimeChoice.choice, TimeChoice.interpretation)
+            .order_by(count.desc(), TimeChoice.choice))
+
+
+def fresh_choice_counts(session, user_id, start_date):
+    return [(row[0], row[1], row[2]) for row in session.connection().execute(_choice_counts_stmt(user_id, start_date))]
+
+
+def lambda_choice_counts(session, user_id, start_date):
+    count = func.count().label("count")
+    stmt = lambda_stmt(lambda: select(TimeChoice.choice, count, TimeChoice.interpretation)
+                       .select_from(TimeSelection)
+                       .join(TimeChoice, TimeSelection.time_choice_id == TimeChoice.id)
+                       .where(TimeSelection.user_id == user_id, TimeSelection.timestamp >= start_date)
+                       .group_by(TimeChoice.id, TimeChoice.choice, TimeChoice.interpretation)
+                       .order_by(count.desc(), TimeChoice.choice))
+    return [(row[0], row[1], row[2]) for row in session.connection().execute(stmt)]
+
+
+def prebuilt_choice_counts(session, user_id, start_date):
+    return choice_counts(session, user_id, 'time', start_date)
+
+
+def _week(start_date):
+    """
+    Параметры range_counts за неделю от start_date, как их считает aggregate_range_counts:
+    промежуток начинается и кончается не в полночь, поэтому крайние дни неполные.
+    """
+    end_date = start_date + timedelta(days=7)
+    first_day = start_date.date() + timedelta(days=1)
+    last_day = end_date.date() - timedelta(days=1)
+    head = (start_date, datetime.combine(first_day, day_time.min))
+    tail = (datetime.combine(last_day + timedelta(days=1), day_time.min), end_date)
+    return first_day, last_day, head, tail
+
+
+def _range_params(user_id, start_date):
+    first_day, last_day, head, tail = _week(start_date)
+    return {'user_id': user_id, 'first_day': first_day, 'last_day': last_day,
+            'head_start': head[0], 'head_end': head[1], 'tail_start': tail[0], 'tail_end': tail[1]}
+
+
+def fresh_range_counts(session, user_id, start_date):
+    # Тот же запрос, что в db_helpers.queries, но без lru_cache: выражение собирается на каждый вызов
+    stmt = _range_counts_stmt.__wrapped__('time')
+    rows = session.connection().execute(stmt, _range_params(user_id, start_date))
+    return [(row[0], int(row[1]), row[2]) for row in rows]
+
+
+def lambda_range_counts(session, user_id, start_date):
+    stmt = lambda_stmt(lambda: _range_counts_stmt.__wrapped__('time'))
+    rows = session.connection().execute(stmt, _range_params(user_id, start_date))
+    return [(row[0], int(row[1]), row[2]) for row in rows]
+
+
+def prebuilt_range_counts(session, user_id, start_date):
+    return range_counts(session, user_id, 'time', *_week(start_date))
+
+
+QUERIES = (
+    ("пользователь по tg_id", (fresh_user_id, lambda_user_id, prebuilt_user_id)),
+    ("статистика за всё время", (fresh_all_time, lambda_all_time, prebuilt_all_time)),
+    ("статистика за неделю", (fresh_range_counts, lambda_range_counts, prebuilt_range_counts)),
+    ("сырые выборы за неделю", (fresh_choice_counts, lambda_choice_counts, prebuilt_choice_counts)),
+)
+
+
+def measure(session_factory, query, users: int, repeat: int) -> float:
+    """Возвращает среднее время вызова в микросекундах."""
+    start_date = datetime.now() - timedelta(days=7)
+    keys = [random.randint(1, users) for _ in range(repeat)]
+    with session_factory() as session:
+        # Прогрев: компиляция и кэш запросов
+        for key in keys[:50]:
+            query(session, key, start_date)
+        started = time.perf_counter()
+        for key in keys:
+            query(session, key, start_date)
+        return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--per-user', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
+    logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.WARNING)
+    logging.getLogger('db_helpers').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        session_factory = sessionmaker(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        with session_factory() as session:
+            fill_database(session, args.users, args.per_user)
+            backfill_choice_counters(session)
+            backfill_daily_counts(session)
+            session.commit()
+
+        print(f"{'запрос':<26}{'каждый раз':>12}{'lambda':>10}{'собранный':>12}  мкс на вызов")
+        for label, variants in QUERIES:
+            timings = [measure(session_factory, query, args.users, args.repeat) for query in variants]
+            print(f"{label:<26}{timings[0]:12.1f}{timings[1]:10.1f}{timings[2]:12.1f}")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
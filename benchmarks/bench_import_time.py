@@ -0,0 +1,88 @@
+"""
+Бенчмарк времени импорта: python -X importtime для модуля запуска бота.
+
+Запускает импорт в отдельном процессе несколько раз (в пустом временном каталоге, чтобы импорт,
+создающий файлы, был заметен), печатает медиану и самые дорогие модули по накопленному времени.
+С --history результат дописывается строкой JSON в файл истории и сравнивается с предыдущей записью —
+так время холодного старта можно отслеживать от релиза к релизу.
+
+Запуск: python -m benchmarks.bench_import_time [--module bot] [--runs 5] [--top 15] [--history FILE]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module: str, cwd: str):
+    """Возвращает {модуль: накопленное время импорта в мкс} для одного запуска."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        # Модуль может встретиться несколько раз (вложенные пакеты), берём самый дорогой
+        times[name] = max(times.get(name, 0), int(cumulative))
+    return times
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='bot')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--history', help="Файл истории (JSON Lines) для сравнения между релизами")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Первый запуск прогревает .pyc и в замер не идёт
+        import_times(args.module, tmp_dir)
+        runs = [import_times(args.module, tmp_dir) for _ in range(args.runs)]
+        created = sorted(os.listdir(tmp_dir))
+
+    total_ms = statistics.median(run[args.module] for run in runs) / 1000
+    print(f"import {args.module}: медиана {total_ms:.1f} мс за {args.runs} запусков")
+    if created:
+        print(f"  при импорте созданы файлы: {', '.join(created)}")
+
+    medians = {name: statistics.median(run.get(name, 0) for run in runs) for name in runs[0]}
+    print("  самые дорогие модули (накопленное время, мс):")
+    for name, cumulative in sorted(medians.items(), key=lambda item: -item[1])[1:args.top + 1]:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+
+    if args.history:
+        previous = None
+        if os.path.exists(args.history):
+            with open(args.history, encoding='utf-8') as history:
+                lines = [line for line in history if line.strip()]
+            if lines:
+                previous = json.loads(lines[-1])
+        record = {'date': datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(),
+                  'module': args.module, 'median_ms': round(total_ms, 1)}
+        with open(args.history, 'a', encoding='utf-8') as history:
+            history.write(json.dumps(record, ensure_ascii=False) + '\n')
+        if previous and previous.get('module') == args.module:
+            print(f"  предыдущий замер ({previous['revision'] or previous['date']}): {previous['median_ms']} мс, "
+                  f"изменение {total_ms - previous['median_ms']:+.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
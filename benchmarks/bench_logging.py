@@ -0,0 +1,131 @@
+"""
+Бенчмарк стоимости логирования на одно обновление.
+
+Обновление имитируется несколькими строками лога, как в обработчике нажатия: прежде это были
+строки INFO с f-строками, которые FileHandler и StreamHandler писали прямо в потоке обработки,
+теперь — строки DEBUG с %-форматированием (при уровне INFO не форматируются) и очередь,
+которую разбирает фоновый поток. С --stall-ms запись в файл раз в --stall-every записей
+«зависает» — так видно, что при медленном диске задерживается лог, а не обработка.
+
+Запуск: python -m benchmarks.bench_logging [--updates 20000] [--lines 6] [--stall-ms 0] [--stall-every 500]
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from utils.log_pipeline import DroppingQueueHandler, configure_logging, log_pipeline_stats, shutdown_logging
+
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class StallingFileHandler(logging.FileHandler):
+    """FileHandler, у которого каждая stall_every-я запись ждёт stall_ms (зависание диска)."""
+
+    def __init__(self, filename: str, stall_ms: float, stall_every: int):
+        super().__init__(filename, encoding='utf-8')
+        self.stall = stall_ms / 1000
+        self.stall_every = stall_every
+        self.emitted = 0
+
+    def emit(self, record: logging.LogRecord):
+        self.emitted += 1
+        if self.stall and self.emitted % self.stall_every == 0:
+            time.sleep(self.stall)
+        super().emit(record)
+
+
+def make_handlers(directory: str, name: str, args) -> list:
+    handlers = [StallingFileHandler(os.path.join(directory, name), args.stall_ms, args.stall_every),
+                logging.StreamHandler(open(os.devnull, 'w'))]
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(FORMAT))
+    return handlers
+
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def legacy_update(logger: logging.Logger, user_id: int, lines: int):
+    data = f"c1:tc:3:{user_id % 60}"
+    for i in range(lines):
+        logger.info(f"Пользователь {user_id} нажал {data}, шаг {i}: выбрано {user_id % 7} из {lines}")
+
+
+def queued_update(logger: logging.Logger, user_id: int, lines: int):
+    data = f"c1:tc:3:{user_id % 60}"
+    for i in range(lines):
+        logger.debug("Пользователь %s нажал %s, шаг %s: выбрано %s из %s", user_id, data, i, user_id % 7, lines)
+
+
+def measure(update, logger: logging.Logger, args) -> list:
+    durations = []
+    for user_id in range(args.updates):
+        started = time.perf_counter()
+        update(logger, user_id, args.lines)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def report(label: str, durations: list):
+    durations = sorted(durations)
+    p99 = durations[int(len(durations) * 0.99)]
+    print(f"{label:<44} среднее {statistics.mean(durations) * 1e6:8.1f} мкс, "
+          f"p99 {p99 * 1e6:8.1f} мкс, максимум {durations[-1] * 1e3:8.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--lines', type=int, default=6, help="Строк лога на обновление")
+    parser.add_argument('--stall-ms', type=float, default=0, help="Задержка записи в файл при «зависании» диска")
+    parser.add_argument('--stall-every', type=int, default=500, help="Как часто файл «зависает» (в записях)")
+    args = parser.parse_args()
+
+    logger = logging.getLogger('bench.handlers')
+    print(f"{args.updates} обновлений по {args.lines} строк лога, зависание диска {args.stall_ms} мс "
+          f"на каждую {args.stall_every}-ю запись")
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Было: синхронные FileHandler и StreamHandler, строки INFO с f-строками
+        reset_root()
+        root = logging.getLogger()
+        root.setLevel(logging.INFO)
+        for handler in make_handlers(directory, 'legacy.log', args):
+            root.addHandler(handler)
+        report("синхронно, INFO f-строки", measure(legacy_update, logger, args))
+        reset_root()
+
+        # Те же строки INFO, но через очередь: запись на диск уходит из потока обработки
+        configure_logging(logging.INFO, make_handlers(directory, 'queued_info.log', args))
+        report("очередь, INFO f-строки", measure(legacy_update, logger, args))
+        print(f"{'':<44} {log_pipeline_stats()}")
+        shutdown_logging()
+
+        # Стало: очередь и строки DEBUG с %-форматированием при уровне INFO
+        configure_logging(logging.INFO, make_handlers(directory, 'queued.log', args))
+        report("очередь, DEBUG %-форматирование (уровень INFO)", measure(queued_update, logger, args))
+        shutdown_logging()
+
+        # Выборочная отладка: в лог попадает 1% строк DEBUG
+        configure_logging(logging.DEBUG, make_handlers(directory, 'sampled.log', args), debug_sample_rate=0.01)
+        report("очередь, DEBUG с выборкой 1%", measure(queued_update, logger, args))
+        shutdown_logging()
+
+        # Переполнение: очередь на 100 записей при зависшем диске не блокирует обработку
+        configure_logging(logging.INFO, make_handlers(directory, 'small_queue.log', args), queue_size=100)
+        report("очередь на 100 записей, INFO f-строки", measure(legacy_update, logger, args))
+        dropped = next(handler.dropped for handler in logging.getLogger().handlers
+                       if isinstance(handler, DroppingQueueHandler))
+        print(f"{'':<44} отброшено записей: {dropped}")
+        shutdown_logging()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Микробенчмарк разбиения длинных HTML-сообщений.
+
+Сравнивает прежний посимвольный split_long_message (сохранён здесь как legacy_split_long_message)
+с iter_message_chunks на полном тексте /list (времена и числа из data_interpretations),
+а также на том же тексте, повторённом несколько раз, чтобы было видно, как растёт время.
+Перед замером проверяет граничные случаи: ни одна часть не длиннее лимита и не состоит из одних тегов.
+
+Запуск: python -m benchmarks.bench_message_split [--repeat 20] [--scale 1 4 16]
+"""
+import argparse
+import logging
+import re
+import timeit
+
+from data_interpretations.numbers_interpretations import numbers_interpretations
+from data_interpretations.time_interpretations import time_interpretations
+from db_helpers.catalog import InterpretationCatalog, TimeRangeItem, TimeChoiceItem, NumberChoiceItem
+from utils.message_utils import build_interpretation_list, split_long_message
+
+
+def legacy_split_long_message(text: str, parse_mode=None):
+    """Реализация split_long_message до перехода на токенизатор (квадратичная сборка строки)."""
+    max_length = 4096
+
+    if parse_mode != 'HTML' or len(text) <= max_length:
+        return [text[i:i + max_length] for i in range(0, len(text), max_length)]
+
+    parts = []
+    current_part = ""
+    open_tags = []
+
+    i = 0
+    while i < len(text):
+        if text[i:i + 1] == '<' and i + 1 < len(text) and text[i + 1:i + 2] != '/':
+            tag_end = text.find('>', i)
+            if tag_end != -1:
+                tag_content = text[i + 1:tag_end]
+                tag_name = tag_content.split()[0]
+                if tag_name in ['b', 'i', 'u', 'a', 'code', 'pre', 'strong', 'em']:
+                    open_tags.append(tag_name)
+
+        elif text[i:i + 2] == '</' and i + 2 < len(text):
+            tag_end = text.find('>', i)
+            if tag_end != -1:
+                tag_name = text[i + 2:tag_end]
+                if open_tags and open_tags[-1] == tag_name:
+                    open_tags.pop()
+
+        current_part += text[i]
+        i += 1
+
+        if len(current_part) >= max_length - 100 or i == len(text):
+            for tag in reversed(open_tags):
+                current_part += f"</{tag}>"
+
+            parts.append(current_part)
+
+            if i < len(text):
+                current_part = ""
+                for tag in open_tags:
+                    current_part += f"<{tag}>"
+
+    return parts
+
+
+def build_catalog() -> InterpretationCatalog:
+    """Каталог из исходных словарей трактовок, без базы данных."""
+    time_ranges, time_choices = [], []
+    for range_id, (name, data) in enumerate(time_interpretations.items(), start=1):
+        time_ranges.append(TimeRangeItem(range_id, name, data['time_range']))
+        for choice, interpretation in data['interpretations'].items():
+            time_choices.append(TimeChoiceItem(len(time_choices) + 1, choice, interpretation, range_id))
+    number_choices = [NumberChoiceItem(i, number, interpretation)
+                      for i, (number, interpretation) in enumerate(numbers_interpretations.items(), start=1)]
+    return InterpretationCatalog(time_ranges, time_choices, number_choices, version=0)
+
+
+# Граничные случаи: слово длиннее части сразу после открывающего тега, вложенные теги, тег после текста
+EDGE_CASES = [
+    '<b>' + 'x' * 5000 + '</b>',
+    'начало <b>' + 'x' * 5000 + '</b>',
+    '<b><i>' + 'y' * 9000 + '</i></b>',
+    'a ' * 3000 + '<b>' + 'z' * 4000 + '</b>',
+    '<a href="https://t.me">' + 'q' * 8200 + '</a>',
+]
+
+
+def check_edge_cases():
+    for text in EDGE_CASES:
+        for part in split_long_message(text, 'HTML'):
+            assert len(part) <= 4096, f"Часть длиннее лимита: {len(part)}"
+            assert re.sub(r'<[^<>]*>', '', part).strip(), f"Часть без текста: {part[:50]}"
+    print(f"Граничные случаи: {len(EDGE_CASES)} проверок пройдено")
+
+
+def describe(parts) -> str:
+    return f"{len(parts)} частей, длины {[len(part) for part in parts]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 4, 16],
+                        help='Во сколько раз повторить полный текст /list')
+    args = parser.parse_args()
+
+    logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
+    logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.WARNING)
+
+    check_edge_cases()
+
+    catalog = build_catalog()
+    full_text = "\n\n".join(build_interpretation_list(catalog, list_type) for list_type in ("time", "numbers"))
+
+    for scale in args.scale:
+        text = "\n\n".join([full_text] * scale)
+        legacy = timeit.timeit(lambda: legacy_split_long_message(text, 'HTML'), number=args.repeat) / args.repeat
+        current = timeit.timeit(lambda: split_long_message(text, 'HTML'), number=args.repeat) / args.repeat
+
+        print(f"Текст x{scale}: {len(text)} символов")
+        print(f"  прежний:    {legacy * 1000:8.2f} мс, {describe(legacy_split_long_message(text, 'HTML'))}")
+        print(f"  токенизатор:{current * 1000:8.2f} мс, {describe(split_long_message(text, 'HTML'))}")
+        print(f"  ускорение:  {legacy / current:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Бенчмарк записи выборов пользователей.
+
+Сравнивает прежнюю запись — по транзакции с коммитом на каждое нажатие (save_user_selection) —
+с отложенной записью SelectionWriter, которая собирает выборы в многострочные пакеты.
+Нажатия поступают из нескольких потоков, как из дорожек диспетчера обновлений.
+
+Запуск: python -m benchmarks.bench_selection_writes [--events 5000] [--threads 4] [--users 100]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from db_helpers.models import Base, TimeSelection, NumberSelection
+from db_helpers.selection_writer import SelectionWriter
+from db_helpers.selections import KIND_TIME, KIND_NUMBERS, increment_choice_counters, increment_daily_counts
+from db_helpers.users import get_or_create_user_id
+
+
+def save_user_selection(session: Session, tg_id: int, username: Optional[str], kind: str, choice_id: int) -> int:
+    """
+    Прежняя запись выбора, до SelectionWriter: пользователь, выбор, счётчик и дневной агрегат
+    по одной строке и коммит на каждое нажатие. Осталась только для сравнения в бенчмарках.
+
+    :param session: Сессия SQLAlchemy
+    :param tg_id: Telegram ID пользователя
+    :param username: Имя пользователя в Telegram
+    :param kind: Вид выбора ('time' или 'numbers')
+    :param choice_id: ID записи справочника
+    :return: ID пользователя в таблице users
+    """
+    user_id = get_or_create_user_id(session, tg_id, username)
+    timestamp = datetime.now()
+    if kind == KIND_TIME:
+        session.add(TimeSelection(id=uuid.uuid4(), time_choice_id=choice_id, user_id=user_id, timestamp=timestamp))
+    else:
+        session.add(NumberSelection(id=uuid.uuid4(), number_choice_id=choice_id, user_id=user_id,
+                                    timestamp=timestamp))
+    increment_choice_counters(session, {(user_id, kind, choice_id): 1})
+    increment_daily_counts(session, {(user_id, timestamp.date(), kind, choice_id): 1})
+    session.commit()
+    return user_id
+
+
+def make_events(count: int, users: int):
+    return [(i % users + 1, f"bench_{i % users}", KIND_TIME if i % 2 else KIND_NUMBERS, i % 20 + 1)
+            for i in range(count)]
+
+
+def run_threads(events, threads: int, submit) -> float:
+    """Раздаёт нажатия потокам и возвращает время до последнего принятого нажатия."""
+    def worker(part):
+        for event in part:
+            submit(*event)
+
+    workers = [threading.Thread(target=worker, args=(events[i::threads],)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def count_selections(session_factory) -> int:
+    with session_factory() as session:
+        return sum(session.scalar(select(func.count()).select_from(model))
+                   for model in (TimeSelection, NumberSelection))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--batch', type=int, default=200)
+    args = parser.parse_args()
+
+    logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
+    logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.WARNING)
+    logging.getLogger('db_helpers.users').setLevel(logging.WARNING)
+
+    events = make_events(args.events, args.users)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for number, label in enumerate(("коммит на выбор", "пакетная запись")):
+            engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, f'bench_{number}.db')}")
+            session_factory = sessionmaker(bind=engine)
+            Base.metadata.create_all(bind=engine)
+
+            if label == "коммит на выбор":
+                def submit(tg_id, username, kind, choice_id):
+                    with session_factory() as session:
+                        save_user_selection(session, tg_id, username, kind, choice_id)
+
+                accepted = total = run_threads(events, args.threads, submit)
+                stats = ''
+            else:
+                writer = SelectionWriter(session_factory, max_batch=args.batch)
+                writer.start()
+                accepted = run_threads(events, args.threads, writer.submit)
+                started = time.perf_counter()
+                writer.flush()
+                total = accepted + time.perf_counter() - started
+                writer.stop()
+                stats = f", пакетов: {writer.stats()['batches']}"
+
+            written = count_selections(session_factory)
+            engine.dispose()
+            print(f"{label:<18} нажатие: {accepted / args.events * 1e6:8.1f} мкс, "
+                  f"до записи всех: {total:6.2f} с ({written / total:8.0f} выборов/с), записано: {written}{stats}")
+
+
+if __name__ == '__main__':
+    main()
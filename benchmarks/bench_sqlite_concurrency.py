@@ -0,0 +1,127 @@
+"""
+Бенчмарк конкурентного доступа к SQLite: настройки по умолчанию против профиля из db_helpers.engines.
+
+По умолчанию — журнал отката и общий пул для чтения и записи: читатели ждут писателя, а писатели
+друг друга и получают «database is locked». Профиль — WAL, synchronous=NORMAL,
+единственное пишущее соединение и пул читающих.
+
+Писатели сохраняют выборы по одному (save_user_selection с коммитом), читатели строят статистику
+за неделю. Каждая конфигурация работает --seconds секунд на своей копии базы.
+
+Запуск: python -m benchmarks.bench_sqlite_concurrency [--writers 4] [--readers 4] [--seconds 5] [--dir .]
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_selection_writes import save_user_selection
+from benchmarks.bench_stat_indexes import fill_database
+from db_helpers.engines import create_sqlite_engines, sqlite_pragmas
+from db_helpers.models import Base
+from db_helpers.selections import KIND_TIME
+from db_helpers.users import user_id_cache
+from utils.stat_utils import aggregate_range_counts
+
+
+def run_workload(write_factory, read_factory, writers: int, readers: int, seconds: float, users: int):
+    """Возвращает число операций, ошибок и задержки чтения для каждой стороны."""
+    stop_at = time.monotonic() + seconds
+    results = {'writes': 0, 'write_errors': 0, 'reads': 0, 'read_errors': 0, 'read_latencies': []}
+    lock = threading.Lock()
+
+    def writer():
+        while time.monotonic() < stop_at:
+            tg_id = random.randint(1, users)
+            try:
+                with write_factory() as session:
+                    save_user_selection(session, tg_id, f"bench_{tg_id - 1}", KIND_TIME, random.randint(1, 24))
+                key = 'writes'
+            except Exception:
+                key = 'write_errors'
+            with lock:
+                results[key] += 1
+
+    def reader():
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=7)
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                with read_factory() as session:
+                    aggregate_range_counts(session, random.randint(1, users), 'time', start_date, end_date)
+                key = 'reads'
+            except Exception:
+                key = 'read_errors'
+            elapsed = time.perf_counter() - started
+            with lock:
+                results[key] += 1
+                results['read_latencies'].append(elapsed)
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--per-user', type=int, default=200)
+    parser.add_argument('--dir', help="Каталог для баз (по умолчанию временный; tmpfs скрывает стоимость fsync)")
+    args = parser.parse_args()
+
+    logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
+    logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.WARNING)
+    logging.getLogger('db_helpers').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp_dir:
+        for number, label in enumerate(("по умолчанию", "профиль WAL")):
+            uri = f"sqlite:///{os.path.join(tmp_dir, f'bench_{number}.db')}"
+            if label == "по умолчанию":
+                # Как было в models.py: движок без настроек, журнал отката
+                engine = create_engine(uri)
+                write_engine = read_engine = engine
+            else:
+                write_engine, read_engine = create_sqlite_engines(uri, sqlite_pragmas(),
+                                                                  read_pool_size=args.readers)
+
+            Base.metadata.create_all(bind=write_engine)
+            with sessionmaker(bind=write_engine)() as session:
+                fill_database(session, args.users, args.per_user)
+
+            user_id_cache.clear()
+            results = run_workload(sessionmaker(bind=write_engine), sessionmaker(bind=read_engine),
+                                   args.writers, args.readers, args.seconds, args.users)
+            write_engine.dispose()
+            read_engine.dispose()
+
+            latencies = results['read_latencies']
+            print(f"=== {label} ===")
+            print(f"  запись: {results['writes'] / args.seconds:8.0f} оп/с, ошибок: {results['write_errors']}")
+            print(f"  чтение: {results['reads'] / args.seconds:8.0f} оп/с, ошибок: {results['read_errors']}, "
+                  f"p50 {percentile(latencies, 0.5) * 1000:.1f} мс, p99 {percentile(latencies, 0.99) * 1000:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
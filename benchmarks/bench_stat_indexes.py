@@ -0,0 +1,137 @@
+"""
+Бенчмарк составных индексов (user_id, timestamp, *_choice_id) на таблицах выборов.
+
+Создаёт временную SQLite-базу, заполняет её выборами, показывает план запроса
+статистики за промежуток и время его выполнения без индексов и с ними.
+
+Запуск: python -m benchmarks.bench_stat_indexes [--users 200] [--per-user 500]
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from db_helpers.models import Base, User, TimeRange, TimeChoice, NumberChoice, TimeSelection, NumberSelection
+from db_helpers.queries import choice_counts
+
+COMPOSITE_INDEXES = {
+    'time_selections': 'ix_time_selections_user_id_timestamp',
+    'number_selections': 'ix_number_selections_user_id_timestamp',
+}
+
+
+def fill_database(session, users: int, per_user: int):
+    time_range = TimeRange(name='bench', time_range='00:00 - 23:59')
+    session.add(time_range)
+    session.flush()
+    time_choices = [TimeChoice(choice=f"{h:02d}:{h:02d}", interpretation='-', time_range_id=time_range.id)
+                    for h in range(24)]
+    number_choices = [NumberChoice(number=n, interpretation='-') for n in range(20)]
+    session.add_all(time_choices + number_choices)
+    session.flush()
+
+    now = datetime.now()
+    time_rows, number_rows = [], []
+    for i in range(users):
+        user = User(username=f"bench_{i}", tg_id=i + 1)
+        session.add(user)
+        session.flush()
+        for _ in range(per_user):
+            timestamp = now - timedelta(minutes=random.randint(0, 60 * 24 * 365))
+            time_rows.append({'id': uuid.uuid4(), 'user_id': user.id, 'timestamp': timestamp,
+                              'time_choice_id': random.choice(time_choices).id})
+            number_rows.append({'id': uuid.uuid4(), 'user_id': user.id, 'timestamp': timestamp,
+                                'number_choice_id': random.choice(number_choices).id})
+    session.bulk_insert_mappings(TimeSelection, time_rows)
+    session.bulk_insert_mappings(NumberSelection, number_rows)
+    session.commit()
+
+
+def explain(engine, session_factory, stat_type: str, start_date, end_date):
+    """Возвращает план запроса choice_counts для SQLite."""
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        with session_factory() as session:
+            choice_counts(session, 1, stat_type, start_date, end_date)
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    statement, parameters = captured[-1]
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def measure(session_factory, stat_type: str, start_date, end_date, users: int, repeats: int) -> float:
+    started = time.perf_counter()
+    with session_factory() as session:
+        for i in range(repeats):
+            choice_counts(session, i % users + 1, stat_type, start_date, end_date)
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--per-user', type=int, default=500)
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    # DevConfig включает логирование SQL — для замеров оно только мешает
+    logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
+    logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        session_factory = sessionmaker(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            for index_name in COMPOSITE_INDEXES.values():
+                conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+        with session_factory() as session:
+            fill_database(session, args.users, args.per_user)
+        print(f"Выборов: {args.users * args.per_user} на каждую таблицу, пользователей: {args.users}")
+
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=7)
+
+        results = {}
+        for label in ("без индекса", "с индексом"):
+            if label == "с индексом":
+                for table in (TimeSelection.__table__, NumberSelection.__table__):
+                    for index in table.indexes:
+                        if index.name == COMPOSITE_INDEXES[table.name]:
+                            index.create(bind=engine)
+                with engine.begin() as conn:
+                    conn.execute(text("ANALYZE"))
+
+            print(f"\n=== {label} ===")
+            for stat_type in ("time", "numbers"):
+                plan = explain(engine, session_factory, stat_type, start_date, end_date)
+                elapsed = measure(session_factory, stat_type, start_date, end_date, args.users, args.repeats)
+                results[(label, stat_type)] = elapsed
+                print(f"[{stat_type}] {elapsed:.3f} мс/запрос")
+                for line in plan:
+                    print(f"    {line}")
+
+        print()
+        for stat_type in ("time", "numbers"):
+            before, after = results[("без индекса", stat_type)], results[("с индексом", stat_type)]
+            print(f"{stat_type}: ускорение x{before / after:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Локальная проверка режима вебхука без Telegram.
+
+Поднимает фейковый Bot API (отвечает ok на любой метод, с настраиваемой задержкой и, по желанию,
+случайными 429 Too Many Requests), запускает в процессе бота с UpdateDispatcher, OutboundSender и WebhookServer, нагружает вебхук POST-запросами
+с обновлениями из нескольких потоков, затем штатно останавливает сервер и печатает
+пропускную способность, число отказов 503, нарушения порядка обновлений внутри
+пользователя и метрики дорожек.
+
+Запуск: python -m benchmarks.fake_telegram [--updates 2000] [--clients 16] [--lanes 4]
+                                           [--lane-size 100] [--api-latency-ms 20] [--flood-probability 0.05]
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import telebot
+from telebot import apihelper
+
+from config import Config
+from db_helpers.catalog import reload_catalog
+from db_helpers.models import init_db
+from handlers.callback_handlers import register_callback_handlers
+from handlers.command_handlers import register_command_handlers
+from utils.dispatcher import UpdateDispatcher, update_user_id
+from utils.outbound import OutboundSender
+from utils.webhook import WebhookServer, ThreadedHTTPServer
+
+SECRET_TOKEN = 'fake-secret'
+
+
+class FakeBotApi:
+    """Минимальный Bot API: считает вызовы и отвечает правдоподобными результатами."""
+
+    def __init__(self, latency: float, flood_probability: float = 0.0):
+        self.latency = latency
+        self.flood_probability = flood_probability
+        self.calls = 0
+        self.floods = 0
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self._httpd = ThreadedHTTPServer(('127.0.0.1', 0), self._make_handler())
+
+    @property
+    def api_url(self) -> str:
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def _result(self, method: str, params: dict):
+        if method in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            with self._lock:
+                self._message_id += 1
+                message_id = self._message_id
+            return {'message_id': message_id, 'date': int(time.time()),
+                    'chat': {'id': int(params.get('chat_id', 1)), 'type': 'private'},
+                    'text': params.get('text', '')}
+        if method == 'getChatMember':
+            return {'status': 'member', 'user': {'id': 1, 'is_bot': False, 'first_name': 'fake'}}
+        return True
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit('/', 1)[-1]
+                length = int(self.headers.get('Content-Length', 0))
+                query = parse_qs(url.query)
+                query.update(parse_qs(self.rfile.read(length).decode()))
+                params = {key: values[0] for key, values in query.items()}
+
+                with api._lock:
+                    api.calls += 1
+                    flood = random.random() < api.flood_probability
+                    if flood:
+                        api.floods += 1
+                if api.latency:
+                    time.sleep(api.latency)
+
+                if flood:
+                    status = 429
+                    body = json.dumps({'ok': False, 'error_code': 429, 'parameters': {'retry_after': 1},
+                                       'description': 'Too Many Requests: retry after 1'}).encode()
+                else:
+                    status = 200
+                    body = json.dumps({'ok': True, 'result': api._result(method, params)}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def make_update(update_id: int, user_id: int, text: str) -> bytes:
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}] if text.startswith('/') else []
+    return json.dumps({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text, 'entities': entities,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'load', 'username': f'load_{user_id}'},
+        },
+    }).encode()
+
+
+def post_update(url: str, payload: bytes):
+    request = urllib.request.Request(url, data=payload, method='POST', headers={
+        'Content-Type': 'application/json',
+        'X-Telegram-Bot-Api-Secret-Token': SECRET_TOKEN,
+    })
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=16, help='Параллельных отправителей обновлений')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--lanes', type=int, default=4)
+    parser.add_argument('--lane-size', type=int, default=100)
+    parser.add_argument('--enqueue-timeout', type=float, default=0.5)
+    parser.add_argument('--api-latency-ms', type=float, default=20, help='Задержка ответа фейкового Bot API')
+    parser.add_argument('--flood-probability', type=float, default=0.0, help='Доля ответов 429 от Bot API')
+    parser.add_argument('--global-rate', type=float, default=30, help='Лимит исходящих запросов в секунду')
+    args = parser.parse_args()
+
+    logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
+    logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.WARNING)
+
+    api = FakeBotApi(args.api_latency_ms / 1000, args.flood_probability)
+    api.start()
+    apihelper.API_URL = api.api_url
+
+    bot = telebot.TeleBot('123:fake', threaded=False)
+    init_db(create_tables=Config.DB_CREATE_TABLES)
+    reload_catalog()
+    register_command_handlers(bot)
+    register_callback_handlers(bot)
+    sender = OutboundSender(global_rate=args.global_rate)
+    sender.start()
+    sender.attach(bot)
+
+    # Запоминаем порядок обработки, чтобы проверить, что обновления пользователя не переставляются
+    last_seen, reordered = {}, []
+
+    def process(updates):
+        for update in updates:
+            user_id = update_user_id(update)
+            if update.update_id < last_seen.get(user_id, 0):
+                reordered.append(update.update_id)
+            last_seen[user_id] = update.update_id
+        bot.process_new_updates(updates)
+
+    dispatcher = UpdateDispatcher(process, lanes=args.lanes, lane_size=args.lane_size,
+                                  enqueue_timeout=args.enqueue_timeout)
+    server = WebhookServer(dispatcher, '127.0.0.1', 0, '/webhook', SECRET_TOKEN)
+    dispatcher.start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    url = f"http://{host}:{port}/webhook"
+
+    # Как и Telegram, обновления одного пользователя отправляем последовательно, разных — параллельно
+    commands = ['/start', '/number', '/list', '/all_stat']
+    per_user = {}
+    for i in range(args.updates):
+        user_id = i % args.users + 1
+        per_user.setdefault(user_id, []).append(make_update(i + 1, user_id, commands[i % len(commands)]))
+
+    def post_user_updates(payloads):
+        return [post_update(url, payload) for payload in payloads]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        results = [result for chunk in pool.map(post_user_updates, per_user.values()) for result in chunk]
+    accepted_in = time.perf_counter() - started
+
+    drained = server.shutdown(drain_timeout=120)
+    sender.stop(timeout=30)
+    total = time.perf_counter() - started
+    api.stop()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(latency for _, latency in results)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+    print(f"Отправлено обновлений: {args.updates} ({args.clients} клиентов) за {accepted_in:.2f} с")
+    print(f"Ответы вебхука: {statuses}, задержка ответа p50 {p50:.1f} мс, p99 {p99:.1f} мс")
+    stats = dispatcher.stats()
+    lanes = stats.pop('lanes')
+    print(f"Очереди обработаны: {'да' if drained else 'нет'}, всего {total:.2f} с, "
+          f"{stats['processed'] / total:.0f} обновлений/с, вызовов Bot API: {api.calls} (из них 429: {api.floods})")
+    print(f"Нарушений порядка внутри пользователя: {len(reordered)}")
+    print(f"Метрики диспетчера: {json.dumps(stats, ensure_ascii=False)}")
+    for lane in lanes:
+        print(f"  {json.dumps(lane, ensure_ascii=False)}")
+    print(f"Метрики исходящей очереди: {json.dumps(sender.stats(), ensure_ascii=False)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,150 @@
 import telebot
 from telebot import apihelper
 
-from config import Config
+from config import Config, setup_logging
+from db_helpers.catalog import reload_catalog
+from db_helpers.models import init_db
+from db_helpers.selection_writer import get_selection_writer, stop_selection_writer
+from db_helpers.users import user_id_cache
 from handlers.command_handlers import register_command_handlers
 from handlers.callback_handlers import register_callback_handlers
+from handlers.flows import calendar_instance
+from states import get_state_store
+from utils.async_runtime import UserLocks, get_blocking_executor, run_blocking, serialize_per_user, \
+    stop_blocking_executor
+from utils.dispatcher import UpdateDispatcher
+from utils.log_pipeline import log_pipeline_stats
+from utils.metrics import MetricsServer, install_db_metrics, install_telegram_metrics, instrument_message_handlers, \
+    registry
+from utils.outbound import OutboundSender
+from utils.sub_channel_checker import get_subscription_checker, require_subscription
+import asyncio
 import logging
-import time
+import signal
+import threading
 import sys
+from typing import Callable, Dict, Optional
 from telebot.handler_backends import State, StatesGroup
 
-# Настраиваем логирование
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot_log.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger(__name__)
 
 apihelper.ENABLE_MIDDLEWARE = True
+if Config.TELEGRAM_API_URL:
+    apihelper.API_URL = Config.TELEGRAM_API_URL
+
+
+def bootstrap():
+    """
+    Запуск процесса бота: логирование, подключение к БД и прогрев календаря. При импорте модулей
+    ничего из этого не происходит, поэтому alembic и скрипты не подключаются к БД и не создают таблицы.
+    Исключение — переменные из .env: их читает load_dotenv() при определении класса Config,
+    так что они должны быть на месте до первого импорта config.
+    """
+    setup_logging()
+    init_db(create_tables=Config.DB_CREATE_TABLES)
+    calendar_instance.prewarm()
+
+
+def create_outbound_sender() -> OutboundSender:
+    sender = OutboundSender(global_rate=Config.OUTBOUND_GLOBAL_RATE, chat_rate=Config.OUTBOUND_CHAT_RATE,
+                            chat_burst=Config.OUTBOUND_CHAT_BURST, workers=Config.OUTBOUND_WORKERS,
+                            max_retries=Config.OUTBOUND_MAX_RETRIES)
+    sender.start()
+    return sender
+
+
+def start_metrics(collectors: Dict[str, Callable[[], dict]], is_async: bool = False) -> Optional[MetricsServer]:
+    """
+    Включает измерение SQL-запросов и вызовов Bot API, регистрирует снимки stats() подсистем
+    и поднимает HTTP-сервер метрик. При METRICS_PORT=0 ничего не делает.
+
+    :param collectors: Имя подсистемы -> функция stats() (в дополнение к общим кэшам и очередям)
+    :param is_async: Бот работает через AsyncTeleBot
+    :return: Запущенный сервер метрик или None
+    """
+    if not Config.METRICS_PORT:
+        return None
+
+    if Config.METRICS_DB_QUERIES:
+        install_db_metrics()
+    install_telegram_metrics(is_async)
+    collectors = {
+        'user_cache': user_id_cache.stats,
+        'calendar_cache': calendar_instance.stats,
+        'selection_writer': lambda: get_selection_writer().stats(),
+        'state_store': lambda: {'size': len(get_state_store())},
+        'logging': log_pipeline_stats,
+        **collectors,
+    }
+    for name, collect in collectors.items():
+        registry.register_collector(name, collect)
+
+    server = MetricsServer(registry, Config.METRICS_HOST, Config.METRICS_PORT, Config.METRICS_PATH)
+    server.start()
+    return server
+
+
+def stop_metrics(server: Optional[MetricsServer]):
+    if server is not None:
+        server.stop()
+
+
+def stop_background(sender: OutboundSender, metrics_server: Optional[MetricsServer]):
+    """
+    Завершение после остановки приёма обновлений: отправляет исходящие запросы из очереди
+    и записывает накопленные выборы. Вызывается, когда обработчики уже доработали.
+    """
+    sender.stop(Config.UPDATE_DRAIN_TIMEOUT)
+    stop_selection_writer(Config.UPDATE_DRAIN_TIMEOUT)
+    stop_metrics(metrics_server)
+
+
+def run_webhook(bot: telebot.TeleBot, dispatcher: UpdateDispatcher):
+    """
+    Принимает обновления через вебхук: HTTP-сервер раскладывает их по дорожкам диспетчера.
+    По SIGTERM/Ctrl+C дожидается обработки принятых обновлений.
+    """
+    from utils.webhook import WebhookServer
+
+    server = WebhookServer(dispatcher, Config.WEBHOOK_LISTEN_HOST, Config.WEBHOOK_LISTEN_PORT,
+                           Config.WEBHOOK_PATH, Config.WEBHOOK_SECRET_TOKEN)
+
+    if Config.WEBHOOK_URL:
+        bot.remove_webhook()
+        bot.set_webhook(url=Config.WEBHOOK_URL, secret_token=Config.WEBHOOK_SECRET_TOKEN,
+                        max_connections=Config.UPDATE_LANES)
+
+    # serve_forever() блокирует главный поток, поэтому прерываем его из отдельного
+    def stop(signum, frame):
+        logger.info("Получен сигнал %s, останавливаем вебхук", signum)
+        threading.Thread(target=server.stop).start()
+
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.shutdown(Config.UPDATE_DRAIN_TIMEOUT)
+    logger.info("Вебхук остановлен: %s", dispatcher.stats())
 
 
 def run_bot():
-    bot = telebot.TeleBot(Config.BOT_TOKEN)
+    # Обновления обрабатывают дорожки UpdateDispatcher, собственный пул TeleBot не нужен
+    bot = telebot.TeleBot(Config.BOT_TOKEN, threaded=False)
+
+    # Загружаем справочники трактовок в память один раз при старте
+    reload_catalog()
 
     # Регистрируем обработчики команд и колбеков
     register_command_handlers(bot)
     register_callback_handlers(bot)
+    checker = get_subscription_checker(bot)
+    if Config.SUBSCRIPTION_REQUIRED:
+        checker.check_access()
+        require_subscription(bot, checker)
+    # Обработчики нажатий измеряет CallbackRouter, команды оборачиваем здесь
+    instrument_message_handlers(bot)
 
     # Обработчик всех ошибок
     @bot.middleware_handler(update_types=['message', 'callback_query'])
@@ -36,30 +152,161 @@ def run_bot():
         try:
             return True
         except Exception as e:
-            logger.error(f"Middleware error: {e}", exc_info=True)
+            logger.error("Middleware error: %s", e, exc_info=True)
             return True
 
-    while True:
+    # Все отправки обработчиков идут через очередь с лимитами Telegram
+    sender = create_outbound_sender()
+    sender.attach(bot)
+
+    dispatcher = UpdateDispatcher(bot.process_new_updates, lanes=Config.UPDATE_LANES,
+                                  lane_size=Config.UPDATE_LANE_SIZE, enqueue_timeout=Config.UPDATE_ENQUEUE_TIMEOUT)
+    dispatcher.start()
+
+    metrics_server = start_metrics({
+        'dispatcher': dispatcher.stats,
+        'outbound': sender.stats,
+        'subscription': checker.stats,
+    })
+
+    if Config.BOT_UPDATE_MODE == 'webhook':
+        run_webhook(bot, dispatcher)
+        stop_background(sender, metrics_server)
+        return
+
+    dispatcher.attach(bot)
+
+    # Без обработчика SIGTERM (systemctl restart) завершает процесс, не выполняя finally, а Ctrl+C
+    # polling перехватывает сам и запускается заново. Останавливаем polling: оно вернётся
+    # после текущего getUpdates, и очереди доработают ниже
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        logger.info("Получен сигнал %s, останавливаем polling", signum)
+        stopping.set()
+        bot.stop_polling()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while not stopping.is_set():
+            try:
+                logger.info("Bot started")
+                bot.polling(none_stop=True, interval=1, timeout=60)
+            except telebot.apihelper.ApiException as e:
+                logger.error("API Exception: %s", e, exc_info=True)
+                stopping.wait(15)
+            except Exception as e:
+                logger.error("Unexpected error: %s", e, exc_info=True)
+                stopping.wait(15)
+            finally:
+                if not stopping.is_set():
+                    logger.info("Bot stopped, attempting restart...")
+                    stopping.wait(5)
+    finally:
+        dispatcher.drain(Config.UPDATE_DRAIN_TIMEOUT)
+        stop_background(sender, metrics_server)
+        logger.info("Бот остановлен: %s", dispatcher.stats())
+
+
+async def run_async_bot():
+    """
+    Асинхронный режим: AsyncTeleBot обрабатывает обновления конкурентно. Логика обработчиков
+    общая с синхронным режимом (handlers.flows), обращения к БД выполняются в пуле потоков
+    utils.async_runtime размером Config.ASYNC_WORKERS, проверка подписки — корутинами AsyncTeleBot.
+    Обновления одного пользователя обрабатываются по очереди (UserLocks). UpdateDispatcher здесь
+    не используется, поэтому метрик дорожек (bot_dispatcher_*) в этом режиме нет — их заменяет user_locks.
+    """
+    from telebot.async_telebot import AsyncTeleBot
+    from handlers.async_command_handlers import register_async_command_handlers
+    from handlers.async_callback_handlers import register_async_callback_handlers
+
+    if Config.BOT_UPDATE_MODE == 'webhook':
+        # Иначе бот молча уходил бы в polling, а при зарегистрированном вебхуке getUpdates отвечает 409
+        raise RuntimeError("BOT_UPDATE_MODE=webhook поддерживается только при BOT_RUNTIME=sync")
+
+    bot = AsyncTeleBot(Config.BOT_TOKEN)
+
+    await run_blocking(reload_catalog)
+
+    register_async_command_handlers(bot)
+    register_async_callback_handlers(bot)
+    checker = get_subscription_checker(bot)
+    if Config.SUBSCRIPTION_REQUIRED:
+        await checker.check_access()
+        require_subscription(bot, checker)
+    instrument_message_handlers(bot)
+    user_locks = UserLocks()
+    serialize_per_user(bot, user_locks)
+
+    sender = create_outbound_sender()
+    sender.attach_async(bot, asyncio.get_running_loop())
+
+    metrics_server = start_metrics({
+        'outbound': sender.stats,
+        'subscription': checker.stats,
+        'flow_executor': lambda: get_blocking_executor().stats(),
+        'user_locks': user_locks.stats,
+    }, is_async=True)
+
+    # У AsyncTeleBot нет stop_polling: по SIGTERM/SIGINT отменяем задачу polling,
+    # дожидаемся запущенных ею обработчиков и дорабатываем очереди
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    polling: Optional[asyncio.Task] = None
+
+    def stop(signum):
+        logger.info("Получен сигнал %s, останавливаем polling", signum)
+        stopping.set()
+        if polling is not None:
+            polling.cancel()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop, signum)
+
+    async def pause(seconds: float):
         try:
-            logger.info("Bot started")
-            bot.polling(none_stop=True, interval=1, timeout=60)
-        except telebot.apihelper.ApiException as e:
-            logger.error(f"API Exception: {e}", exc_info=True)
-            time.sleep(15)
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}", exc_info=True)
-            time.sleep(15)
-        finally:
-            logger.info("Bot stopped, attempting restart...")
-            time.sleep(5)
+            await asyncio.wait_for(stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    try:
+        while not stopping.is_set():
+            try:
+                logger.info("Async bot started")
+                polling = asyncio.create_task(bot.polling(non_stop=True, interval=1, timeout=60))
+                await polling
+            except asyncio.CancelledError:
+                if not stopping.is_set():
+                    raise
+            except Exception as e:
+                logger.error("Unexpected error: %s", e, exc_info=True)
+                await pause(15)
+            finally:
+                if not stopping.is_set():
+                    logger.info("Bot stopped, attempting restart...")
+                    await pause(5)
+    finally:
+        # Обработчики обновлений polling запускает отдельными задачами
+        handlers = asyncio.all_tasks() - {asyncio.current_task()}
+        if handlers:
+            await asyncio.wait(handlers, timeout=Config.UPDATE_DRAIN_TIMEOUT)
+        # Потоки очереди выполняют корутины отправки в этом цикле, поэтому ждём их не блокируя его
+        await asyncio.to_thread(stop_background, sender, metrics_server)
+        stop_blocking_executor()
 
 
 if __name__ == "__main__":
+    bootstrap()
     try:
-        run_bot()
+        if Config.BOT_RUNTIME == 'async':
+            asyncio.run(run_async_bot())
+        else:
+            run_bot()
     except KeyboardInterrupt:
         logger.info("Bot stopped manually")
         sys.exit(0)
     except Exception as e:
-        logger.critical(f"Critical error occurred: {e}", exc_info=True)
+        logger.critical("Critical error occurred: %s", e, exc_info=True)
         sys.exit(1)
@@ -1,6 +1,9 @@
 import logging
 import os
+import sys
+from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
+from sqlalchemy.engine import URL
 
 
 class Config:
@@ -9,6 +12,9 @@ class Config:
     # TG
     BOT_TOKEN = os.getenv('BOT_TOKEN')
 
+    # Окружение: 'development', 'production' или 'testing'
+    CONF_ENV = os.getenv('CONF_ENV', 'development')
+
     # DB
     POSTGRESQL_HOST = os.getenv('POSTGRESQL_HOST')
     POSTGRESQL_PORT = os.getenv('POSTGRESQL_PORT')
@@ -16,26 +22,161 @@ class Config:
     POSTGRESQL_PASSWORD = os.getenv('POSTGRESQL_PASSWORD')
     POSTGRESQL_DBNAME = os.getenv('POSTGRESQL_DBNAME')
     PG_SCHEMA = os.getenv('PG_SCHEMA')
-    PG_DRIVER = os.getenv('PG_DRIVER')
-    # SQLALCHEMY_DATABASE_URI = (f'postgresql+{PG_DRIVER}://'
-    #                            f'{POSTGRESQL_USER}:'
-    #                            f'{POSTGRESQL_PASSWORD}@'
-    #                            f'{POSTGRESQL_HOST}:'
-    #                            f'{POSTGRESQL_PORT}/'
-    #                            f'{POSTGRESQL_DBNAME}')
+    PG_DRIVER = os.getenv('PG_DRIVER', 'psycopg2')
 
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///database.db'
+    # 'postgresql' или 'sqlite'. В production по умолчанию PostgreSQL; тесты идут на PostgreSQL,
+    # если задан POSTGRESQL_HOST, и на отдельном файле SQLite, если нет
+    DB_BACKEND = os.getenv('DB_BACKEND', 'postgresql' if CONF_ENV == 'production'
+                           or (CONF_ENV == 'testing' and POSTGRESQL_HOST) else 'sqlite')
 
-    @classmethod
-    def init_logger(cls, log_level=logging.INFO):
-        """Инициализация логгера с уровнем логирования и базовой конфигурацией."""
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'test_database.db' if CONF_ENV == 'testing' else 'database.db')
+
+    if DB_BACKEND == 'postgresql':
+        _pg_url = URL.create('postgresql', username=POSTGRESQL_USER, password=POSTGRESQL_PASSWORD,
+                             host=POSTGRESQL_HOST, port=int(POSTGRESQL_PORT) if POSTGRESQL_PORT else None,
+                             database=POSTGRESQL_DBNAME)
+        SQLALCHEMY_DATABASE_URI = _pg_url.set(drivername=f'postgresql+{PG_DRIVER}').render_as_string(
+            hide_password=False)
+    else:
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{SQLITE_PATH}'
+
+    # Пул соединений PostgreSQL: постоянные соединения и сколько можно открыть сверх них на пике.
+    # pre-ping проверяет соединение перед выдачей (переживаем рестарт сервера и разрывы по простою),
+    # recycle пересоздаёт соединения старше указанного числа секунд
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    # Ограничение времени одного запроса на сервере, мс (0 — без ограничения)
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 5000))
+    # Создавать недостающие таблицы при старте бота (create_all). Схемой PostgreSQL управляет alembic,
+    # поэтому по умолчанию только для SQLite
+    DB_CREATE_TABLES = os.getenv('DB_CREATE_TABLES', '1' if DB_BACKEND == 'sqlite' else '0') == '1'
+
+    # Профиль SQLite: в WAL читатели не ждут писателя, synchronous=NORMAL в WAL не теряет
+    # целостность при сбое, busy_timeout (мс) заставляет ждать блокировку вместо ошибки.
+    # Пустое значение отключает соответствующую PRAGMA
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = os.getenv('SQLITE_BUSY_TIMEOUT', '5000')
+    # Отрицательное значение — размер кэша страниц в КиБ
+    SQLITE_CACHE_SIZE = os.getenv('SQLITE_CACHE_SIZE', '-16000')
+    SQLITE_MMAP_SIZE = os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))
+    # Запись идёт через одно соединение, чтение — через пул
+    SQLITE_READ_POOL_SIZE = int(os.getenv('SQLITE_READ_POOL_SIZE', 4))
+    # Сколько секунд ждать освобождения пишущего соединения
+    SQLITE_WRITE_TIMEOUT = float(os.getenv('SQLITE_WRITE_TIMEOUT', 30))
+
+    # Режим работы: 'sync' — TeleBot, 'async' — AsyncTeleBot (порядок внутри пользователя держат
+    # блокировки пользователей вместо дорожек, поэтому UPDATE_LANES и метрики дорожек к нему не относятся)
+    BOT_RUNTIME = os.getenv('BOT_RUNTIME', 'sync')
+    # Потоки для логики обработчиков с обращениями к БД в асинхронном режиме (не меньше пула соединений)
+    ASYNC_WORKERS = int(os.getenv('ASYNC_WORKERS', 16))
+
+    # Получение обновлений: 'polling' — long polling, 'webhook' — HTTP-сервер (только при BOT_RUNTIME=sync)
+    BOT_UPDATE_MODE = os.getenv('BOT_UPDATE_MODE', 'polling')
+    # Адрес Bot API, формат apihelper.API_URL (для локального фейкового Telegram), None — api.telegram.org
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+    # Webhook
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+    WEBHOOK_LISTEN_HOST = os.getenv('WEBHOOK_LISTEN_HOST', '0.0.0.0')
+    WEBHOOK_LISTEN_PORT = int(os.getenv('WEBHOOK_LISTEN_PORT', 8443))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
+
+    # Диспетчер обновлений: дорожки по from_user.id (порядок внутри пользователя, параллельно между пользователями)
+    UPDATE_LANES = int(os.getenv('UPDATE_LANES', 4))
+    UPDATE_LANE_SIZE = int(os.getenv('UPDATE_LANE_SIZE', 250))
+    # Сколько секунд вебхук ждёт места в заполненной дорожке перед ответом 503
+    UPDATE_ENQUEUE_TIMEOUT = float(os.getenv('UPDATE_ENQUEUE_TIMEOUT', 2.0))
+    # Сколько секунд дожидаться обработки очередей при остановке
+    UPDATE_DRAIN_TIMEOUT = float(os.getenv('UPDATE_DRAIN_TIMEOUT', 30))
+
+    # Метрики в формате Prometheus: задержки обработчиков, SQL и Bot API, снимки очередей и кэшей.
+    # По умолчанию отдаются только локально; METRICS_PORT=0 отключает HTTP-сервер и измерение SQL и Bot API
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+    METRICS_PATH = os.getenv('METRICS_PATH', '/metrics')
+    # Измерение каждого SQL-запроса через события SQLAlchemy стоит ~10 мкс на запрос
+    METRICS_DB_QUERIES = os.getenv('METRICS_DB_QUERIES', '1') == '1'
+
+    # Состояния диалогов: 'memory' — в процессе, 'db' — таблица user_states (общая для нескольких процессов)
+    STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+    # Через сколько секунд без изменений брошенное состояние удаляется
+    STATE_TTL = int(os.getenv('STATE_TTL', 24 * 60 * 60))
+    # Максимум состояний в памяти, сверх него вытесняются давно не использованные
+    STATE_MAX_USERS = int(os.getenv('STATE_MAX_USERS', 10000))
+
+    # Сколько соответствий tg_id -> users.id держать в памяти, чтобы не искать пользователя на каждое нажатие
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 100000))
+
+    # Кэш проверки подписки на каналы: подписку помним дольше, её отсутствие — недолго,
+    # чтобы только что подписавшийся пользователь быстро получил доступ
+    SUBSCRIPTION_POSITIVE_TTL = int(os.getenv('SUBSCRIPTION_POSITIVE_TTL', 600))
+    SUBSCRIPTION_NEGATIVE_TTL = int(os.getenv('SUBSCRIPTION_NEGATIVE_TTL', 30))
+    # Отвечать на команды только подписчикам обязательных каналов (бот должен быть их администратором,
+    # иначе проверка отказывает всем — при запуске об этом пишется предупреждение)
+    SUBSCRIPTION_REQUIRED = os.getenv('SUBSCRIPTION_REQUIRED', '0') == '1'
+
+    # Исходящие запросы: лимиты Telegram — около 30 сообщений в секунду на бота и 1 в секунду в чат
+    OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))
+    OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', 1))
+    # Сколько сообщений в чат можно отправить подряд (ответ обработчика часто состоит из 2-3 сообщений)
+    OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', 3))
+    OUTBOUND_WORKERS = int(os.getenv('OUTBOUND_WORKERS', 4))
+    OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 3))
+
+    # Каталог для готовых страниц /list (переживают перезапуск), None — хранить только в памяти
+    LIST_PAGES_CACHE_DIR = os.getenv('LIST_PAGES_CACHE_DIR')
+
+    # Отложенная запись выборов: пакет уходит в БД, когда набралось SELECTION_BATCH_SIZE выборов
+    # или первый из них ждёт SELECTION_FLUSH_INTERVAL секунд
+    SELECTION_BATCH_SIZE = int(os.getenv('SELECTION_BATCH_SIZE', 200))
+    SELECTION_FLUSH_INTERVAL = float(os.getenv('SELECTION_FLUSH_INTERVAL', 0.05))
+    # Сколько запрос статистики ждёт записи выборов пользователя
+    SELECTION_FLUSH_TIMEOUT = float(os.getenv('SELECTION_FLUSH_TIMEOUT', 5))
+
+    # Логи пишет фоновый поток из очереди, обработчики обновлений на записи в файл не ждут.
+    # Файл ротируется по размеру; LOG_FILE='' — только stdout (например, под journald)
+    LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+    # Сколько записей может ждать записи на диск; при зависшем диске лишние отбрасываются
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    # Выборочная отладка: доля записей DEBUG (0..1), которые пишутся; 0 — уровень окружения без DEBUG
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 0))
 
-        # Базовая конфигурация логирования
-        logging.basicConfig(
-            level=log_level,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
+    @classmethod
+    def init_logger(cls, log_level=logging.INFO, log_sql: bool = True):
+        """
+        Единственная точка настройки логирования: корневой логгер получает неблокирующий
+        обработчик-очередь, а консоль и файл с ротацией обслуживает отдельный поток.
+
+        :param log_level: Уровень логирования приложения
+        :param log_sql: Логировать ли SQL-запросы
+        """
+        from utils.log_pipeline import configure_logging
+
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                                      datefmt='%Y-%m-%d %H:%M:%S')
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if cls.LOG_FILE:
+            handlers.append(RotatingFileHandler(cls.LOG_FILE, maxBytes=cls.LOG_MAX_BYTES,
+                                                backupCount=cls.LOG_BACKUP_COUNT, encoding='utf-8'))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        # Формат не использует процесс и поток, не собираем их для каждой записи
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+        logging.logThreads = False
+
+        debug_sample_rate = 1.0
+        if cls.LOG_DEBUG_SAMPLE_RATE > 0:
+            log_level = logging.DEBUG
+            debug_sample_rate = min(cls.LOG_DEBUG_SAMPLE_RATE, 1.0)
+        configure_logging(log_level, handlers, cls.LOG_QUEUE_SIZE, debug_sample_rate)
 
         # Логгер вашего приложения
         logger = logging.getLogger("VVS-Logger")
@@ -43,12 +184,13 @@ class Config:
 
         # Настройка логгера для SQLAlchemy
         # Оставляем только SQL-запросы (без параметров и другой информации)
+        sql_level = logging.INFO if log_sql else logging.WARNING
         sql_logger = logging.getLogger('sqlalchemy.engine')
-        sql_logger.setLevel(logging.INFO)  # Логи SQL-запросов
+        sql_logger.setLevel(sql_level)  # Логи SQL-запросов
 
         # Отключаем вывод параметров запросов
         sql_engine_logger = logging.getLogger('sqlalchemy.engine.Engine')
-        sql_engine_logger.setLevel(logging.INFO)
+        sql_engine_logger.setLevel(sql_level)
 
         # Отключаем логи о пулах соединений
         logging.getLogger('sqlalchemy.pool').setLevel(logging.WARNING)
@@ -60,18 +202,37 @@ class Config:
 
 
 class DevConfig(Config):
-    logger = Config.init_logger()
+    LOG_LEVEL = logging.INFO
+    LOG_SQL = True
+
+
+class ProdConfig(Config):
+    LOG_LEVEL = logging.INFO
+    # Лог каждого SQL-запроса на нагрузке дороже самих запросов
+    LOG_SQL = False
+
+
+class TestConfig(Config):
+    LOG_LEVEL = logging.WARNING
+    LOG_SQL = False
 
 
 def get_config_class():
-    env = os.getenv('CONF_ENV', 'development')
-    if env == 'production':
-        pass
-    elif env == 'testing':
-        pass
-    else:
-        return DevConfig
+    if Config.CONF_ENV == 'production':
+        return ProdConfig
+    if Config.CONF_ENV == 'testing':
+        return TestConfig
+    return DevConfig
 
 
 current_config = get_config_class()
 config_instance = current_config()
+
+
+def setup_logging():
+    """
+    Настраивает логирование для выбранного окружения. Вызывается при запуске приложения
+    или скрипта, а не при импорте: alembic и утилиты настраивают логи по-своему.
+    """
+    current_config.logger = current_config.init_logger(current_config.LOG_LEVEL, current_config.LOG_SQL)
+    return current_config.logger
@@ -0,0 +1,184 @@
+import logging
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from db_helpers.models import ReadSessionLocal, TimeRange, TimeChoice, NumberChoice
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TimeRangeItem:
+    """Временной промежуток (строка таблицы time_ranges)."""
+    id: int
+    name: str
+    time_range: str
+
+
+@dataclass(frozen=True)
+class TimeChoiceItem:
+    """Время и его трактовка (строка таблицы time_choices)."""
+    id: int
+    choice: str
+    interpretation: str
+    time_range_id: int
+
+
+@dataclass(frozen=True)
+class NumberChoiceItem:
+    """Число и его трактовка (строка таблицы numbers_choices)."""
+    id: int
+    number: int
+    interpretation: str
+
+
+class InterpretationCatalog:
+    """
+    Неизменяемый снимок справочников трактовок с индексами для поиска без обращения к БД.
+
+    Справочники заполняются миграцией 249aedd25b30_fill_tables и в работе бота не меняются,
+    поэтому достаточно загрузить их один раз и перечитывать только по явному запросу.
+    """
+
+    def __init__(self, time_ranges: List[TimeRangeItem], time_choices: List[TimeChoiceItem],
+                 number_choices: List[NumberChoiceItem], version: int):
+        """
+        :param time_ranges: Временные промежутки
+        :param time_choices: Варианты времени
+        :param number_choices: Варианты чисел
+        :param version: Номер версии снимка (растёт при каждой перезагрузке)
+        """
+        self.version = version
+
+        self.time_ranges: Tuple[TimeRangeItem, ...] = tuple(sorted(time_ranges, key=lambda item: item.id))
+        self.time_ranges_by_id: Mapping[int, TimeRangeItem] = MappingProxyType(
+            {item.id: item for item in self.time_ranges})
+
+        self.time_choices: Tuple[TimeChoiceItem, ...] = tuple(sorted(time_choices, key=lambda item: item.id))
+        self.time_choices_by_id: Mapping[int, TimeChoiceItem] = MappingProxyType(
+            {item.id: item for item in self.time_choices})
+
+        by_choice: Dict[str, TimeChoiceItem] = {}
+        by_range: Dict[int, List[TimeChoiceItem]] = {}
+        for item in self.time_choices:
+            # При дублях оставляем первую запись, как это делал .first()
+            by_choice.setdefault(item.choice, item)
+            by_range.setdefault(item.time_range_id, []).append(item)
+        self.time_choices_by_choice: Mapping[str, TimeChoiceItem] = MappingProxyType(by_choice)
+        self.time_choices_by_range: Mapping[int, Tuple[TimeChoiceItem, ...]] = MappingProxyType(
+            {range_id: tuple(items) for range_id, items in by_range.items()})
+
+        self.number_choices: Tuple[NumberChoiceItem, ...] = tuple(sorted(number_choices, key=lambda item: item.id))
+        self.number_choices_by_id: Mapping[int, NumberChoiceItem] = MappingProxyType(
+            {item.id: item for item in self.number_choices})
+        by_number: Dict[int, NumberChoiceItem] = {}
+        for item in self.number_choices:
+            by_number.setdefault(item.number, item)
+        self.number_choices_by_number: Mapping[int, NumberChoiceItem] = MappingProxyType(by_number)
+
+    @classmethod
+    def load(cls, session: Session, version: int) -> "InterpretationCatalog":
+        """
+        Загружает все три справочника за три запроса.
+
+        :param session: Сессия SQLAlchemy
+        :param version: Номер версии нового снимка
+        :return: Заполненный каталог
+        """
+        time_ranges = [
+            TimeRangeItem(id=row.id, name=row.name, time_range=row.time_range)
+            for row in session.query(TimeRange.id, TimeRange.name, TimeRange.time_range)
+        ]
+        time_choices = [
+            TimeChoiceItem(id=row.id, choice=row.choice, interpretation=row.interpretation,
+                           time_range_id=row.time_range_id)
+            for row in session.query(TimeChoice.id, TimeChoice.choice, TimeChoice.interpretation,
+                                     TimeChoice.time_range_id)
+        ]
+        number_choices = [
+            NumberChoiceItem(id=row.id, number=row.number, interpretation=row.interpretation)
+            for row in session.query(NumberChoice.id, NumberChoice.number, NumberChoice.interpretation)
+        ]
+        return cls(time_ranges, time_choices, number_choices, version)
+
+    def get_time_range(self, time_range_id: int) -> Optional[TimeRangeItem]:
+        return self.time_ranges_by_id.get(time_range_id)
+
+    def get_time_choice(self, time_choice_id: int) -> Optional[TimeChoiceItem]:
+        return self.time_choices_by_id.get(time_choice_id)
+
+    def get_time_choice_by_choice(self, choice: str) -> Optional[TimeChoiceItem]:
+        return self.time_choices_by_choice.get(choice)
+
+    def get_time_choices_for_range(self, time_range_id: int) -> Tuple[TimeChoiceItem, ...]:
+        return self.time_choices_by_range.get(time_range_id, ())
+
+    def get_number_choice(self, number_choice_id: int) -> Optional[NumberChoiceItem]:
+        return self.number_choices_by_id.get(number_choice_id)
+
+    def get_number_choice_by_number(self, number: int) -> Optional[NumberChoiceItem]:
+        return self.number_choices_by_number.get(number)
+
+
+_catalog: Optional[InterpretationCatalog] = None
+_catalog_version = 0
+_catalog_lock = threading.Lock()
+_reload_listeners: List[Callable[[InterpretationCatalog], None]] = []
+
+
+def reload_catalog(session_factory=ReadSessionLocal) -> InterpretationCatalog:
+    """
+    Перечитывает справочники из БД и атомарно подменяет текущий снимок.
+
+    :param session_factory: Фабрика сессий SQLAlchemy
+    :return: Новый каталог
+    """
+    global _catalog, _catalog_version
+    with _catalog_lock:
+        with session_factory() as session:
+            catalog = InterpretationCatalog.load(session, _catalog_version + 1)
+        _catalog_version = catalog.version
+        _catalog = catalog
+        listeners = list(_reload_listeners)
+
+    logger.info("Каталог трактовок загружен (версия %s): %s промежутков, %s времён, %s чисел",
+                catalog.version, len(catalog.time_ranges), len(catalog.time_choices), len(catalog.number_choices))
+    for listener in listeners:
+        try:
+            listener(catalog)
+        except Exception as e:
+            logger.error("Ошибка в обработчике перезагрузки каталога: %s", e, exc_info=True)
+    return catalog
+
+
+def get_catalog() -> InterpretationCatalog:
+    """
+    Возвращает текущий снимок справочников, загружая его при первом обращении.
+
+    :return: Каталог трактовок
+    """
+    catalog = _catalog
+    if catalog is None:
+        return reload_catalog()
+    return catalog
+
+
+def invalidate_catalog():
+    """Сбрасывает текущий снимок; при следующем обращении справочники будут перечитаны из БД."""
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
+
+
+def add_catalog_reload_listener(listener: Callable[[InterpretationCatalog], None]):
+    """
+    Регистрирует функцию, вызываемую после каждой перезагрузки каталога.
+
+    :param listener: Функция, принимающая новый каталог
+    """
+    with _catalog_lock:
+        _reload_listeners.append(listener)
@@ -0,0 +1,138 @@
+import logging
+from typing import Dict, Optional, Tuple, Union
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_pragmas() -> Dict[str, Union[str, int]]:
+    """
+    PRAGMA, выполняемые на каждом соединении с SQLite, из настроек Config.
+
+    :return: Имя PRAGMA -> значение (None в настройке — не выполнять)
+    """
+    pragmas = {
+        'journal_mode': Config.SQLITE_JOURNAL_MODE,
+        'synchronous': Config.SQLITE_SYNCHRONOUS,
+        'busy_timeout': Config.SQLITE_BUSY_TIMEOUT,
+        'cache_size': Config.SQLITE_CACHE_SIZE,
+        'mmap_size': Config.SQLITE_MMAP_SIZE,
+    }
+    return {name: value for name, value in pragmas.items() if value not in (None, '')}
+
+
+def _set_pragmas(engine: Engine, pragmas: Dict[str, Union[str, int]]):
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def _begin_immediate(engine: Engine):
+    """
+    Транзакции пишущего соединения начинаются с BEGIN IMMEDIATE: блокировка на запись берётся
+    сразу, а не при первом INSERT, и конкурент из другого процесса (alembic, backfill) ждёт
+    busy_timeout вместо ошибки «database is locked» посреди транзакции.
+    """
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        # Отключаем собственное управление транзакциями pysqlite, BEGIN выдаём сами
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def create_sqlite_engines(uri: str, pragmas: Optional[Dict[str, Union[str, int]]] = None,
+                          read_pool_size: int = 4, write_timeout: float = 30) -> Tuple[Engine, Engine]:
+    """
+    Создаёт движки для файла SQLite: пишущий с единственным соединением и читающий с пулом.
+
+    В SQLite одновременно пишет только одно соединение. Единственное пишущее соединение
+    выстраивает запись внутри процесса в очередь пула вместо борьбы за блокировку файла,
+    а в режиме WAL читающие соединения не ждут пишущее.
+
+    :param uri: URI базы SQLite
+    :param pragmas: PRAGMA для каждого соединения (по умолчанию sqlite_pragmas())
+    :param read_pool_size: Количество читающих соединений
+    :param write_timeout: Сколько секунд ждать освободившегося пишущего соединения
+    :return: (пишущий движок, читающий движок)
+    """
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+
+    write_engine = create_engine(uri, echo=False, pool_size=1, max_overflow=0, pool_timeout=write_timeout)
+    _set_pragmas(write_engine, pragmas)
+    _begin_immediate(write_engine)
+
+    # journal_mode хранится в файле базы и переключается пишущим соединением
+    read_pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+    read_pragmas['query_only'] = 'ON'
+    read_engine = create_engine(uri, echo=False, pool_size=read_pool_size, max_overflow=0,
+                                pool_timeout=write_timeout)
+    _set_pragmas(read_engine, read_pragmas)
+
+    logger.info("SQLite: %s, читающих соединений: %s", pragmas, read_pool_size)
+    return write_engine, read_engine
+
+
+def postgres_engine_options(driver: str) -> Dict[str, object]:
+    """
+    Параметры движка PostgreSQL из настроек: размер пула, pre-ping, пересоздание соединений,
+    statement_timeout и search_path на стороне сервера.
+
+    :param driver: Драйвер из URI ('psycopg2', 'asyncpg'...)
+    :return: Именованные аргументы для create_engine / create_async_engine
+    """
+    options = {
+        'pool_size': Config.DB_POOL_SIZE,
+        'max_overflow': Config.DB_MAX_OVERFLOW,
+        'pool_timeout': Config.DB_POOL_TIMEOUT,
+        'pool_recycle': Config.DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+    settings = {}
+    if Config.DB_STATEMENT_TIMEOUT:
+        settings['statement_timeout'] = str(Config.DB_STATEMENT_TIMEOUT)
+    if Config.PG_SCHEMA:
+        settings['search_path'] = Config.PG_SCHEMA
+    if settings:
+        if driver == 'asyncpg':
+            options['connect_args'] = {'server_settings': settings}
+        else:
+            # libpq передаёт серверу параметры через options
+            options['connect_args'] = {'options': ' '.join(f"-c {name}={value}"
+                                                           for name, value in settings.items())}
+    return options
+
+
+def _is_sqlite_file(url: URL) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def create_engines(uri: str) -> Tuple[Engine, Engine]:
+    """
+    Создаёт движки приложения по URI базы. Для файла SQLite — раздельные пишущий и читающий,
+    для остальных баз читающий движок совпадает с основным.
+
+    :param uri: URI базы данных
+    :return: (основной движок, движок для запросов только на чтение)
+    """
+    url = make_url(uri)
+    if _is_sqlite_file(url):
+        return create_sqlite_engines(uri, read_pool_size=Config.SQLITE_READ_POOL_SIZE,
+                                     write_timeout=Config.SQLITE_WRITE_TIMEOUT)
+    if url.get_backend_name() == 'postgresql':
+        engine = create_engine(uri, echo=False, **postgres_engine_options(url.get_driver_name()))
+    else:
+        engine = create_engine(uri, echo=False)
+    return engine, engine
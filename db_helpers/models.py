@@ -1,11 +1,19 @@
+import logging
+import threading
 import uuid
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime, func, UUID
+from typing import Optional, Tuple
+
+from sqlalchemy import Column, Integer, BigInteger, String, Text, ForeignKey, DateTime, Date, func, \
+    UUID, Index, PrimaryKeyConstraint
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 
 from config import Config
+from db_helpers.engines import create_engines
+
+logger = logging.getLogger(__name__)
 
-engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, echo=False)
 Base = declarative_base()
 
 
@@ -14,8 +22,8 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
-    # Изменение типа на Integer для согласованности
-    tg_id = Column(Integer, unique=True)
+    # Telegram ID не помещаются в 32-битный INTEGER PostgreSQL
+    tg_id = Column(BigInteger, unique=True)
     selections = relationship("TimeSelection", back_populates="user")
     number_selections = relationship("NumberSelection", back_populates="user")
 
@@ -30,6 +38,11 @@ class TimeSelection(Base):
     user = relationship("User", back_populates="selections")
     timestamp = Column(DateTime, server_default=func.now())
 
+    # Покрывающий индекс для статистики: фильтр по пользователю и промежутку, группировка по выбору
+    __table_args__ = (
+        Index('ix_time_selections_user_id_timestamp', 'user_id', 'timestamp', 'time_choice_id'),
+    )
+
 
 class TimeRange(Base):
     """Группировка по 4 временным отрезкам."""
@@ -75,7 +88,120 @@ class NumberSelection(Base):
     # Время выбора
     timestamp = Column(DateTime, server_default=func.now())
 
+    __table_args__ = (
+        Index('ix_number_selections_user_id_timestamp', 'user_id', 'timestamp', 'number_choice_id'),
+    )
+
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class UserChoiceCounter(Base):
+    """Счётчик выборов пользователя за всё время (поддерживается при каждой записи выбора)."""
+    __tablename__ = 'user_choice_counters'
 
-Base.metadata.create_all(bind=engine)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    # 'time' — TimeChoice, 'numbers' — NumberChoice
+    kind = Column(String, primary_key=True)
+    choice_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class DailyChoiceCount(Base):
+    """Дневной агрегат выборов пользователя (поддерживается при каждой записи выбора)."""
+    __tablename__ = 'daily_choice_counts'
+
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    day = Column(Date, nullable=False)
+    # 'time' — TimeChoice, 'numbers' — NumberChoice
+    kind = Column(String, nullable=False)
+    choice_id = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    # Порядок ключа подобран под запрос статистики: пользователь, вид, промежуток дней
+    __table_args__ = (
+        PrimaryKeyConstraint('user_id', 'kind', 'day', 'choice_id'),
+    )
+
+
+class UserState(Base):
+    """Состояние диалога пользователя для хранилища состояний в БД (STATE_BACKEND='db')."""
+    __tablename__ = 'user_states'
+
+    # Telegram ID чата, как и ключ в states.py
+    chat_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    # Словарь состояния в JSON
+    data = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# Вся запись идёт через engine; read_engine — для запросов только на чтение (статистика, справочники).
+# Для файла SQLite это разные пулы, для остальных баз — один и тот же движок.
+# Движки создаются при первом обращении: импорт моделей (alembic, скрипты) не подключается к БД
+_engines: Optional[Tuple[Engine, Engine]] = None
+_engines_lock = threading.Lock()
+
+
+def get_engines() -> Tuple[Engine, Engine]:
+    """
+    Возвращает (основной движок, движок для чтения), создавая их при первом вызове.
+
+    :return: (engine, read_engine)
+    """
+    global _engines
+    if _engines is None:
+        with _engines_lock:
+            if _engines is None:
+                _engines = create_engines(Config.SQLALCHEMY_DATABASE_URI)
+    return _engines
+
+
+def __getattr__(name: str):
+    # db_helpers.models.engine / read_engine по-прежнему доступны, но создаются лениво
+    if name == 'engine':
+        return get_engines()[0]
+    if name == 'read_engine':
+        return get_engines()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker, который привязывается к движку при создании первой сессии."""
+
+    def __init__(self, read_only: bool = False, **kw):
+        """
+        :param read_only: Привязать к движку для чтения
+        """
+        super().__init__(**kw)
+        self.read_only = read_only
+
+    def __call__(self, **local_kw):
+        if self.kw.get('bind') is None:
+            self.configure(bind=get_engines()[1 if self.read_only else 0])
+        return super().__call__(**local_kw)
+
+
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
+ReadSessionLocal = LazySessionmaker(read_only=True, autocommit=False, autoflush=False)
+
+
+def init_db(create_tables: bool = False):
+    """
+    Подключение к БД при старте приложения. Схемой управляют миграции alembic, поэтому
+    create_all выполняется только по явному запросу (локальная база SQLite без миграций).
+
+    :param create_tables: Создать недостающие таблицы
+    """
+    engine, _ = get_engines()
+    if create_tables:
+        Base.metadata.create_all(bind=engine)
+        logger.info("Недостающие таблицы созданы")
+
+
+def upsert_insert(session):
+    """Возвращает insert с поддержкой ON CONFLICT для диалекта текущей сессии."""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects import sqlite
+        return sqlite.insert
+    raise NotImplementedError(f"Upsert не поддерживается для диалекта {dialect}")
@@ -0,0 +1,153 @@
+"""
+Часто выполняемые запросы, собранные один раз.
+
+Каждый запрос строится при первом обращении с параметрами bindparam и дальше переиспользуется:
+SQLAlchemy находит его в кэше компиляции, не собирая выражение заново. Выполняются запросы
+через соединение сессии (session.connection()), минуя ORM-обработку результата, — в той же
+транзакции, что и остальная работа сессии.
+"""
+import functools
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from sqlalchemy import bindparam, func, select, union_all
+from sqlalchemy.orm import Session
+
+from db_helpers.models import User, TimeSelection, TimeChoice, NumberSelection, NumberChoice, UserChoiceCounter, \
+    DailyChoiceCount, UserState
+
+# Строка статистики: (значение выбора, количество, трактовка)
+CountRow = Tuple[Union[str, int], int, str]
+
+_STAT_MODELS = {
+    "time": (TimeSelection, TimeChoice, TimeChoice.choice, TimeSelection.time_choice_id),
+    "numbers": (NumberSelection, NumberChoice, NumberChoice.number, NumberSelection.number_choice_id),
+}
+
+
+def choice_models(stat_type: str):
+    """Возвращает (таблица выборов, справочник, колонка значения, колонка ссылки на справочник)."""
+    models = _STAT_MODELS.get(stat_type)
+    if models is None:
+        raise ValueError(f"Неизвестный тип статистики: {stat_type}")
+    return models
+
+
+_USER_ID_BY_TG_ID = select(User.id).where(User.tg_id == bindparam('tg_id'))
+_USER_IDS_BY_TG_IDS = select(User.tg_id, User.id).where(User.tg_id.in_(bindparam('tg_ids', expanding=True)))
+_USER_STATE_DATA = select(UserState.data).where(UserState.chat_id == bindparam('chat_id'),
+                                                UserState.expires_at > bindparam('now'))
+
+
+def user_id_by_tg_id(session: Session, tg_id: int) -> Optional[int]:
+    return session.connection().execute(_USER_ID_BY_TG_ID, {'tg_id': tg_id}).scalar()
+
+
+def user_ids_by_tg_ids(session: Session, tg_ids: Iterable[int]) -> Dict[int, int]:
+    return dict(session.connection().execute(_USER_IDS_BY_TG_IDS, {'tg_ids': list(tg_ids)}).all())
+
+
+def user_state_data(session: Session, chat_id: int, now: datetime) -> Optional[str]:
+    return session.connection().execute(_USER_STATE_DATA, {'chat_id': chat_id, 'now': now}).scalar()
+
+
+@functools.lru_cache(maxsize=None)
+def _choice_counts_stmt(stat_type: str, has_start: bool, end_mode: Optional[str]):
+    """end_mode: None — без конца промежутка, 'inclusive' или 'exclusive'."""
+    selection, choice, value, choice_id = choice_models(stat_type)
+    count = func.count().label("count")
+    stmt = (
+        select(value, count, choice.interpretation)
+        .select_from(selection)
+        .join(choice, choice_id == choice.id)
+        .where(selection.user_id == bindparam('user_id'))
+    )
+    if has_start:
+        stmt = stmt.where(selection.timestamp >= bindparam('start_date'))
+    if end_mode == 'inclusive':
+        stmt = stmt.where(selection.timestamp <= bindparam('end_date'))
+    elif end_mode == 'exclusive':
+        stmt = stmt.where(selection.timestamp < bindparam('end_date'))
+    return stmt.group_by(choice.id, value, choice.interpretation).order_by(count.desc(), value)
+
+
+def choice_counts(session: Session, user_id: int, stat_type: str, start_date: Optional[datetime] = None,
+                  end_date: Optional[datetime] = None, end_inclusive: bool = True) -> List[CountRow]:
+    """Выборы пользователя по сырым записям (без дневных агрегатов), сгруппированные по значению."""
+    end_mode = None if end_date is None else 'inclusive' if end_inclusive else 'exclusive'
+    stmt = _choice_counts_stmt(stat_type, start_date is not None, end_mode)
+    params = {'user_id': user_id, 'start_date': start_date, 'end_date': end_date}
+    return [(row[0], row[1], row[2]) for row in session.connection().execute(stmt, params)]
+
+
+@functools.lru_cache(maxsize=None)
+def _range_counts_stmt(stat_type: str):
+    """
+    Статистика за промежуток: целые дни из daily_choice_counts и сырые выборы неполных крайних дней
+    [head_start, head_end) и [tail_start, tail_end]. Пустой крайний промежуток стоит одного поиска по индексу.
+    """
+    selection, choice, value, choice_id = choice_models(stat_type)
+    user_id = bindparam('user_id')
+    parts = union_all(
+        select(DailyChoiceCount.choice_id.label("choice_id"), DailyChoiceCount.count.label("count"))
+        .where(DailyChoiceCount.user_id == user_id,
+               DailyChoiceCount.kind == stat_type,
+               DailyChoiceCount.day >= bindparam('first_day'),
+               DailyChoiceCount.day <= bindparam('last_day')),
+        select(choice_id.label("choice_id"), func.count().label("count"))
+        .where(selection.user_id == user_id,
+               selection.timestamp >= bindparam('head_start'),
+               selection.timestamp < bindparam('head_end'))
+        .group_by(choice_id),
+        select(choice_id.label("choice_id"), func.count().label("count"))
+        .where(selection.user_id == user_id,
+               selection.timestamp >= bindparam('tail_start'),
+               selection.timestamp <= bindparam('tail_end'))
+        .group_by(choice_id),
+    ).subquery()
+
+    total = func.sum(parts.c.count).label("count")
+    return (
+        select(value, total, choice.interpretation)
+        .select_from(parts)
+        .join(choice, parts.c.choice_id == choice.id)
+        .group_by(choice.id, value, choice.interpretation)
+        .having(total > 0)
+        .order_by(total.desc(), value)
+    )
+
+
+def range_counts(session: Session, user_id: int, stat_type: str, first_day: date, last_day: date,
+                 head: Tuple[datetime, datetime], tail: Tuple[datetime, datetime]) -> List[CountRow]:
+    """
+    Выборы за промежуток одним запросом (см. aggregate_range_counts).
+
+    :param first_day: Первый целый день (дневные агрегаты)
+    :param last_day: Последний целый день
+    :param head: Неполный начальный день [начало, конец)
+    :param tail: Неполный последний день [начало, конец]
+    """
+    params = {'user_id': user_id, 'first_day': first_day, 'last_day': last_day,
+              'head_start': head[0], 'head_end': head[1], 'tail_start': tail[0], 'tail_end': tail[1]}
+    rows = session.connection().execute(_range_counts_stmt(stat_type), params)
+    return [(row[0], int(row[1]), row[2]) for row in rows]
+
+
+@functools.lru_cache(maxsize=None)
+def _all_time_counts_stmt(stat_type: str):
+    _, choice, value, _ = choice_models(stat_type)
+    return (
+        select(value, UserChoiceCounter.count, choice.interpretation)
+        .select_from(UserChoiceCounter)
+        .join(choice, UserChoiceCounter.choice_id == choice.id)
+        .where(UserChoiceCounter.user_id == bindparam('user_id'),
+               UserChoiceCounter.kind == stat_type,
+               UserChoiceCounter.count > 0)
+        .order_by(UserChoiceCounter.count.desc(), value)
+    )
+
+
+def all_time_counts(session: Session, user_id: int, stat_type: str) -> List[CountRow]:
+    """Статистика за всё время из user_choice_counters (см. fetch_all_time_counts)."""
+    rows = session.connection().execute(_all_time_counts_stmt(stat_type), {'user_id': user_id})
+    return [(row[0], row[1], row[2]) for row in rows]
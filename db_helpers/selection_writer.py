@@ -0,0 +1,234 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from config import Config
+from db_helpers.models import SessionLocal
+from db_helpers.selections import SelectionEvent, save_selection_batch
+
+logger = logging.getLogger(__name__)
+
+
+class SelectionWriter:
+    """
+    Отложенная запись выборов пользователей (write-behind).
+
+    Обработчик кнопки только ставит выбор в очередь и сразу отвечает пользователю. Фоновый поток
+    собирает выборы в пакеты — не больше max_batch штук или то, что накопилось за flush_interval
+    секунд — и записывает каждый пакет одной транзакцией с одним коммитом.
+
+    Чтение статистики должно видеть собственные выборы пользователя: перед запросом вызывается
+    flush(tg_id), который ждёт записи только если у этого пользователя есть незаписанные выборы.
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal, max_batch: int = 200,
+                 flush_interval: float = 0.05):
+        """
+        :param session_factory: Фабрика синхронных сессий SQLAlchemy
+        :param max_batch: Максимум выборов в одной транзакции
+        :param flush_interval: Сколько секунд первый выбор пакета может ждать записи
+        """
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+
+        self._cond = threading.Condition()
+        self._events: Deque[Tuple[int, SelectionEvent]] = deque()
+        self._first_event_at: Optional[float] = None
+        self._flush_requested = False
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        # Порядковые номера: последний принятый, последний записанный и последний принятый по пользователю
+        self._submitted_seq = 0
+        self._written_seq = 0
+        self._user_seq: Dict[int, int] = {}
+
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+        self._last_batch_seconds = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="selection-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, tg_id: int, username: Optional[str], kind: str, choice_id: int):
+        """
+        Ставит выбор пользователя в очередь на запись.
+
+        :param tg_id: Telegram ID пользователя
+        :param username: Имя пользователя в Telegram
+        :param kind: Вид выбора ('time' или 'numbers')
+        :param choice_id: ID записи справочника
+        """
+        event = SelectionEvent(tg_id, username, kind, choice_id)
+        with self._cond:
+            running = self._running
+            if running:
+                self._enqueue(event)
+        if not running:
+            # Запись уже остановлена (завершение работы): пишем сразу, чтобы не потерять выбор
+            self._write([event])
+
+    def _enqueue(self, event: SelectionEvent):
+        self._submitted_seq += 1
+        self._events.append((self._submitted_seq, event))
+        self._user_seq[event.tg_id] = self._submitted_seq
+        if self._first_event_at is None:
+            self._first_event_at = time.monotonic()
+        if len(self._events) >= self.max_batch or len(self._events) == 1:
+            self._cond.notify_all()
+
+    def has_pending(self, tg_id: Optional[int] = None) -> bool:
+        """True, если есть незаписанные выборы (пользователя tg_id или вообще)."""
+        with self._cond:
+            target = self._submitted_seq if tg_id is None else self._user_seq.get(tg_id, 0)
+            return target > self._written_seq
+
+    def flush(self, tg_id: Optional[int] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Дожидается записи выборов, принятых до вызова.
+
+        :param tg_id: Telegram ID пользователя (None — все выборы)
+        :param timeout: Максимальное время ожидания в секундах (None — без ограничения)
+        :return: False, если выборы не успели записаться за timeout
+        """
+        with self._cond:
+            target = self._submitted_seq if tg_id is None else self._user_seq.get(tg_id, 0)
+            if target <= self._written_seq:
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._written_seq >= target, timeout)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Записывает всё, что осталось в очереди, и останавливает фоновый поток."""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+            thread = self._thread
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning("Не все выборы записаны за %s с, в очереди: %s", timeout, len(self._events))
+        else:
+            logger.info("Запись выборов остановлена: %s", self.stats())
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                'queued': len(self._events),
+                'written': self._written,
+                'failed': self._failed,
+                'batches': self._batches,
+                'last_batch_seconds': round(self._last_batch_seconds, 4),
+            }
+
+    def _next_batch(self) -> List[Tuple[int, SelectionEvent]]:
+        """Ждёт, пока наберётся пакет, истечёт flush_interval или кто-то попросит записать очередь."""
+        with self._cond:
+            while not self._events and self._running:
+                self._cond.wait()
+            while self._running and not self._flush_requested and len(self._events) < self.max_batch:
+                remaining = self._first_event_at + self.flush_interval - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = [self._events.popleft() for _ in range(min(self.max_batch, len(self._events)))]
+            # Оставшиеся в очереди выборы уже отождали своё и уйдут следующим пакетом без паузы
+            if not self._events:
+                self._first_event_at = None
+                self._flush_requested = False
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                # Очередь пуста, а запись остановлена
+                return
+
+            started = time.perf_counter()
+            written = self._write([event for _, event in batch])
+            elapsed = time.perf_counter() - started
+
+            last_seq = batch[-1][0]
+            with self._cond:
+                self._written_seq = last_seq
+                for _, event in batch:
+                    if self._user_seq.get(event.tg_id, 0) <= last_seq:
+                        self._user_seq.pop(event.tg_id, None)
+                self._written += written
+                self._failed += len(batch) - written
+                self._batches += 1
+                self._last_batch_seconds = elapsed
+                self._cond.notify_all()
+
+    def _write(self, events: List[SelectionEvent]) -> int:
+        """
+        Записывает пакет одной транзакцией. Если пакет не записался, пишет выборы по одному,
+        чтобы одна ошибочная запись не потеряла остальные.
+
+        :return: Количество записанных выборов
+        """
+        try:
+            with self.session_factory() as session:
+                save_selection_batch(session, events)
+                session.commit()
+            return len(events)
+        except Exception as e:
+            if len(events) == 1:
+                logger.error("Не удалось записать выбор %s: %s", events[0], e, exc_info=True)
+                return 0
+            logger.warning("Не удалось записать пакет из %s выборов, пишем по одному: %s", len(events), e)
+        return sum(self._write([event]) for event in events)
+
+
+_selection_writer: Optional[SelectionWriter] = None
+_selection_writer_lock = threading.Lock()
+
+
+def get_selection_writer() -> SelectionWriter:
+    """Возвращает общий SelectionWriter, запуская его фоновый поток при первом обращении."""
+    global _selection_writer
+    if _selection_writer is None:
+        with _selection_writer_lock:
+            if _selection_writer is None:
+                writer = SelectionWriter(max_batch=Config.SELECTION_BATCH_SIZE,
+                                         flush_interval=Config.SELECTION_FLUSH_INTERVAL)
+                writer.start()
+                _selection_writer = writer
+                # Страховка для завершения без обработчика сигналов (скрипты, sys.exit):
+                # повторный stop() после штатной остановки ничего не делает
+                atexit.register(stop_selection_writer, Config.UPDATE_DRAIN_TIMEOUT)
+    return _selection_writer
+
+
+def submit_selection(tg_id: int, username: Optional[str], kind: str, choice_id: int):
+    get_selection_writer().submit(tg_id, username, kind, choice_id)
+
+
+def wait_for_selections(tg_id: int):
+    """
+    Перед чтением статистики дожидается записи выборов пользователя (read-your-writes).
+    Если незаписанных выборов нет, возвращается сразу.
+    """
+    if _selection_writer is not None and _selection_writer.has_pending(tg_id):
+        if not _selection_writer.flush(tg_id, Config.SELECTION_FLUSH_TIMEOUT):
+            logger.warning("Выборы пользователя %s не записаны за %s с", tg_id, Config.SELECTION_FLUSH_TIMEOUT)
+
+
+def stop_selection_writer(timeout: Optional[float] = None):
+    """Записывает оставшиеся выборы при завершении работы бота."""
+    if _selection_writer is not None:
+        _selection_writer.stop(timeout)
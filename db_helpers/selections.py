@@ -0,0 +1,175 @@
+import argparse
+import logging
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from config import setup_logging
+from db_helpers.models import SessionLocal, TimeSelection, NumberSelection, UserChoiceCounter, DailyChoiceCount, \
+    upsert_insert
+from db_helpers.users import get_or_create_user_ids
+
+logger = logging.getLogger(__name__)
+
+KIND_TIME = 'time'
+KIND_NUMBERS = 'numbers'
+
+# Таблица выборов и колонка со ссылкой на справочник для каждого вида
+SELECTION_MODELS = {
+    KIND_TIME: (TimeSelection, TimeSelection.time_choice_id),
+    KIND_NUMBERS: (NumberSelection, NumberSelection.number_choice_id),
+}
+
+
+def increment_choice_counters(session: Session, counts: Mapping[Tuple[int, str, int], int]):
+    """
+    Увеличивает счётчики выборов одним INSERT ... ON CONFLICT DO UPDATE на пакет строк.
+
+    :param session: Сессия SQLAlchemy (изменение попадёт в её транзакцию)
+    :param counts: (ID пользователя, вид выбора, ID записи справочника) -> на сколько увеличить
+    """
+    if not counts:
+        return
+    stmt = upsert_insert(session)(UserChoiceCounter)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserChoiceCounter.user_id, UserChoiceCounter.kind, UserChoiceCounter.choice_id],
+        set_={'count': UserChoiceCounter.count + stmt.excluded.count},
+    )
+    session.execute(stmt, [
+        {'user_id': user_id, 'kind': kind, 'choice_id': choice_id, 'count': amount}
+        for (user_id, kind, choice_id), amount in counts.items()
+    ])
+
+
+def increment_daily_counts(session: Session, counts: Mapping[Tuple[int, date, str, int], int]):
+    """
+    Увеличивает дневные агрегаты одним INSERT ... ON CONFLICT DO UPDATE на пакет строк.
+
+    :param session: Сессия SQLAlchemy (изменение попадёт в её транзакцию)
+    :param counts: (ID пользователя, день, вид выбора, ID записи справочника) -> на сколько увеличить
+    """
+    if not counts:
+        return
+    stmt = upsert_insert(session)(DailyChoiceCount)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyChoiceCount.user_id, DailyChoiceCount.kind, DailyChoiceCount.day,
+                        DailyChoiceCount.choice_id],
+        set_={'count': DailyChoiceCount.count + stmt.excluded.count},
+    )
+    session.execute(stmt, [
+        {'user_id': user_id, 'day': day, 'kind': kind, 'choice_id': choice_id, 'count': amount}
+        for (user_id, day, kind, choice_id), amount in counts.items()
+    ])
+
+
+@dataclass(frozen=True)
+class SelectionEvent:
+    """Выбор пользователя, ещё не записанный в БД. Время фиксируется в момент нажатия, а не записи."""
+    tg_id: int
+    username: Optional[str]
+    kind: str
+    choice_id: int
+    timestamp: datetime = field(default_factory=datetime.now)
+
+
+def save_selection_batch(session: Session, events: Sequence[SelectionEvent]):
+    """
+    Записывает пакет выборов: пользователи ищутся одним запросом, выборы вставляются
+    многострочным INSERT по каждому виду, счётчики и дневные агрегаты суммируются заранее
+    и обновляются одним upsert на таблицу. Коммит остаётся за вызывающим кодом.
+
+    :param session: Сессия SQLAlchemy
+    :param events: Выборы пользователей
+    """
+    for event in events:
+        if event.kind not in SELECTION_MODELS:
+            raise ValueError(f"Неизвестный вид выбора: {event.kind}")
+
+    user_ids = get_or_create_user_ids(session, {event.tg_id: event.username for event in events})
+
+    rows = {kind: [] for kind in SELECTION_MODELS}
+    counters, daily = Counter(), Counter()
+    for event in events:
+        user_id = user_ids[event.tg_id]
+        _, choice_column = SELECTION_MODELS[event.kind]
+        rows[event.kind].append({'id': uuid.uuid4(), choice_column.key: event.choice_id, 'user_id': user_id,
+                                 'timestamp': event.timestamp})
+        counters[user_id, event.kind, event.choice_id] += 1
+        daily[user_id, event.timestamp.date(), event.kind, event.choice_id] += 1
+
+    for kind, kind_rows in rows.items():
+        if kind_rows:
+            session.execute(insert(SELECTION_MODELS[kind][0]), kind_rows)
+    increment_choice_counters(session, counters)
+    increment_daily_counts(session, daily)
+
+
+def backfill_choice_counters(session: Session):
+    """
+    Пересчитывает user_choice_counters по уже сохранённым выборам.
+
+    :param session: Сессия SQLAlchemy
+    :return: Количество записанных счётчиков
+    """
+    session.execute(delete(UserChoiceCounter))
+    total = 0
+    for kind, (model, choice_column) in SELECTION_MODELS.items():
+        source = (
+            select(model.user_id, literal(kind), choice_column, func.count())
+            .where(choice_column.is_not(None))
+            .group_by(model.user_id, choice_column)
+        )
+        result = session.execute(
+            insert(UserChoiceCounter).from_select(
+                ['user_id', 'kind', 'choice_id', 'count'], source)
+        )
+        total += result.rowcount or 0
+    return total
+
+
+def backfill_daily_counts(session: Session):
+    """
+    Пересчитывает daily_choice_counts по уже сохранённым выборам.
+
+    :param session: Сессия SQLAlchemy
+    :return: Количество записанных дневных агрегатов
+    """
+    session.execute(delete(DailyChoiceCount))
+    total = 0
+    for kind, (model, choice_column) in SELECTION_MODELS.items():
+        day = func.date(model.timestamp)
+        source = (
+            select(model.user_id, day, literal(kind), choice_column, func.count())
+            .where(choice_column.is_not(None), model.timestamp.is_not(None))
+            .group_by(model.user_id, day, choice_column)
+        )
+        result = session.execute(
+            insert(DailyChoiceCount).from_select(
+                ['user_id', 'day', 'kind', 'choice_id', 'count'], source)
+        )
+        total += result.rowcount or 0
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание агрегатов по выборам пользователей")
+    parser.add_argument('command', choices=['backfill'],
+                        help="backfill — пересчитать счётчики и дневные агрегаты по истории")
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.command == 'backfill':
+        with SessionLocal() as session:
+            counters = backfill_choice_counters(session)
+            daily = backfill_daily_counts(session)
+            session.commit()
+        logger.info("Счётчики выборов пересчитаны: %s записей, дневных агрегатов: %s", counters, daily)
+
+
+if __name__ == '__main__':
+    main()
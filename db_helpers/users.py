@@ -0,0 +1,155 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Mapping, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import Config
+from db_helpers.models import User, upsert_insert
+from db_helpers.queries import user_id_by_tg_id, user_ids_by_tg_ids
+
+logger = logging.getLogger(__name__)
+
+# Ключ в session.info: пользователи, созданные в текущей транзакции сессии
+_NEW_USERS_KEY = 'new_user_ids'
+
+
+class UserIdCache:
+    """
+    Ограниченный LRU-кэш tg_id -> users.id. Пользователи не удаляются и tg_id не меняется,
+    поэтому записи не устаревают и вытесняются только по размеру.
+    """
+
+    def __init__(self, max_size: int = 100000):
+        """
+        :param max_size: Максимальное количество пользователей в кэше
+        """
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tg_id: int) -> Optional[int]:
+        with self._lock:
+            user_id = self._ids.get(tg_id)
+            if user_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._ids.move_to_end(tg_id)
+            return user_id
+
+    def put(self, tg_id: int, user_id: int):
+        with self._lock:
+            self._ids[tg_id] = user_id
+            self._ids.move_to_end(tg_id)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._ids), 'hits': self.hits, 'misses': self.misses}
+
+
+user_id_cache = UserIdCache(Config.USER_CACHE_SIZE)
+
+
+@event.listens_for(Session, 'after_commit')
+def _cache_committed_users(session: Session):
+    """Созданные пользователи попадают в кэш только после коммита, иначе откат оставил бы в нём несуществующий ID."""
+    for tg_id, user_id in session.info.pop(_NEW_USERS_KEY, {}).items():
+        user_id_cache.put(tg_id, user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_users(session: Session):
+    session.info.pop(_NEW_USERS_KEY, None)
+
+
+def find_user_id(session: Session, tg_id: int) -> Optional[int]:
+    """
+    Ищет пользователя по Telegram ID, сначала в кэше.
+
+    :param session: Сессия SQLAlchemy
+    :param tg_id: Telegram ID пользователя
+    :return: ID пользователя в таблице users или None
+    """
+    user_id = user_id_cache.get(tg_id)
+    if user_id is not None:
+        return user_id
+
+    user_id = user_id_by_tg_id(session, tg_id)
+    if user_id is not None:
+        # Пользователь, созданный в ещё не закоммиченной транзакции, закэшируется после коммита
+        if tg_id not in session.info.get(_NEW_USERS_KEY, {}):
+            user_id_cache.put(tg_id, user_id)
+    return user_id
+
+
+def _insert_user(session: Session, tg_id: int, username: Optional[str]) -> int:
+    """
+    Создаёт пользователя через INSERT ... ON CONFLICT (tg_id) DO NOTHING. Если параллельный
+    запрос успел создать его раньше, возвращает ID уже существующей записи.
+    """
+    stmt = (upsert_insert(session)(User)
+            .values(tg_id=tg_id, username=username)
+            .on_conflict_do_nothing(index_elements=[User.tg_id])
+            .returning(User.id))
+    user_id = session.execute(stmt).scalar()
+    if user_id is None:
+        return user_id_by_tg_id(session, tg_id)
+
+    session.info.setdefault(_NEW_USERS_KEY, {})[tg_id] = user_id
+    logger.info("Создан новый пользователь: %s, tg_id: %s", user_id, tg_id)
+    return user_id
+
+
+def get_or_create_user_id(session: Session, tg_id: int, username: Optional[str]) -> int:
+    """
+    Возвращает ID пользователя, создавая его при первом обращении.
+    Новый пользователь создаётся в транзакции сессии, коммит остаётся за вызывающим кодом.
+
+    :param session: Сессия SQLAlchemy
+    :param tg_id: Telegram ID пользователя
+    :param username: Имя пользователя в Telegram
+    :return: ID пользователя в таблице users
+    """
+    user_id = find_user_id(session, tg_id)
+    if user_id is not None:
+        return user_id
+    return _insert_user(session, tg_id, username)
+
+
+def get_or_create_user_ids(session: Session, users: Mapping[int, Optional[str]]) -> Dict[int, int]:
+    """
+    Пакетный вариант get_or_create_user_id: пользователей, которых нет в кэше, ищет одним запросом.
+
+    :param session: Сессия SQLAlchemy
+    :param users: Telegram ID -> имя пользователя
+    :return: Telegram ID -> ID пользователя в таблице users
+    """
+    user_ids = {}
+    for tg_id in users:
+        user_id = user_id_cache.get(tg_id)
+        if user_id is not None:
+            user_ids[tg_id] = user_id
+
+    missing = [tg_id for tg_id in users if tg_id not in user_ids]
+    if missing:
+        pending = session.info.get(_NEW_USERS_KEY, {})
+        for tg_id, user_id in user_ids_by_tg_ids(session, missing).items():
+            user_ids[tg_id] = user_id
+            if tg_id not in pending:
+                user_id_cache.put(tg_id, user_id)
+
+    for tg_id, username in users.items():
+        if tg_id not in user_ids:
+            user_ids[tg_id] = _insert_user(session, tg_id, username)
+    return user_ids
@@ -0,0 +1,33 @@
+import functools
+import logging
+
+from telebot.async_telebot import AsyncTeleBot
+
+from handlers.flows import CALLBACK_FLOWS
+from utils.async_runtime import run_blocking
+from utils.callback_codec import CallbackRouter
+from utils.navigation import answer_callback_async, deliver_async, OUTDATED_BUTTON_TEXT
+
+logger = logging.getLogger(__name__)
+
+
+def async_callback_handler(bot: AsyncTeleBot, flow, error_text: str):
+    """Асинхронный аналог callback_handler: логика с обращениями к БД выполняется вне цикла событий."""
+    @functools.wraps(flow)
+    async def handler(call, *args):
+        await answer_callback_async(bot, call)
+        try:
+            await deliver_async(bot, call.message.chat.id, await run_blocking(flow, call, *args), call)
+        except Exception as e:
+            logger.error("Ошибка в %s: %s", flow.__name__, e, exc_info=True)
+            await bot.send_message(call.message.chat.id, error_text)
+
+    return handler
+
+
+def register_async_callback_handlers(bot: AsyncTeleBot):
+    """Асинхронный аналог register_callback_handlers для AsyncTeleBot."""
+    router = CallbackRouter(on_unknown=lambda call: answer_callback_async(bot, call, OUTDATED_BUTTON_TEXT))
+    for actions, flow, error_text in CALLBACK_FLOWS:
+        router.route(*actions)(async_callback_handler(bot, flow, error_text))
+    router.attach_async(bot)
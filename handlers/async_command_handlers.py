@@ -0,0 +1,22 @@
+import functools
+
+from telebot.async_telebot import AsyncTeleBot
+
+from handlers.flows import COMMAND_FLOWS
+from utils.async_runtime import run_blocking
+from utils.navigation import deliver_async
+
+
+def async_command_handler(bot: AsyncTeleBot, flow):
+    """Асинхронный аналог command_handler: логика с обращениями к БД выполняется вне цикла событий."""
+    @functools.wraps(flow)
+    async def handler(message):
+        await deliver_async(bot, message.chat.id, await run_blocking(flow, message))
+
+    return handler
+
+
+def register_async_command_handlers(bot: AsyncTeleBot):
+    """Асинхронный аналог register_command_handlers для AsyncTeleBot."""
+    for command, flow in COMMAND_FLOWS:
+        bot.register_message_handler(async_command_handler(bot, flow), commands=[command])
@@ -0,0 +1,324 @@
+"""
+Логика команд и кнопок, общая для обоих режимов бота (BOT_RUNTIME=sync и async).
+
+Функции здесь синхронные и ничего не отправляют: они работают с состоянием, каталогом и БД
+и возвращают список ответов (utils.navigation.Send, Screen, Markup, Parts). Отправляет их тонкий
+слой конкретного режима: синхронный — сразу, асинхронный — вызывая функцию в пуле потоков
+utils.async_runtime, чтобы обращения к БД не блокировали цикл событий.
+"""
+import logging
+from datetime import datetime
+
+from db_helpers.catalog import get_catalog
+from db_helpers.models import SessionLocal, ReadSessionLocal
+from db_helpers.selection_writer import submit_selection
+from db_helpers.selections import KIND_TIME, KIND_NUMBERS
+from db_helpers.users import get_or_create_user_id
+from states import clear_user_state, set_user_state, get_user_state, STATE_AWAITING_START_DATE, \
+    STATE_AWAITING_END_DATE, STATE_AWAITING_PREDEFINED_RANGE, STATE_AWAITING_STAT_TYPE
+from utils.callback_codec import ACTION_ADD_MORE, ACTION_ALL_STAT, ACTION_BACK, ACTION_CALENDAR_DAY, \
+    ACTION_CALENDAR_NEXT, ACTION_CALENDAR_PREV, ACTION_IGNORE, ACTION_LIST, ACTION_NUMBER, ACTION_STAT_RANGE, \
+    ACTION_STAT_TYPE, ACTION_TIME_CHOICE, ACTION_TIME_RANGE
+from utils.inline_calendar import TelegramCalendar
+from utils.keyboards import time_range_keyboard, time_choice_keyboard, number_choice_keyboard, list_type_keyboard, \
+    all_stat_type_keyboard, stat_type_keyboard, stat_range_keyboard, add_more_keyboard
+from utils.list_pages import get_list_pages
+from utils.message_utils import split_long_message
+from utils.navigation import Send, Screen, Markup, Parts
+from utils.stat_utils import fetch_stat_for_time_range, build_all_time_stat_message, get_predefined_range
+
+calendar_instance = TelegramCalendar(locale="ru")
+
+logger = logging.getLogger(__name__)
+
+WELCOME_MESSAGE = (
+    "Этот бот поможет тебе записывать знаки Вселенной.\n\n"
+    "<b>Всякий раз, когда ты видишь время, определенное сочетание цифр — это подсказка.</b>\n"
+    "Если на протяжении долгого времени тебе раз за разом попадается одно и то же время, минимум 3 раза"
+    "— это подсказка прямо в лоб.\n\n"
+    "<b>Команды</b>\n"
+    "<b>/time</b> — Добавить временной знак.\n"
+    "<b>/number</b> — Добавить числовой знак.\n"
+    "<b>/stat_range</b> — Посмотреть статистику в промежутке (время/числа).\n"
+    "<b>/all_stat</b> — Общая статистика (время/числа).\n"
+    "<b>/list</b> — Полный список временных знаков (время/числа).\n\n"
+    "Подписывайтесь на открытые каналы:\n"
+    "<a href='https://t.me/strong_mvp'>Артём ВВШ</a>\n"
+    "<a href='https://t.me/arsenmarkarian'>Главком</a>\n\n"
+    "Автор бота — <a href='https://t.me/smthng_hero'>Leon</a>"
+)
+
+
+# ————— Команды —————
+
+def send_welcome(message):
+    logger.debug("————— /start —————")
+    with SessionLocal() as session:
+        get_or_create_user_id(session, message.from_user.id, message.from_user.username)
+        session.commit()
+
+    return [Send(WELCOME_MESSAGE, parse_mode="HTML", disable_web_page_preview=True)]
+
+
+def send_time_ranges(message):
+    return [Send("Выберите временной промежуток:", reply_markup=time_range_keyboard())]
+
+
+def send_number_choices(message):
+    return [Send("Выберите цифровое значение:", reply_markup=number_choice_keyboard())]
+
+
+def list_command(message):
+    return [Send("Выберите что хотите посмотреть:", reply_markup=list_type_keyboard())]
+
+
+def all_stat_command(message):
+    return [Send("Выберите тип статистики:", reply_markup=all_stat_type_keyboard())]
+
+
+def stat_time_range(message):
+    set_user_state(message.chat.id, STATE_AWAITING_STAT_TYPE)
+    return [Send("Выберите тип статистики:", reply_markup=stat_type_keyboard())]
+
+
+# Команда -> обработчик
+COMMAND_FLOWS = (
+    ('start', send_welcome),
+    ('time', send_time_ranges),
+    ('number', send_number_choices),
+    ('list', list_command),
+    ('all_stat', all_stat_command),
+    ('stat_range', stat_time_range),
+)
+
+
+# ————— Кнопки —————
+# Ответ на нажатие (answer_callback) отправляет слой режима до вызова обработчика
+
+def process_time_range(call, time_range_id):
+    logger.debug("Выбран временной промежуток: %s, пользователь: %s", time_range_id, call.from_user.id)
+
+    markup = time_choice_keyboard(time_range_id)  # Кнопки для выбора времени из реестра
+    if not markup:
+        logger.warning("Не найдены временные варианты для промежутка %s", time_range_id)
+        return [Send("Временные варианты не найдены.")]
+    return [Screen("Выберите время:", reply_markup=markup)]
+
+
+def process_time_choice(call, time_range_id, time_choice_id):
+    logger.debug("Выбрано время: %s, пользователь: %s", time_choice_id, call.from_user.id)
+
+    time_choice = get_catalog().get_time_choice(time_choice_id)
+    if time_choice is None:
+        logger.warning("Выбор времени не найден: %s", time_choice_id)
+        return [Send("Выбор времени не найден.")]
+
+    # Ставим выбор в очередь на запись: пользователь и счётчики обновятся вместе с пакетом
+    submit_selection(call.from_user.id, call.from_user.username or "Unknown", KIND_TIME, time_choice.id)
+    logger.debug("Принят выбор времени: %s от пользователя %s", time_choice.choice, call.from_user.id)
+
+    return [Screen(f"<b>{time_choice.choice}</b>: {time_choice.interpretation}",
+                   reply_markup=add_more_keyboard(), parse_mode='HTML')]
+
+
+def _time_ranges(call, edit: bool):
+    logger.debug("Пользователь %s выбрал %s", call.from_user.id, call.data)
+    if not get_catalog().time_ranges:
+        logger.warning("Временные промежутки не найдены в БД")
+        return [Send("Временные промежутки не найдены.")]
+
+    reply = Screen if edit else Send
+    return [reply("Выберите временной промежуток:", reply_markup=time_range_keyboard())]
+
+
+def go_back(call):
+    return _time_ranges(call, edit=True)
+
+
+def add_more(call):
+    # Сообщение с трактовкой остаётся в чате, выбор начинается в новом
+    return _time_ranges(call, edit=False)
+
+
+def ignore_button(call):
+    # Заголовок и пустые клетки календаря: достаточно ответа на нажатие
+    return []
+
+
+def handle_calendar_callback(call, *args):
+    user_id = call.message.chat.id
+    state = get_user_state(user_id) or {}
+    logger.debug("Календарный колбэк: %s, пользователь: %s, состояние: %s", call.data, user_id, state)
+
+    # Извлекаем текущий год и месяц из состояния пользователя, если они есть
+    current_year = state.get("year", datetime.now().year)
+    current_month = state.get("month", datetime.now().month)
+
+    calendar_response = calendar_instance.handle_callback(call.data, current_year, current_month)
+    if not calendar_response:
+        logger.error("Не удалось обработать коллбэк календаря.")
+        return [Send("Произошла ошибка при работе с календарем.")]
+
+    year, month, day = calendar_response
+
+    # Если выбран день
+    if day is not None:
+        selected_date = datetime(year, month, day)
+        logger.debug("Выбрана дата: %04d-%02d-%02d", year, month, day)
+
+        if not state:
+            logger.warning("Состояние отсутствует для пользователя %s", user_id)
+            return [Send("Пожалуйста, начните выбор даты заново.")]
+
+        if state.get("state") == STATE_AWAITING_START_DATE:
+            # Устанавливаем начальную дату и переходим к выбору конечной
+            set_user_state(user_id, STATE_AWAITING_END_DATE,
+                           {"start_date": selected_date, "year": year, "month": month,
+                            "stat_type": state.get("stat_type")})
+
+            # Тот же календарь переключается на выбор конечной даты
+            return [Screen(f"Начальная дата выбрана: {selected_date.strftime('%Y-%m-%d')}\n"
+                           f"Теперь выберите конечную дату:", reply_markup=calendar_instance.get_markup(year, month))]
+
+        if state.get("state") == STATE_AWAITING_END_DATE:
+            start_date = state.get("start_date")
+            if not start_date:
+                logger.error("Начальная дата не найдена в состоянии пользователя %s", user_id)
+                clear_user_state(user_id)
+                return [Send("Ошибка: начальная дата не найдена. Пожалуйста, начните заново.")]
+
+            start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            end_date = selected_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+            # Если конечная дата меньше начальной, меняем их местами
+            if end_date < start_date:
+                logger.debug("Конечная дата %s меньше начальной %s, меняем местами", end_date, start_date)
+                start_date, end_date = end_date, start_date
+
+            stat_type = state.get('stat_type', 'time')
+            logger.debug("Запрос статистики за период %s - %s, тип: %s", start_date, end_date, stat_type)
+            response = fetch_stat_for_time_range(call.message, start_date, end_date, stat_type)
+
+            # Очищаем состояние и показываем результат вместо календаря
+            clear_user_state(user_id)
+            return [Screen(response, parse_mode='HTML')]
+
+        logger.warning("Неожиданное состояние для пользователя %s: %s", user_id, state)
+        clear_user_state(user_id)
+        return [Send("Пожалуйста, начните процесс выбора даты заново.")]
+
+    # Если переключается месяц
+    if year is not None and month is not None:
+        logger.debug("Переключение календаря на %s-%s", year, month)
+
+        # Обновляем год и месяц в состоянии пользователя
+        state_data = dict(state, year=year, month=month)
+        set_user_state(user_id, state_data.get('state', STATE_AWAITING_START_DATE), state_data)
+
+        return [Markup(calendar_instance.get_markup(year, month))]
+    return []
+
+
+def handle_range_callback(call, range_key):
+    user_id = call.message.chat.id
+    state = get_user_state(user_id)
+    logger.debug("Выбран диапазон статистики: %s, пользователь: %s", call.data, user_id)
+
+    if not state or state.get('state') != STATE_AWAITING_PREDEFINED_RANGE:
+        logger.warning("Неправильное состояние для stat_range: %s", state)
+        return [Send("Пожалуйста, начните заново командой /stat_range.")]
+
+    stat_type = state.get('stat_type', 'time')  # По умолчанию время
+    now = datetime.now()
+
+    if range_key == "calendar":
+        set_user_state(user_id, STATE_AWAITING_START_DATE, {'stat_type': stat_type})
+        logger.debug("Выбор через календарь для пользователя %s", user_id)
+        return [Screen("Выберите начальную дату:", reply_markup=calendar_instance.get_markup(now.year, now.month))]
+
+    date_range = get_predefined_range(range_key, now)
+    if date_range is None:
+        logger.warning("Неизвестный диапазон статистики: %s", range_key)
+        return [Send("Неизвестный выбор. Пожалуйста, попробуйте снова.")]
+
+    start_date, end_date = date_range
+    logger.debug("Выбран промежуток %s: %s - %s", range_key, start_date, end_date)
+
+    response = fetch_stat_for_time_range(call.message, start_date, end_date, stat_type)
+    clear_user_state(user_id)
+    logger.debug("Отправлена статистика за период для пользователя %s", user_id)
+    return [Screen(response, parse_mode='HTML')]
+
+
+def handle_stat_type_selection(call, stat_type):
+    user_id = call.message.chat.id
+    state = get_user_state(user_id)
+    logger.debug("Выбран тип статистики: %s, пользователь: %s", call.data, user_id)
+
+    if not state or state.get('state') != STATE_AWAITING_STAT_TYPE:
+        logger.warning("Неправильное состояние для stat_type: %s", state)
+        return [Send("Пожалуйста, начните заново командой /stat_range.")]
+
+    set_user_state(user_id, STATE_AWAITING_PREDEFINED_RANGE, {'stat_type': stat_type})
+    logger.debug("Запрошен выбор промежутка для типа %s", stat_type)
+
+    # Клавиатура выбора периода берётся из реестра
+    return [Screen("Выберите временной промежуток для статистики:", reply_markup=stat_range_keyboard())]
+
+
+def handle_number_choice(call, number_choice_id):
+    logger.debug("Выбрано число ID: %s, пользователь: %s", number_choice_id, call.from_user.id)
+
+    number_choice = get_catalog().get_number_choice(number_choice_id)
+    if number_choice is None:
+        logger.warning("Число с ID %s не найдено", number_choice_id)
+        return [Send("Неверный выбор.")]
+
+    # Ставим выбор в очередь на запись вместе со счётчиками
+    submit_selection(call.from_user.id, call.from_user.username or "Unknown", KIND_NUMBERS, number_choice.id)
+    logger.debug("Принят выбор числа %s от пользователя %s", number_choice.number, call.from_user.id)
+
+    return [Send(f"Вы выбрали число <b>{number_choice.number}</b>.\n\n"
+                 f"<b>Интерпретация:</b> \n{number_choice.interpretation}", parse_mode='HTML')]
+
+
+def handle_all_stat_selection(call, stat_type):
+    logger.debug("Запрошена полная статистика типа %s, пользователь: %s", stat_type, call.from_user.id)
+
+    with ReadSessionLocal() as session:
+        response, notice = build_all_time_stat_message(session, call.message.chat.id, stat_type)
+
+    if notice:
+        return [Screen(notice)]
+
+    logger.debug("Отправлена полная статистика %s для пользователя %s", stat_type, call.from_user.id)
+    return [Parts(split_long_message(response, 'HTML'), parse_mode='HTML')]
+
+
+def handle_list_selection(call, list_type):
+    logger.debug("Запрошен список трактовок типа %s, пользователь: %s", list_type, call.from_user.id)
+
+    pages = get_list_pages(list_type)
+    if pages is None:
+        logger.warning("Неизвестный тип списка трактовок: %s", list_type)
+        return [Send("Произошла ошибка при получении списка трактовок.")]
+
+    logger.debug("Отправлен список трактовок %s", list_type)
+    return [Parts(pages, parse_mode='HTML')]
+
+
+# Действия кнопки -> обработчик и текст ответа на непредвиденную ошибку в нём
+CALLBACK_FLOWS = (
+    ((ACTION_TIME_RANGE,), process_time_range, "Произошла ошибка при обработке запроса."),
+    ((ACTION_TIME_CHOICE,), process_time_choice, "Произошла ошибка при обработке выбора."),
+    ((ACTION_BACK,), go_back, "Произошла ошибка при обработке запроса."),
+    ((ACTION_ADD_MORE,), add_more, "Произошла ошибка при обработке запроса."),
+    ((ACTION_IGNORE,), ignore_button, "Произошла ошибка при обработке запроса."),
+    ((ACTION_CALENDAR_DAY, ACTION_CALENDAR_PREV, ACTION_CALENDAR_NEXT), handle_calendar_callback,
+     "Произошла ошибка при работе с календарем."),
+    ((ACTION_STAT_RANGE,), handle_range_callback, "Произошла ошибка при обработке запроса статистики."),
+    ((ACTION_STAT_TYPE,), handle_stat_type_selection, "Произошла ошибка при выборе типа статистики."),
+    ((ACTION_NUMBER,), handle_number_choice, "Произошла ошибка при обработке выбора числа."),
+    ((ACTION_ALL_STAT,), handle_all_stat_selection, "Произошла ошибка при получении статистики."),
+    ((ACTION_LIST,), handle_list_selection, "Произошла ошибка при получении списка трактовок."),
+)
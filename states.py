@@ -1,7 +1,10 @@
 # states.py
-# Здесь храним состояния пользователей
+# Здесь храним состояния пользователей: в памяти (TTL + LRU) или в БД, см. Config.STATE_BACKEND
 
-user_states = {}
+import threading
+
+from config import Config
+from utils.state_store import StateStore, MemoryStateStore, SqlStateStore
 
 # Возможные состояния
 STATE_AWAITING_START_DATE = "awaiting_start_date"
@@ -9,6 +12,27 @@ STATE_AWAITING_END_DATE = "awaiting_end_date"
 STATE_AWAITING_PREDEFINED_RANGE = "awaiting_predefined_range"
 STATE_AWAITING_STAT_TYPE = 'awaiting_stat_type'
 
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store() -> StateStore:
+    """Возвращает хранилище состояний, создавая его по настройкам при первом вызове."""
+    global _state_store
+    # Обработчики работают в нескольких потоках: хранилище должно быть создано ровно одно
+    with _state_store_lock:
+        if _state_store is None:
+            if Config.STATE_BACKEND == 'db':
+                _state_store = SqlStateStore(ttl=Config.STATE_TTL)
+            else:
+                _state_store = MemoryStateStore(ttl=Config.STATE_TTL, max_size=Config.STATE_MAX_USERS)
+    return _state_store
+
+
+def set_state_store(store: StateStore):
+    """Подменяет хранилище состояний (например, для бенчмарков)."""
+    global _state_store
+    _state_store = store
 
 
 # Функции для работы с состояниями
@@ -19,15 +43,7 @@ def set_user_state(user_id, state, additional_data=None):
     :param state: Новое состояние
     :param additional_data: Дополнительные данные для обновления состояния
     """
-    if user_id not in user_states:
-        user_states[user_id] = {}
-
-    # Обновляем состояние
-    user_states[user_id]['state'] = state
-
-    # Обновляем дополнительные данные, не перезаписывая существующие
-    if additional_data:
-        user_states[user_id].update(additional_data)
+    get_state_store().update(user_id, state, additional_data)
 
 
 def get_user_state(user_id):
@@ -36,7 +52,7 @@ def get_user_state(user_id):
     :param user_id: ID пользователя
     :return: Словарь с состоянием или None, если состояние не установлено
     """
-    return user_states.get(user_id, None)
+    return get_state_store().get(user_id)
 
 
 def clear_user_state(user_id):
@@ -44,5 +60,4 @@ def clear_user_state(user_id):
     Очищает состояние пользователя.
     :param user_id: ID пользователя
     """
-    if user_id in user_states:
-        del user_states[user_id]
+    get_state_store().clear(user_id)
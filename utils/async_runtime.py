@@ -0,0 +1,159 @@
+"""
+Общее для асинхронного режима (BOT_RUNTIME=async): собственный пул потоков для синхронной
+логики обработчиков (handlers.flows) с обращениями к БД и состояниям и очередь обновлений
+каждого пользователя.
+
+Пул по умолчанию у asyncio (asyncio.to_thread) общий для всего процесса и на машине с одним
+ядром состоит из пяти потоков: несколько медленных запросов занимали его целиком, и остальные
+пользователи ждали. Размер отдельного пула задаёт Config.ASYNC_WORKERS.
+"""
+import asyncio
+import contextlib
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class BlockingExecutor:
+    """Пул потоков для блокирующих вызовов из корутин, со счётчиками занятости."""
+
+    def __init__(self, workers: int):
+        """
+        :param workers: Количество потоков
+        """
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='flow')
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.started = 0
+        self.running = 0
+
+    def _call(self, func: Callable, *args):
+        with self._lock:
+            self.started += 1
+            self.running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def run(self, func: Callable, *args):
+        """
+        Выполняет func(*args) в потоке пула, не блокируя цикл событий.
+
+        :return: Результат func
+        """
+        with self._lock:
+            self.submitted += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, func, *args))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "waiting": self.submitted - self.started,
+                "submitted": self.submitted,
+            }
+
+
+_executor: Optional[BlockingExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_blocking_executor() -> BlockingExecutor:
+    """Возвращает общий пул, создавая его по настройкам при первом вызове."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = BlockingExecutor(Config.ASYNC_WORKERS)
+        return _executor
+
+
+async def run_blocking(func: Callable, *args):
+    """Выполняет блокирующую функцию в пуле асинхронного режима."""
+    return await get_blocking_executor().run(func, *args)
+
+
+def stop_blocking_executor():
+    """Дожидается уже запущенных вызовов при завершении работы бота."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
+
+
+class UserLocks:
+    """
+    asyncio.Lock на пользователя. AsyncTeleBot запускает каждое обновление отдельной задачей,
+    и без очереди два быстрых нажатия одного пользователя читали и записывали его состояние
+    одновременно (одно из них терялось). Ожидающие получают блокировку в порядке прихода;
+    блокировки удаляются, когда их никто не держит и не ждёт.
+    """
+
+    def __init__(self):
+        self._locks: Dict[int, List] = {}  # user_id -> [Lock, сколько задач держат или ждут]
+        self.contended = 0
+
+    @contextlib.asynccontextmanager
+    async def hold(self, user_id: int):
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        elif entry[0].locked():
+            self.contended += 1
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._locks),
+            "waiting": sum(count - 1 for _, count in self._locks.values()),
+            "contended": self.contended,
+        }
+
+
+def _serialized(handler, locks: UserLocks):
+    @functools.wraps(handler)
+    async def wrapper(event, *args, **kwargs):
+        user = getattr(event, 'from_user', None)
+        if user is None:
+            return await handler(event, *args, **kwargs)
+        async with locks.hold(user.id):
+            return await handler(event, *args, **kwargs)
+
+    return wrapper
+
+
+def serialize_per_user(bot, locks: UserLocks):
+    """
+    Обработчики сообщений и нажатий AsyncTeleBot выполняются для одного пользователя по очереди,
+    для разных — параллельно (аналог дорожек UpdateDispatcher синхронного режима).
+    Вызывается последней обёрткой, чтобы очередь охватывала и проверку подписки.
+
+    :param bot: Экземпляр AsyncTeleBot
+    :param locks: Блокировки пользователей
+    """
+    for handler in bot.message_handlers + bot.callback_query_handlers:
+        if getattr(handler['function'], '_serialized', False):
+            continue
+        handler['function'] = _serialized(handler['function'], locks)
+        handler['function']._serialized = True
@@ -0,0 +1,207 @@
+import functools
+import logging
+import re
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.metrics import timed_handler
+
+logger = logging.getLogger(__name__)
+
+# Версия формата callback_data. Кнопки с другой версией (в том числе старые строки вида
+# 'time_3_40' из сообщений, отправленных до перехода на кодек) разбираются через _decode_legacy
+CALLBACK_VERSION = '1'
+MAX_CALLBACK_DATA = 64
+
+CHOICE_KINDS = ('time', 'numbers')
+STAT_RANGES = ('this_week', 'last_week', 'this_month', 'calendar')
+
+# Действия: однобуквенный тег и схема аргументов (int — число, кортеж — одно из перечисленных значений)
+ACTION_TIME_RANGE = 'r'
+ACTION_TIME_CHOICE = 't'
+ACTION_BACK = 'b'
+ACTION_ADD_MORE = 'a'
+ACTION_NUMBER = 'n'
+ACTION_CALENDAR_DAY = 'd'
+ACTION_CALENDAR_PREV = 'p'
+ACTION_CALENDAR_NEXT = 'x'
+ACTION_IGNORE = 'i'
+ACTION_STAT_TYPE = 's'
+ACTION_STAT_RANGE = 'g'
+ACTION_ALL_STAT = 'A'
+ACTION_LIST = 'l'
+
+SCHEMA = {
+    ACTION_TIME_RANGE: (int,),
+    ACTION_TIME_CHOICE: (int, int),
+    ACTION_BACK: (),
+    ACTION_ADD_MORE: (),
+    ACTION_NUMBER: (int,),
+    ACTION_CALENDAR_DAY: (int,),
+    ACTION_CALENDAR_PREV: (int, int),
+    ACTION_CALENDAR_NEXT: (int, int),
+    ACTION_IGNORE: (),
+    ACTION_STAT_TYPE: (CHOICE_KINDS,),
+    ACTION_STAT_RANGE: (STAT_RANGES,),
+    ACTION_ALL_STAT: (CHOICE_KINDS,),
+    ACTION_LIST: (CHOICE_KINDS,),
+}
+
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+_PAYLOAD = re.compile(r'(?:[0-9a-z]+(?:\.[0-9a-z]+)*)?')
+
+
+def _to_base36(value: int) -> str:
+    if value < 0:
+        raise ValueError(f"Отрицательное значение в callback_data: {value}")
+    digits = []
+    while True:
+        value, rest = divmod(value, 36)
+        digits.append(_DIGITS[rest])
+        if not value:
+            return ''.join(reversed(digits))
+
+
+def encode(action: str, *args) -> str:
+    """
+    Кодирует нажатие кнопки: версия, тег действия и аргументы в base36 через точку, например '1t3.14'.
+
+    :param action: Тег действия (ACTION_*)
+    :param args: Аргументы по схеме действия
+    :return: Строка для callback_data
+    """
+    schema = SCHEMA[action]
+    if len(args) != len(schema):
+        raise ValueError(f"Действие {action!r} ожидает {len(schema)} аргументов, получено {len(args)}")
+    encoded = [_to_base36(arg if kind is int else kind.index(arg)) for kind, arg in zip(schema, args)]
+    data = CALLBACK_VERSION + action + '.'.join(encoded)
+    if len(data.encode('utf-8')) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data}")
+    return data
+
+
+def _typed_args(action: str, raw_args) -> Optional[tuple]:
+    schema = SCHEMA.get(action)
+    if schema is None or len(raw_args) != len(schema):
+        return None
+    args = []
+    for kind, raw in zip(schema, raw_args):
+        if kind is int:
+            args.append(raw)
+        elif 0 <= raw < len(kind):
+            args.append(kind[raw])
+        else:
+            return None
+    return tuple(args)
+
+
+_LEGACY_PREFIXES = {
+    'range': ACTION_TIME_RANGE,
+    'time': ACTION_TIME_CHOICE,
+    'day': ACTION_CALENDAR_DAY,
+    'prev': ACTION_CALENDAR_PREV,
+    'next': ACTION_CALENDAR_NEXT,
+}
+_LEGACY_ENUMS = {
+    'stat_type': ACTION_STAT_TYPE,
+    'stat_range': ACTION_STAT_RANGE,
+    'all_stat': ACTION_ALL_STAT,
+    'list': ACTION_LIST,
+}
+_LEGACY_SIMPLE = {'back': ACTION_BACK, 'add_more': ACTION_ADD_MORE, 'ignore': ACTION_IGNORE}
+_LEGACY_ENUM_RE = re.compile(r'(stat_type|stat_range|all_stat|list)_(\w+)$')
+
+
+def _decode_legacy(data: str) -> Optional[Tuple[str, tuple]]:
+    """Разбирает callback_data старого формата ('range_1', 'choose_number:5', 'stat_range_this_week'...)."""
+    if data in _LEGACY_SIMPLE:
+        return _LEGACY_SIMPLE[data], ()
+    if data.startswith('choose_number:'):
+        number = data[len('choose_number:'):]
+        return (ACTION_NUMBER, (int(number),)) if number.isascii() and number.isdigit() else None
+
+    match = _LEGACY_ENUM_RE.match(data)
+    if match:
+        action, value = _LEGACY_ENUMS[match.group(1)], match.group(2)
+        kind = SCHEMA[action][0]
+        return (action, (value,)) if value in kind else None
+
+    prefix, _, rest = data.partition('_')
+    action = _LEGACY_PREFIXES.get(prefix)
+    if action is None:
+        return None
+    parts = rest.split('_')
+    if not all(part.isascii() and part.isdigit() for part in parts):
+        return None
+    args = tuple(int(part) for part in parts)
+    return (action, args) if len(args) == len(SCHEMA[action]) else None
+
+
+@functools.lru_cache(maxsize=4096)
+def decode(data: Optional[str]) -> Optional[Tuple[str, tuple]]:
+    """
+    Разбирает callback_data. Кнопок в клавиатурах бота немного, поэтому результаты кэшируются.
+
+    :param data: Строка из CallbackQuery.data
+    :return: (тег действия, аргументы) или None для неизвестных и повреждённых данных
+    """
+    if not data:
+        return None
+    if data[0] != CALLBACK_VERSION:
+        return _decode_legacy(data)
+    action, payload = data[1:2], data[2:]
+    if not _PAYLOAD.fullmatch(payload):
+        return None
+    raw_args = [int(part, 36) for part in payload.split('.')] if payload else []
+    args = _typed_args(action, raw_args)
+    return (action, args) if args is not None else None
+
+
+class CallbackRouter:
+    """
+    Единственный обработчик callback-запросов бота: разбирает callback_data и вызывает
+    обработчик действия через словарь, без перебора предикатов. Обработчик получает
+    CallbackQuery и аргументы действия.
+    """
+
+    def __init__(self, on_unknown: Optional[Callable] = None):
+        """
+        :param on_unknown: Вызывается с CallbackQuery для неизвестных или устаревших кнопок
+        """
+        self.on_unknown = on_unknown
+        self._handlers: Dict[str, Callable] = {}
+
+    def route(self, *actions: str):
+        """Декоратор: регистрирует обработчик для одного или нескольких действий."""
+        def decorator(handler: Callable) -> Callable:
+            # Время работы каждого обработчика попадает в метрики под его именем
+            timed = timed_handler(handler)
+            for action in actions:
+                if action not in SCHEMA:
+                    raise ValueError(f"Неизвестное действие {action!r}")
+                self._handlers[action] = timed
+            return handler
+        return decorator
+
+    def dispatch(self, call):
+        """
+        Вызывает обработчик нажатия. Для AsyncTeleBot обработчики — корутины,
+        и возвращённая корутина ожидается в attach_async.
+        """
+        decoded = decode(call.data)
+        handler = self._handlers.get(decoded[0]) if decoded is not None else None
+        if handler is None:
+            logger.warning("Неизвестные данные кнопки: %r, пользователь: %s", call.data, call.from_user.id)
+            return self.on_unknown(call) if self.on_unknown is not None else None
+        return handler(call, *decoded[1])
+
+    def attach(self, bot):
+        """Регистрирует маршрутизатор как обработчик всех callback-запросов бота."""
+        bot.register_callback_query_handler(self.dispatch, func=None)
+
+    def attach_async(self, bot):
+        async def dispatch(call):
+            result = self.dispatch(call)
+            if result is not None:
+                await result
+
+        bot.register_callback_query_handler(dispatch, func=None)
@@ -0,0 +1,211 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+from telebot import TeleBot, types
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Поля Update, в объектах которых есть from_user
+_USER_UPDATE_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result',
+    'shipping_query', 'pre_checkout_query', 'my_chat_member', 'chat_member', 'chat_join_request',
+)
+
+
+def update_user_id(update: types.Update) -> Optional[int]:
+    """
+    Возвращает Telegram ID пользователя, от которого пришло обновление.
+
+    :param update: Обновление Telegram
+    :return: ID пользователя или None, если обновление не связано с пользователем
+    """
+    for field in _USER_UPDATE_FIELDS:
+        event = getattr(update, field, None)
+        if event is not None and getattr(event, 'from_user', None) is not None:
+            return event.from_user.id
+    return None
+
+
+class _Lane:
+    """Очередь и поток одной дорожки с её метриками."""
+
+    def __init__(self, index: int, maxsize: int):
+        self.index = index
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = None
+        self.submitted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def stats(self) -> dict:
+        handled = self.processed + self.failed
+        return {
+            "lane": self.index,
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_depth,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.total_wait / handled * 1000, 3) if handled else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+        }
+
+
+class UpdateDispatcher:
+    """
+    Распределяет обновления по дорожкам по from_user.id.
+
+    У каждой дорожки своя ограниченная очередь и один поток, поэтому обновления одного
+    пользователя обрабатываются строго по порядку, а разных пользователей — параллельно.
+    Так обработчики, меняющие состояние пользователя (states), не гоняются сами с собой.
+    """
+
+    def __init__(self, process: Callable[[List[types.Update]], None], lanes: int = 4, lane_size: int = 250,
+                 enqueue_timeout: Optional[float] = 2.0):
+        """
+        :param process: Обработчик пачки обновлений (обычно TeleBot.process_new_updates с threaded=False)
+        :param lanes: Количество дорожек (потоков)
+        :param lane_size: Максимальная длина очереди одной дорожки
+        :param enqueue_timeout: Сколько секунд ждать места в очереди дорожки (None — ждать сколько угодно)
+        """
+        self.process = process
+        self.enqueue_timeout = enqueue_timeout
+        self._lanes = [_Lane(i, lane_size) for i in range(lanes)]
+        self._lock = threading.Lock()
+        self._accepting = False
+
+    def start(self):
+        self._accepting = True
+        for lane in self._lanes:
+            lane.thread = threading.Thread(target=self._worker, args=(lane,), name=f"update-lane-{lane.index}",
+                                           daemon=True)
+            lane.thread.start()
+        logger.info("Запущено дорожек обработки обновлений: %s", len(self._lanes))
+
+    def lane_for(self, update: types.Update) -> int:
+        """Номер дорожки для обновления; обновления без пользователя раскладываются по update_id."""
+        user_id = update_user_id(update)
+        key = user_id if user_id is not None else update.update_id
+        return key % len(self._lanes)
+
+    def submit(self, update: types.Update, timeout: Optional[float] = -1) -> bool:
+        """
+        Ставит обновление в очередь его дорожки.
+
+        :param update: Обновление Telegram
+        :param timeout: Сколько ждать места в очереди; по умолчанию enqueue_timeout
+        :return: True, если обновление принято
+        """
+        lane = self._lanes[self.lane_for(update)]
+        if timeout == -1:
+            timeout = self.enqueue_timeout
+
+        with self._lock:
+            lane.submitted += 1
+        if not self._accepting:
+            with self._lock:
+                lane.rejected += 1
+            return False
+        try:
+            lane.queue.put((time.monotonic(), update), timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                lane.rejected += 1
+            logger.warning("Очередь дорожки %s переполнена, обновление %s отклонено", lane.index, update.update_id)
+            return False
+
+        depth = lane.queue.qsize()
+        with self._lock:
+            lane.max_depth = max(lane.max_depth, depth)
+        return True
+
+    def attach(self, bot: TeleBot):
+        """
+        Подключает диспетчер к polling: TeleBot вызывает process_new_updates из потока опроса,
+        а обработка уходит в дорожки. Бот должен быть создан с threaded=False.
+        """
+        def dispatch(updates: List[types.Update]):
+            for update in updates:
+                # process_new_updates сам двигает offset getUpdates — делаем то же самое
+                if update.update_id > bot.last_update_id:
+                    bot.last_update_id = update.update_id
+                # Блокирующая постановка: при заполненной дорожке опрос приостанавливается
+                self.submit(update, timeout=None)
+
+        bot.process_new_updates = dispatch
+
+    def _worker(self, lane: _Lane):
+        while True:
+            item = lane.queue.get()
+            if item is _STOP:
+                lane.queue.task_done()
+                return
+
+            enqueued_at, update = item
+            wait = time.monotonic() - enqueued_at
+            with self._lock:
+                lane.total_wait += wait
+                lane.max_wait = max(lane.max_wait, wait)
+            try:
+                self.process([update])
+                with self._lock:
+                    lane.processed += 1
+            except Exception as e:
+                with self._lock:
+                    lane.failed += 1
+                logger.error("Ошибка обработки обновления %s: %s", update.update_id, e, exc_info=True)
+            finally:
+                lane.queue.task_done()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Перестаёт принимать обновления, дожидается обработки очередей и останавливает потоки.
+
+        :param timeout: Максимальное время ожидания в секундах (None — без ограничения)
+        :return: True, если все очереди обработаны
+        """
+        self._accepting = False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while any(lane.queue.unfinished_tasks for lane in self._lanes):
+            if deadline is not None and time.monotonic() >= deadline:
+                left = sum(lane.queue.qsize() for lane in self._lanes)
+                logger.warning("Не дождались обработки очередей: осталось %s обновлений", left)
+                return False
+            time.sleep(0.05)
+
+        for lane in self._lanes:
+            lane.queue.put(_STOP)
+        for lane in self._lanes:
+            lane.thread.join(timeout=1)
+        logger.info("Очереди обновлений обработаны, дорожки остановлены")
+        return True
+
+    def stats(self) -> dict:
+        """Снимок метрик: суммарные значения и отдельно по каждой дорожке."""
+        with self._lock:
+            lanes = [lane.stats() for lane in self._lanes]
+        handled = sum(lane.processed + lane.failed for lane in self._lanes)
+        total_wait = sum(lane.total_wait for lane in self._lanes)
+        return {
+            "lanes_count": len(lanes),
+            "lane_capacity": self._lanes[0].queue.maxsize,
+            "queue_depth": sum(lane["queue_depth"] for lane in lanes),
+            "max_lane_depth": max(lane["max_queue_depth"] for lane in lanes),
+            "submitted": sum(lane["submitted"] for lane in lanes),
+            "rejected": sum(lane["rejected"] for lane in lanes),
+            "processed": sum(lane["processed"] for lane in lanes),
+            "failed": sum(lane["failed"] for lane in lanes),
+            "avg_wait_ms": round(total_wait / handled * 1000, 3) if handled else 0.0,
+            "max_wait_ms": max(lane["max_wait_ms"] for lane in lanes),
+            "lanes": lanes,
+        }
@@ -1,16 +1,28 @@
 import calendar
+import threading
+from collections import OrderedDict
+from datetime import date
 from typing import List, Tuple, Optional
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton  # Импорты для telebot
 
+from utils.callback_codec import decode, encode, ACTION_CALENDAR_DAY, ACTION_CALENDAR_NEXT, ACTION_CALENDAR_PREV, \
+    ACTION_IGNORE
+
 
 class TelegramCalendar:
-    def __init__(self, locale: str = "en"):
+    def __init__(self, locale: str = "en", cache_size: int = 48):
         """
         Инициализация календаря с возможностью выбора языка.
 
         :param locale: Язык календаря (по умолчанию английский)
+        :param cache_size: Сколько сериализованных месяцев хранить (LRU)
         """
         self.locale = locale
+        self.cache_size = cache_size
+        self._markups = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
     def create_calendar(self, year: int, month: int) -> InlineKeyboardMarkup:
         """
@@ -24,30 +36,73 @@ class TelegramCalendar:
         keyboard = InlineKeyboardMarkup(row_width=7)
 
         # Заголовок с месяцем и годом
-        keyboard.add(InlineKeyboardButton(f'{calendar.month_name[month]} {year}', callback_data='ignore'))
+        ignore = encode(ACTION_IGNORE)
+        keyboard.add(InlineKeyboardButton(f'{calendar.month_name[month]} {year}', callback_data=ignore))
 
         # Дни недели (вы можете перевести на нужный язык)
         days_of_week: List[str] = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
-        keyboard.add(*[InlineKeyboardButton(day, callback_data='ignore') for day in days_of_week])
+        keyboard.add(*[InlineKeyboardButton(day, callback_data=ignore) for day in days_of_week])
 
         # Заполнение дней месяца
         for week in cal:
             row = []
             for day in week:
                 if day == 0:
-                    row.append(InlineKeyboardButton(" ", callback_data="ignore"))  # Пустая клетка
+                    row.append(InlineKeyboardButton(" ", callback_data=ignore))  # Пустая клетка
                 else:
-                    row.append(InlineKeyboardButton(str(day), callback_data=f"day_{day}"))
+                    row.append(InlineKeyboardButton(str(day), callback_data=encode(ACTION_CALENDAR_DAY, day)))
             keyboard.add(*row)
 
         # Добавляем кнопки для перехода на следующий/предыдущий месяц
         keyboard.add(
-            InlineKeyboardButton('<', callback_data=f"prev_{year}_{month}"),
-            InlineKeyboardButton('>', callback_data=f"next_{year}_{month}")
+            InlineKeyboardButton('<', callback_data=encode(ACTION_CALENDAR_PREV, year, month)),
+            InlineKeyboardButton('>', callback_data=encode(ACTION_CALENDAR_NEXT, year, month))
         )
 
         return keyboard
 
+    def get_markup(self, year: int, month: int) -> str:
+        """
+        Возвращает сериализованный календарь месяца из LRU-кэша, строя его при первом обращении.
+        Календарь зависит только от года и месяца, поэтому листание стоит одного поиска в словаре.
+
+        :param year: Год для календаря
+        :param month: Месяц для календаря
+        :return: JSON клавиатуры для reply_markup
+        """
+        key = (year, month)
+        with self._lock:
+            markup = self._markups.get(key)
+            if markup is not None:
+                self.hits += 1
+                self._markups.move_to_end(key)
+                return markup
+            self.misses += 1
+
+        markup = self.create_calendar(year, month).to_json()
+        with self._lock:
+            self._markups[key] = markup
+            self._markups.move_to_end(key)
+            while len(self._markups) > self.cache_size:
+                self._markups.popitem(last=False)
+        return markup
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cached": len(self._markups), "hits": self.hits, "misses": self.misses}
+
+    def prewarm(self, around: Optional[date] = None, months: int = 1):
+        """
+        Заранее строит календари месяца around (по умолчанию текущего) и соседних.
+
+        :param around: Дата, месяц которой нужен в первую очередь
+        :param months: Сколько месяцев до и после него построить
+        """
+        around = around or date.today()
+        for offset in range(-months, months + 1):
+            year, month = divmod(around.year * 12 + around.month - 1 + offset, 12)
+            self.get_markup(year, month + 1)
+
     def handle_callback(self, callback_data: str, current_year: int, current_month: int) -> Tuple[
         Optional[int], Optional[int], Optional[int]]:
         """
@@ -58,17 +113,18 @@ class TelegramCalendar:
         :param current_month: Текущий выбранный месяц
         :return: Кортеж (год, месяц, день) или (None, None, None) для команд без даты
         """
-        if callback_data.startswith("day_"):
-            day = int(callback_data.split("_")[1])
+        action, args = decode(callback_data) or (None, ())
+        if action == ACTION_CALENDAR_DAY:
+            day = args[0]
             return current_year, current_month, day  # Возвращаем текущий год и месяц
-        elif callback_data.startswith("prev_") or callback_data.startswith("next_"):
-            year, month = map(int, callback_data.split("_")[1:])
-            if "prev_" in callback_data:
+        elif action in (ACTION_CALENDAR_PREV, ACTION_CALENDAR_NEXT):
+            year, month = args
+            if action == ACTION_CALENDAR_PREV:
                 month -= 1
                 if month == 0:
                     month = 12
                     year -= 1
-            elif "next_" in callback_data:
+            else:
                 month += 1
                 if month == 13:
                     month = 1
@@ -76,14 +132,14 @@ class TelegramCalendar:
             return year, month, None  # Возвращаем новый год и месяц
         return None, None, None
 
-    def process_callback(self, callback_data: str, current_year: int, current_month: int) -> InlineKeyboardMarkup:
+    def process_callback(self, callback_data: str, current_year: int, current_month: int) -> Optional[str]:
         """
         Обрабатывает коллбэки для кнопок перехода между месяцами и выбора дня.
 
         :param callback_data: Данные кнопки
         :param current_year: Текущий выбранный год
         :param current_month: Текущий выбранный месяц
-        :return: InlineKeyboardMarkup обновленного календаря
+        :return: Сериализованный календарь (см. get_markup) или None, если выбран день
         """
         year, month, day = self.handle_callback(callback_data, current_year, current_month)
         if day is not None:
@@ -92,5 +148,5 @@ class TelegramCalendar:
         else:
             # Переход на другой месяц
             if year is not None and month is not None:
-                return self.create_calendar(year, month)
-            return self.create_calendar(current_year, current_month)
+                return self.get_markup(year, month)
+            return self.get_markup(current_year, current_month)
@@ -0,0 +1,167 @@
+import logging
+import threading
+from typing import Callable, Dict, Hashable, Optional
+
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from db_helpers.catalog import InterpretationCatalog, get_catalog, add_catalog_reload_listener
+from utils.callback_codec import encode, ACTION_ADD_MORE, ACTION_ALL_STAT, ACTION_LIST, ACTION_STAT_RANGE, \
+    ACTION_STAT_TYPE
+from utils.message_utils import generate_time_range_buttons, generate_time_choice_buttons, \
+    generate_number_choice_buttons
+
+logger = logging.getLogger(__name__)
+
+
+class KeyboardRegistry:
+    """
+    Реестр готовых инлайн-клавиатур.
+
+    Каждая клавиатура строится один раз и хранится в виде JSON-строки, которую telebot
+    передаёт в reply_markup как есть. Клавиатуры, зависящие от каталога трактовок,
+    перестраиваются только после смены версии каталога.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalog_version: Optional[int] = None
+        self._catalog_markups: Dict[Hashable, str] = {}
+        self._static_markups: Dict[Hashable, str] = {}
+
+    def get_static(self, key: Hashable, builder: Callable[[], InlineKeyboardMarkup]) -> str:
+        """
+        Возвращает клавиатуру, не зависящую от каталога.
+
+        :param key: Ключ клавиатуры
+        :param builder: Функция, строящая InlineKeyboardMarkup
+        :return: Сериализованная клавиатура
+        """
+        markup = self._static_markups.get(key)
+        if markup is None:
+            markup = builder().to_json()
+            with self._lock:
+                self._static_markups.setdefault(key, markup)
+        return markup
+
+    def get_for_catalog(self, key: Hashable,
+                        builder: Callable[[InterpretationCatalog], Optional[InlineKeyboardMarkup]]) -> Optional[str]:
+        """
+        Возвращает клавиатуру, построенную по текущему каталогу трактовок.
+
+        :param key: Ключ клавиатуры
+        :param builder: Функция, строящая InlineKeyboardMarkup по каталогу (или None, если строить нечего)
+        :return: Сериализованная клавиатура или None
+        """
+        catalog = get_catalog()
+        if self._catalog_version != catalog.version:
+            self.reset(catalog.version)
+
+        if key in self._catalog_markups:
+            return self._catalog_markups[key]
+
+        markup = builder(catalog)
+        serialized = markup.to_json() if markup is not None else None
+        with self._lock:
+            if self._catalog_version == catalog.version:
+                self._catalog_markups.setdefault(key, serialized)
+        return serialized
+
+    def reset(self, catalog_version: Optional[int] = None):
+        """
+        Сбрасывает клавиатуры, построенные по каталогу.
+
+        :param catalog_version: Версия каталога, для которой будут строиться новые клавиатуры
+        """
+        with self._lock:
+            self._catalog_markups = {}
+            self._catalog_version = catalog_version
+
+
+keyboard_registry = KeyboardRegistry()
+add_catalog_reload_listener(lambda catalog: keyboard_registry.reset(catalog.version))
+
+
+def _build_time_choice_keyboard(catalog: InterpretationCatalog, time_range_id: int):
+    time_choices = catalog.get_time_choices_for_range(time_range_id)
+    if not time_choices:
+        return None
+    return generate_time_choice_buttons(time_choices)
+
+
+def _build_choice_type_keyboard(action: str) -> InlineKeyboardMarkup:
+    markup = InlineKeyboardMarkup()
+    markup.add(InlineKeyboardButton("Время", callback_data=encode(action, 'time')),
+               InlineKeyboardButton("Числа", callback_data=encode(action, 'numbers')))
+    return markup
+
+
+def _build_stat_type_keyboard() -> InlineKeyboardMarkup:
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    keyboard.add(InlineKeyboardButton(text="Время", callback_data=encode(ACTION_STAT_TYPE, 'time')),
+                 InlineKeyboardButton(text="Числа", callback_data=encode(ACTION_STAT_TYPE, 'numbers')))
+    return keyboard
+
+
+def _build_stat_range_keyboard() -> InlineKeyboardMarkup:
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        InlineKeyboardButton(text="Эта неделя", callback_data=encode(ACTION_STAT_RANGE, 'this_week')),
+        InlineKeyboardButton(text="Прошлая неделя", callback_data=encode(ACTION_STAT_RANGE, 'last_week')),
+        InlineKeyboardButton(text="Этот месяц", callback_data=encode(ACTION_STAT_RANGE, 'this_month')),
+        InlineKeyboardButton(text="Календарь", callback_data=encode(ACTION_STAT_RANGE, 'calendar')),
+    )
+    return keyboard
+
+
+def _build_add_more_keyboard() -> InlineKeyboardMarkup:
+    markup = InlineKeyboardMarkup()
+    markup.add(InlineKeyboardButton("Добавить ещё", callback_data=encode(ACTION_ADD_MORE)))
+    return markup
+
+
+def time_range_keyboard() -> str:
+    """Клавиатура выбора временного промежутка (/time, «Назад», «Добавить ещё»)."""
+    return keyboard_registry.get_for_catalog('time_ranges',
+                                             lambda catalog: generate_time_range_buttons(catalog.time_ranges))
+
+
+def time_choice_keyboard(time_range_id: int) -> Optional[str]:
+    """
+    Клавиатура выбора времени внутри промежутка.
+
+    :param time_range_id: ID временного промежутка
+    :return: Сериализованная клавиатура или None, если вариантов нет
+    """
+    return keyboard_registry.get_for_catalog(('time_choices', time_range_id),
+                                             lambda catalog: _build_time_choice_keyboard(catalog, time_range_id))
+
+
+def number_choice_keyboard() -> str:
+    """Клавиатура выбора числа (/number)."""
+    return keyboard_registry.get_for_catalog('number_choices',
+                                             lambda catalog: generate_number_choice_buttons(catalog.number_choices))
+
+
+def list_type_keyboard() -> str:
+    """Клавиатура выбора списка трактовок (/list)."""
+    return keyboard_registry.get_static('list_type', lambda: _build_choice_type_keyboard(ACTION_LIST))
+
+
+def all_stat_type_keyboard() -> str:
+    """Клавиатура выбора типа общей статистики (/all_stat)."""
+    return keyboard_registry.get_static('all_stat_type', lambda: _build_choice_type_keyboard(ACTION_ALL_STAT))
+
+
+def stat_type_keyboard() -> str:
+    """Клавиатура выбора типа статистики за промежуток (/stat_range)."""
+    return keyboard_registry.get_static('stat_type', _build_stat_type_keyboard)
+
+
+def stat_range_keyboard() -> str:
+    """Клавиатура выбора промежутка статистики."""
+    return keyboard_registry.get_static('stat_range', _build_stat_range_keyboard)
+
+
+def add_more_keyboard() -> str:
+    """Клавиатура «Добавить ещё» после сохранения времени."""
+    return keyboard_registry.get_static('add_more', _build_add_more_keyboard)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+
+from config import Config
+from db_helpers.catalog import InterpretationCatalog, get_catalog, add_catalog_reload_listener
+from utils.message_utils import build_interpretation_list, iter_message_chunks
+
+logger = logging.getLogger(__name__)
+
+LIST_TYPES = ("time", "numbers")
+
+# Меняется при изменении вида списка или правил разбиения, чтобы не отдавать страницы с диска в старом формате
+_PAGES_FORMAT = 1
+
+
+def catalog_digest(catalog: InterpretationCatalog) -> str:
+    """
+    Хэш содержимого каталога. В отличие от catalog.version, одинаков в разных процессах и после перезапуска.
+
+    :param catalog: Каталог трактовок
+    :return: Шестнадцатеричная строка
+    """
+    content = repr((_PAGES_FORMAT, catalog.time_ranges, catalog.time_choices, catalog.number_choices))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+class ListPageCache:
+    """
+    Готовые страницы /list: HTML-текст списка, уже разбитый на сообщения.
+
+    Страницы строятся один раз на версию каталога и отдаются из памяти. Если задан cache_dir,
+    они дополнительно сохраняются на диск под хэшем содержимого каталога, и после перезапуска
+    (или в соседнем процессе) текст не собирается заново.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        """
+        :param cache_dir: Каталог для файлов со страницами (None — только в памяти)
+        """
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._catalog_version: Optional[int] = None
+        self._digest: Optional[str] = None
+        self._pages: Dict[str, Tuple[str, ...]] = {}
+
+    def _path(self, list_type: str, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"list_{list_type}_{digest}.json")
+
+    def _load(self, path: str) -> Optional[Tuple[str, ...]]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                return tuple(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Не удалось прочитать страницы /list из %s: %s", path, e)
+            return None
+
+    def _save(self, path: str, pages: Tuple[str, ...]):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(pages, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить страницы /list в %s: %s", path, e)
+
+    def _render(self, catalog: InterpretationCatalog, list_type: str, digest: str) -> Optional[Tuple[str, ...]]:
+        path = self._path(list_type, digest) if self.cache_dir else None
+        if path is not None:
+            pages = self._load(path)
+            if pages is not None:
+                return pages
+
+        text = build_interpretation_list(catalog, list_type)
+        if text is None:
+            return None
+        pages = tuple(iter_message_chunks(text, 'HTML'))
+        if path is not None:
+            self._save(path, pages)
+        return pages
+
+    def get_pages(self, list_type: str) -> Optional[Tuple[str, ...]]:
+        """
+        Возвращает страницы списка трактовок по текущему каталогу.
+
+        :param list_type: 'time' или 'numbers'
+        :return: Части сообщения для parse_mode='HTML' или None для неизвестного типа
+        """
+        if list_type not in LIST_TYPES:
+            return None
+
+        catalog = get_catalog()
+        if self._catalog_version != catalog.version:
+            self.reset(catalog)
+
+        pages = self._pages.get(list_type)
+        if pages is not None:
+            return pages
+
+        with self._lock:
+            if self._catalog_version != catalog.version:
+                # Каталог перезагрузили, пока мы ждали блокировку
+                return self._render(catalog, list_type, catalog_digest(catalog))
+            pages = self._pages.get(list_type)
+            if pages is None:
+                pages = self._render(catalog, list_type, self._digest)
+                self._pages[list_type] = pages
+        return pages
+
+    def reset(self, catalog: Optional[InterpretationCatalog] = None):
+        """
+        Сбрасывает страницы, построенные по прежнему каталогу.
+
+        :param catalog: Каталог, для которого будут строиться новые страницы
+        """
+        digest = catalog_digest(catalog) if catalog is not None else None
+        with self._lock:
+            self._pages = {}
+            self._catalog_version = catalog.version if catalog is not None else None
+            self._digest = digest
+
+    def prewarm(self, catalog: InterpretationCatalog):
+        """Строит страницы всех списков сразу после загрузки каталога, чтобы первый /list не ждал."""
+        self.reset(catalog)
+        for list_type in LIST_TYPES:
+            self.get_pages(list_type)
+        logger.info("Страницы /list построены для каталога версии %s", catalog.version)
+
+
+list_page_cache = ListPageCache(Config.LIST_PAGES_CACHE_DIR)
+add_catalog_reload_listener(list_page_cache.prewarm)
+
+
+def get_list_pages(list_type: str) -> Optional[Tuple[str, ...]]:
+    return list_page_cache.get_pages(list_type)
@@ -0,0 +1,124 @@
+"""
+Неблокирующее логирование: обработчики и потоки бота только кладут записи в очередь,
+а в файл и консоль их пишет отдельный поток QueueListener. Зависание диска задерживает
+запись логов, но не обработку обновлений; при переполненной очереди записи отбрасываются.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+from typing import Dict, List, Optional
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при заполненной очереди отбрасывает запись вместо ошибки или ожидания."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Стандартный prepare форматирует запись в вызывающем потоке (нужно для передачи
+        # между процессами); здесь очередь внутри процесса, и форматирует поток записи
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Счётчик без блокировки: потерять единицу при гонке допустимо
+            self.dropped += 1
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает записи INFO и выше, а DEBUG — только долю rate (выборочная отладка под нагрузкой)."""
+
+    def __init__(self, rate: float):
+        """
+        :param rate: Доля пропускаемых записей DEBUG (0..1)
+        """
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class LogPipeline:
+    """Очередь, обработчик-производитель на корневом логгере и поток, пишущий в конечные обработчики."""
+
+    def __init__(self, handlers: List[logging.Handler], queue_size: int = 10000, debug_sample_rate: float = 1.0):
+        """
+        :param handlers: Конечные обработчики (файл, консоль), вызываются из потока QueueListener
+        :param queue_size: Сколько записей может ждать записи, сверх этого они отбрасываются
+        :param debug_sample_rate: Доля записей DEBUG, попадающих в очередь
+        """
+        self.queue = queue.Queue(queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        if debug_sample_rate < 1:
+            self.handler.addFilter(DebugSampler(debug_sample_rate))
+        self.handlers = handlers
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+
+    def start(self, root: logging.Logger):
+        root.addHandler(self.handler)
+        self.listener.start()
+
+    def stop(self, root: logging.Logger):
+        """Снимает обработчик с логгера и дописывает оставшиеся в очереди записи."""
+        root.removeHandler(self.handler)
+        self.listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {'queued': self.queue.qsize(), 'dropped': self.handler.dropped}
+
+
+_pipeline: Optional[LogPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def configure_logging(level: int, handlers: List[logging.Handler], queue_size: int = 10000,
+                      debug_sample_rate: float = 1.0) -> LogPipeline:
+    """
+    Заменяет обработчики корневого логгера очередью с фоновой записью в handlers.
+    Повторный вызов останавливает предыдущую очередь, дописав её записи.
+
+    :param level: Уровень корневого логгера
+    :param handlers: Конечные обработчики с уже заданным форматтером
+    :param queue_size: Размер очереди записей
+    :param debug_sample_rate: Доля записей DEBUG, которые пишутся (1 — все)
+    :return: Запущенный конвейер
+    """
+    global _pipeline
+    root = logging.getLogger()
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline.stop(root)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+
+        root.setLevel(level)
+        _pipeline = LogPipeline(handlers, queue_size, debug_sample_rate)
+        _pipeline.start(root)
+    return _pipeline
+
+
+def shutdown_logging():
+    """Останавливает фоновую запись, дописав очередь (вызывается при завершении процесса)."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            _pipeline.stop(logging.getLogger())
+            _pipeline = None
+
+
+atexit.register(shutdown_logging)
+
+
+def log_pipeline_stats() -> Dict[str, int]:
+    return _pipeline.stats() if _pipeline is not None else {'queued': 0, 'dropped': 0}
@@ -1,61 +1,183 @@
+import html
+import itertools
+import re
+from collections import deque
+from typing import TYPE_CHECKING, Iterable, Iterator
+
 import telebot
-from telebot import types
 
+from utils.callback_codec import encode, ACTION_TIME_RANGE, ACTION_TIME_CHOICE, ACTION_BACK, ACTION_NUMBER
+from utils.outbound import bulk_sends
+
+if TYPE_CHECKING:
+    # async_telebot тянет aiohttp, синхронному боту он не нужен
+    from telebot.async_telebot import AsyncTeleBot
+
+
+MAX_MESSAGE_LENGTH = 4096
+
+# Теги, которые Telegram понимает в parse_mode='HTML'
+_HTML_TAGS = frozenset(('b', 'strong', 'i', 'em', 'u', 'ins', 's', 'strike', 'del', 'span', 'tg-spoiler', 'a',
+                        'code', 'pre', 'blockquote', 'tg-emoji'))
+
+# Токены: тег, HTML-сущность, абзац, перевод строки и отрезок текста внутри строки.
+# Отрезки текста режутся по пробелам только тогда, когда не помещаются в часть целиком
+_HTML_TOKEN = re.compile(r'<[^<>]*>|&#?\w+;|\n\s*\n\s*|\n[^\S\n]*|[^<&\n]+|[<&]')
+_TEXT_TOKEN = re.compile(r'\n\s*\n\s*|\n[^\S\n]*|[^\n]+')
+_TAG = re.compile(r'<(/?)([a-zA-Z][\w-]*)')
 
-def send_long_message(bot: telebot.TeleBot, chat_id: int, text: str, parse_mode=None):
-    max_length = 4096
+_BREAK_PARAGRAPH, _BREAK_LINE = 2, 1
 
-    # Если парсинг HTML не включен или сообщение короткое, просто отправляем
-    if parse_mode != 'HTML' or len(text) <= max_length:
-        for i in range(0, len(text), max_length):
-            bot.send_message(chat_id, text[i:i + max_length], parse_mode=parse_mode)
+
+def iter_message_chunks(text: str, parse_mode=None, max_length: int = MAX_MESSAGE_LENGTH) -> Iterator[str]:
+    """
+    Лениво разбивает текст на части не длиннее max_length за один проход по токенам.
+
+    Режет по границе абзаца, если нет — строки (не раньше середины части), если нет — по последнему
+    помещающемуся пробелу, и только потом посреди слова; пробелы на месте разреза отбрасываются.
+    В HTML-режиме теги и сущности не разрываются: открытые на месте разреза теги закрываются
+    в конце части и открываются заново (с атрибутами) в начале следующей.
+
+    :param text: Текст сообщения
+    :param parse_mode: 'HTML' или None
+    :param max_length: Максимальная длина части
+    """
+    if len(text) <= max_length:
+        if text:
+            yield text
         return
 
-    # Разбиваем текст с учетом HTML-тегов
-    parts = []
-    current_part = ""
-    open_tags = []  # Стек для отслеживания открытых тегов
-
-    i = 0
-    while i < len(text):
-        # Проверяем, не встретили ли открывающий тег
-        if text[i:i + 1] == '<' and i + 1 < len(text) and text[i + 1:i + 2] != '/':
-            tag_end = text.find('>', i)
-            if tag_end != -1:
-                tag_content = text[i + 1:tag_end]
-                tag_name = tag_content.split()[0]
-                if tag_name in ['b', 'i', 'u', 'a', 'code', 'pre', 'strong', 'em']:
-                    open_tags.append(tag_name)
-
-        # Проверяем, не встретили ли закрывающий тег
-        elif text[i:i + 2] == '</' and i + 2 < len(text):
-            tag_end = text.find('>', i)
-            if tag_end != -1:
-                tag_name = text[i + 2:tag_end]
-                if open_tags and open_tags[-1] == tag_name:
-                    open_tags.pop()
-
-        current_part += text[i]
-        i += 1
-
-        # Если текущая часть достигла максимальной длины или мы близки к концу
-        if len(current_part) >= max_length - 100 or i == len(text):
-            # Закрываем все открытые теги
-            for tag in reversed(open_tags):
-                current_part += f"</{tag}>"
-
-            parts.append(current_part)
-
-            # Если это не последняя часть, начинаем новую
-            if i < len(text):
-                current_part = ""
-                # Открываем снова все теги для новой части
-                for tag in open_tags:
-                    current_part += f"<{tag}>"
-
-    # Отправляем все части
-    for part in parts:
+    html = parse_mode == 'HTML'
+    tokens = (match.group() for match in (_HTML_TOKEN if html else _TEXT_TOKEN).finditer(text))
+
+    pieces = []         # Токены текущей части
+    length = 0          # Длина текущей части с учётом заново открытых тегов
+    stack = ()          # Открытые теги: кортеж (имя, открывающий тег)
+    closing = 0         # Длина закрывающих тегов для stack
+    prefix = ''         # Заново открытые теги в начале текущей части
+    content = False     # Есть ли в текущей части что-то кроме тегов и переводов строк
+    breaks = {}         # Сила границы -> (индекс токена-перевода строки, стек перед ним)
+    pending = deque()   # Токены, возвращённые в поток после разреза
+
+    def close_tags(tags) -> str:
+        return ''.join(f"</{name}>" for name, _ in reversed(tags))
+
+    def cut(index: int, tags, drop: bool = False) -> str:
+        """Отдаёт часть из pieces[:index], остаток возвращает в поток и начинает новую часть."""
+        nonlocal pieces, length, stack, closing, prefix, content, breaks
+        rest = pieces[index + 1 if drop else index:]
+        # Теги, открытые в конце части и ещё пустые, переносим в следующую: Telegram не принимает <b></b>
+        while index and tags and pieces[index - 1] == tags[-1][1]:
+            index -= 1
+            rest.insert(0, pieces[index])
+            tags = tags[:-1]
+        chunk = prefix + ''.join(pieces[:index]) + close_tags(tags)
+        pending.extendleft(reversed(rest))
+        prefix = ''.join(opening for _, opening in tags)
+        pieces, length, stack, content, breaks = [], len(prefix), tags, False, {}
+        closing = len(close_tags(tags))
+        return chunk
+
+    while True:
+        token = pending.popleft() if pending else next(tokens, None)
+        if token is None:
+            break
+        if not token:
+            continue
+
+        is_break = token[0] == '\n'
+        if is_break and not pieces:
+            # Переводы строк в начале части не нужны
+            continue
+
+        is_tag = html and token[0] == '<' and len(token) > 1
+        new_stack, new_closing = stack, closing
+        if is_tag:
+            match = _TAG.match(token)
+            if match and match.group(2).lower() in _HTML_TAGS:
+                name = match.group(2).lower()
+                if match.group(1):
+                    names = [tag_name for tag_name, _ in stack]
+                    if name in names:
+                        new_stack = stack[:len(names) - 1 - names[::-1].index(name)]
+                else:
+                    new_stack = stack + ((name, token),)
+                new_closing = len(close_tags(new_stack))
+
+        if length + len(token) + new_closing <= max_length:
+            if is_break and content:
+                breaks[_BREAK_PARAGRAPH if token.count('\n') > 1 else _BREAK_LINE] = (len(pieces), stack)
+            pieces.append(token)
+            length += len(token)
+            stack, closing = new_stack, new_closing
+            content = content or not (is_break or is_tag)
+            continue
+
+        # Токен не помещается: сначала ищем абзац или строку во второй половине части
+        boundary = next((breaks[strength] for strength in (_BREAK_PARAGRAPH, _BREAK_LINE)
+                         if strength in breaks and breaks[strength][0] * 2 >= len(pieces)), None)
+        if boundary is not None:
+            pending.appendleft(token)
+            yield cut(boundary[0], boundary[1], drop=True)
+            continue
+
+        room = max_length - length - closing
+        if not is_break and not (html and token[0] in '<&'):
+            # Отрезок текста: берём слова до последнего помещающегося пробела
+            space = token.rfind(' ', 0, room + 1)
+            if space > 0:
+                pieces.append(token[:space])
+                pending.appendleft(token[space + 1:])
+                yield cut(len(pieces), stack)
+                continue
+            if not content:
+                # Слово длиннее целой части (или того, что осталось после открытых тегов): режем по длине
+                if room <= 0:
+                    raise ValueError("Открытые теги не оставляют места для текста")
+                pieces.append(token[:room])
+                pending.appendleft(token[room:])
+                yield cut(len(pieces), stack)
+                continue
+
+        if not content:
+            raise ValueError(f"Токен длиннее максимальной длины части: {token[:50]}")
+        pending.appendleft(token)
+        yield cut(len(pieces), stack)
+
+    if pieces:
+        yield prefix + ''.join(pieces) + close_tags(stack)
+
+
+def split_long_message(text: str, parse_mode=None):
+    """Разбивает текст на части, укладывающиеся в лимит длины сообщения Telegram."""
+    return list(iter_message_chunks(text, parse_mode))
+
+
+def send_message_parts(bot: telebot.TeleBot, chat_id: int, parts: Iterable[str], parse_mode=None):
+    """
+    Отправляет уже разбитый текст: первую часть — как обычный ответ, остальные — в фоне.
+
+    :param bot: Экземпляр TeleBot
+    :param chat_id: ID чата
+    :param parts: Части сообщения (не длиннее MAX_MESSAGE_LENGTH)
+    :param parse_mode: Режим разметки
+    """
+    parts = iter(parts)
+    for part in itertools.islice(parts, 1):
         bot.send_message(chat_id, part, parse_mode=parse_mode)
+    # Продолжение длинного текста не должно задерживать ответы другим пользователям
+    with bulk_sends():
+        for part in parts:
+            bot.send_message(chat_id, part, parse_mode=parse_mode)
+
+
+async def send_message_parts_async(bot: 'AsyncTeleBot', chat_id: int, parts: Iterable[str], parse_mode=None):
+    parts = iter(parts)
+    for part in itertools.islice(parts, 1):
+        await bot.send_message(chat_id, part, parse_mode=parse_mode)
+    with bulk_sends():
+        for part in parts:
+            await bot.send_message(chat_id, part, parse_mode=parse_mode)
 
 
 def generate_time_range_buttons(time_ranges):
@@ -63,7 +185,7 @@ def generate_time_range_buttons(time_ranges):
     for time_range in time_ranges:
         button = telebot.types.InlineKeyboardButton(
             text=time_range.time_range,
-            callback_data=f'range_{time_range.id}'  # добавляем id временного промежутка
+            callback_data=encode(ACTION_TIME_RANGE, time_range.id)  # добавляем id временного промежутка
         )
         markup.add(button)
     return markup
@@ -72,9 +194,74 @@ def generate_time_range_buttons(time_ranges):
 def generate_time_choice_buttons(time_choices):
     markup = telebot.types.InlineKeyboardMarkup(row_width=3)
     buttons = [
-        telebot.types.InlineKeyboardButton(choice.choice, callback_data=f"time_{choice.time_range_id}_{choice.id}")
+        telebot.types.InlineKeyboardButton(choice.choice,
+                                           callback_data=encode(ACTION_TIME_CHOICE, choice.time_range_id, choice.id))
         for choice in time_choices
     ]
     markup.add(*buttons)
-    markup.add(telebot.types.InlineKeyboardButton("Назад", callback_data="back"))
+    markup.add(telebot.types.InlineKeyboardButton("Назад", callback_data=encode(ACTION_BACK)))
     return markup
+
+
+def generate_number_choice_buttons(number_choices):
+    left_column = [choice for choice in number_choices if choice.number < 10]  # Числа от 0 до 9
+    right_column = [choice for choice in number_choices if choice.number >= 111]  # Числа от 111 до 999
+
+    markup = telebot.types.InlineKeyboardMarkup()
+
+    # Сравниваем длину списков, чтобы избежать IndexError
+    max_length = max(len(left_column), len(right_column))
+
+    for i in range(max_length):
+        # Берем элемент из левого столбца, если он существует
+        left_button = telebot.types.InlineKeyboardButton(
+            text=str(left_column[i].number),
+            callback_data=encode(ACTION_NUMBER, left_column[i].id)
+        ) if i < len(left_column) else None
+
+        # Берем элемент из правого столбца, если он существует
+        right_button = telebot.types.InlineKeyboardButton(
+            text=str(right_column[i].number),
+            callback_data=encode(ACTION_NUMBER, right_column[i].id)
+        ) if i < len(right_column) else None
+
+        # Добавляем кнопки в строку. Если обе кнопки существуют — добавляем их обе, если нет — только существующую
+        row = [left_button] if left_button else []
+        if right_button:
+            row.append(right_button)
+
+        markup.row(*row)
+    return markup
+
+
+def build_interpretation_list(catalog, list_type: str):
+    """
+    Формирует HTML-текст полного списка трактовок для /list.
+
+    :param catalog: Каталог трактовок (db_helpers.catalog.InterpretationCatalog)
+    :param list_type: 'time' или 'numbers'
+    :return: Текст списка или None для неизвестного типа
+    """
+    if list_type == "time":
+        interpretations = {}
+        for choice in catalog.time_choices:
+            period = catalog.get_time_range(choice.time_range_id).time_range
+            interpretations.setdefault(period, {})[choice.choice] = choice.interpretation
+
+        lines = ["<b>Трактовки времени:</b>\n\n"]
+        for period, choices in interpretations.items():
+            lines.append(f"<b>{period}</b>\n")
+            for time, interpretation in choices.items():
+                lines.append(f"<b>{html.escape(time, quote=False)}</b>: {html.escape(interpretation, quote=False)}\n")
+            lines.append("\n")
+
+    elif list_type == "numbers":
+        lines = ["<b>Трактовки чисел:</b>\n\n"]
+        for choice in catalog.number_choices:
+            lines.append(f"<b>{html.escape(str(choice.number), quote=False)}</b>: "
+                         f"{html.escape(choice.interpretation, quote=False)}\n\n")
+
+    else:
+        return None
+
+    return "".join(lines).strip()
@@ -0,0 +1,433 @@
+"""
+Метрики бота в текстовом формате Prometheus.
+
+Счётчики и гистограммы обновляются прямо на горячем пути (обработчики, SQL-запросы, вызовы Bot API),
+а снимки уже существующих stats() — диспетчера, очереди отправки, кэшей, хранилища состояний —
+собираются в момент запроса метрик. MetricsServer отдаёт всё это по HTTP для Prometheus.
+"""
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды: от быстрого SQL-запроса до медленного ответа Telegram
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        rendered = ','.join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+        name = f"{name}{{{rendered}}}"
+    return f"{name} {value:.10g}" if isinstance(value, float) else f"{name} {value}"
+
+
+class Counter:
+    """Монотонно растущий счётчик с метками."""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """
+        :param name: Имя метрики (для счётчиков с суффиксом _total)
+        :param documentation: Описание для строки # HELP
+        :param labelnames: Имена меток; значения передаются в inc() в том же порядке
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, labelvalues)), value) for labelvalues, value in values]
+
+
+class Histogram:
+    """
+    Гистограмма длительностей с метками: количество наблюдений по корзинам, сумма и общее количество.
+    Перцентили считает Prometheus (histogram_quantile), здесь только счётчики.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        :param name: Имя метрики (для длительностей с суффиксом _seconds)
+        :param documentation: Описание для строки # HELP
+        :param labelnames: Имена меток; значения передаются в observe() в том же порядке
+        :param buckets: Верхние границы корзин по возрастанию (+Inf добавляется сама)
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Метки -> [счётчики по корзинам (последняя — +Inf), сумма, количество]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = [(labelvalues, list(state[0]), state[1], state[2])
+                      for labelvalues, state in self._values.items()]
+        samples = []
+        for labelvalues, counts, total, count in values:
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                samples.append((f"{self.name}_bucket", {**labels, 'le': le}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """Набор метрик и сборщиков снимков stats(), отдаваемый одним текстом."""
+
+    def __init__(self, prefix: str = 'bot'):
+        """
+        :param prefix: Префикс имён метрик из сборщиков
+        """
+        self.prefix = prefix
+        self._metrics: List = []
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, name: str, collect: Callable[[], dict]):
+        """
+        Регистрирует снимок stats(): каждое числовое значение словаря становится метрикой
+        {prefix}_{name}_{ключ}. Если в снимке есть hits и misses, добавляется hit_ratio.
+        Список словарей (например, lanes диспетчера) становится метриками {prefix}_{name}_lane_{ключ}
+        с меткой lane: её значение берётся из одноимённого поля элемента или из его номера в списке.
+        Повторная регистрация под тем же именем заменяет сборщик.
+
+        :param name: Имя подсистемы (dispatcher, outbound, user_cache...)
+        :param collect: Функция, возвращающая словарь stats()
+        """
+        with self._lock:
+            self._collectors[name] = collect
+
+    def unregister_collector(self, name: str):
+        with self._lock:
+            self._collectors.pop(name, None)
+
+    def _collect(self, name: str, collect: Callable[[], dict]) -> List[Sample]:
+        try:
+            stats = collect()
+        except Exception as e:
+            logger.warning("Не удалось собрать метрики %s: %s", name, e)
+            return []
+        samples = [(f"{self.prefix}_{name}_{key}", {}, value) for key, value in stats.items() if _is_number(value)]
+        hits, misses = stats.get('hits'), stats.get('misses')
+        if isinstance(hits, int) and isinstance(misses, int):
+            samples.append((f"{self.prefix}_{name}_hit_ratio", {},
+                            round(hits / (hits + misses), 6) if hits + misses else 0.0))
+
+        for key, items in stats.items():
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                continue
+            # lanes -> метка lane и метрики {prefix}_{name}_lane_{ключ}
+            label = key[:-1] if key.endswith('s') else key
+            for position, item in enumerate(items):
+                labels = {label: str(item.get(label, position))}
+                samples.extend((f"{self.prefix}_{name}_{label}_{field}", labels, value)
+                               for field, value in item.items() if field != label and _is_number(value))
+        return samples
+
+    def render(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors.items())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(_format_sample(*sample) for sample in metric.samples())
+        for name, collect in collectors:
+            # Образцы одной метрики (по дорожкам) идут подряд под одной строкой TYPE
+            grouped: Dict[str, List[Sample]] = {}
+            for sample in self._collect(name, collect):
+                grouped.setdefault(sample[0], []).append(sample)
+            for metric_name, samples in grouped.items():
+                # Снимки смешивают счётчики и текущие значения, тип не указываем
+                lines.append(f"# TYPE {metric_name} untyped")
+                lines.extend(_format_sample(*sample) for sample in samples)
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+handler_duration = registry.histogram('bot_handler_duration_seconds',
+                                      'Время работы обработчика команды или нажатия', ['handler'])
+handler_errors = registry.counter('bot_handler_errors_total', 'Исключения, вышедшие из обработчика', ['handler'])
+db_query_duration = registry.histogram('bot_db_query_duration_seconds',
+                                       'Время выполнения SQL-запроса по типу запроса', ['statement'])
+db_errors = registry.counter('bot_db_errors_total', 'Ошибки SQL-запросов по типу запроса', ['statement'])
+telegram_api_duration = registry.histogram('bot_telegram_api_duration_seconds',
+                                           'Время вызова метода Bot API', ['method'])
+telegram_api_errors = registry.counter('bot_telegram_api_errors_total',
+                                       'Ошибки вызовов Bot API: код ответа или тип исключения', ['method', 'error'])
+
+
+def timed_handler(handler: Callable, name: Optional[str] = None) -> Callable:
+    """
+    Оборачивает обработчик (функцию или корутину): время работы попадает в bot_handler_duration_seconds,
+    исключения — в bot_handler_errors_total.
+
+    :param handler: Обработчик
+    :param name: Значение метки handler (по умолчанию имя функции)
+    :return: Обёртка с той же сигнатурой (TeleBot смотрит на параметры обработчика)
+    """
+    name = name or handler.__name__
+
+    if inspect.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            except Exception:
+                handler_errors.inc(name)
+                raise
+            finally:
+                handler_duration.observe(time.perf_counter() - started, name)
+
+        return async_wrapper
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return handler(*args, **kwargs)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+def instrument_message_handlers(bot):
+    """
+    Оборачивает timed_handler все зарегистрированные обработчики сообщений бота (TeleBot и AsyncTeleBot).
+    Обработчики команд подписываются командой (/start), остальные — именем функции.
+    """
+    for handler in bot.message_handlers:
+        if getattr(handler['function'], '_timed', False):
+            continue
+        commands = (handler.get('filters') or {}).get('commands')
+        handler['function'] = timed_handler(handler['function'], f"/{commands[0]}" if commands else None)
+        handler['function']._timed = True
+
+
+# Типы запросов для метки statement; остальное (PRAGMA, SAVEPOINT...) — other
+_STATEMENT_KINDS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'BEGIN', 'COMMIT', 'ROLLBACK'}
+# Текст запроса -> тип. Запросы собираются из кэша компиляции, поэтому различных текстов немного
+_statement_kinds: Dict[str, str] = {}
+_STATEMENT_KINDS_LIMIT = 4096
+
+
+def _statement_kind(statement: str) -> str:
+    kind = _statement_kinds.get(statement)
+    if kind is None:
+        words = statement.lstrip()[:8].split(None, 1)
+        kind = words[0].upper() if words else ''
+        kind = kind.lower() if kind in _STATEMENT_KINDS else 'other'
+        if len(_statement_kinds) >= _STATEMENT_KINDS_LIMIT:
+            _statement_kinds.clear()
+        _statement_kinds[statement] = kind
+    return kind
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+    return statement, parameters
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is not None:
+        db_query_duration.observe(time.perf_counter() - started, _statement_kind(statement))
+
+
+def _handle_error(context):
+    db_errors.inc(_statement_kind(context.statement or ''))
+
+
+def install_db_metrics():
+    """
+    Подписывается на события всех движков SQLAlchemy (включая sync_engine асинхронных):
+    количество и время запросов по типу, ошибки.
+    """
+    # retval=True: слушатель сам возвращает запрос и параметры, без промежуточной обёртки SQLAlchemy
+    for name, listener, retval in (('before_cursor_execute', _before_cursor_execute, True),
+                                   ('after_cursor_execute', _after_cursor_execute, False),
+                                   ('handle_error', _handle_error, False)):
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener, retval=retval)
+
+
+def _api_error(error: Exception) -> str:
+    code = getattr(error, 'error_code', None)
+    return str(code) if code is not None else type(error).__name__
+
+
+def _timed_api_call(request: Callable, is_async: bool) -> Callable:
+    """Обёртка над функцией запроса telebot; getUpdates (long polling) не измеряется."""
+    if is_async:
+        @functools.wraps(request)
+        async def async_request(token, method_name, *args, **kwargs):
+            if method_name == 'getUpdates':
+                return await request(token, method_name, *args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return await request(token, method_name, *args, **kwargs)
+            except Exception as e:
+                telegram_api_errors.inc(method_name, _api_error(e))
+                raise
+            finally:
+                telegram_api_duration.observe(time.perf_counter() - started, method_name)
+
+        return async_request
+
+    @functools.wraps(request)
+    def sync_request(token, method_name, *args, **kwargs):
+        if method_name == 'getUpdates':
+            return request(token, method_name, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return request(token, method_name, *args, **kwargs)
+        except Exception as e:
+            telegram_api_errors.inc(method_name, _api_error(e))
+            raise
+        finally:
+            telegram_api_duration.observe(time.perf_counter() - started, method_name)
+
+    return sync_request
+
+
+def install_telegram_metrics(is_async: bool = False):
+    """
+    Измеряет вызовы Bot API. Все методы telebot идут через apihelper._make_request
+    (asyncio_helper._process_request для AsyncTeleBot), поэтому обёртка ставится туда.
+
+    :param is_async: Обернуть запросы AsyncTeleBot, а не TeleBot
+    """
+    if is_async:
+        from telebot import asyncio_helper as module
+        attribute = '_process_request'
+    else:
+        from telebot import apihelper as module
+        attribute = '_make_request'
+
+    request = getattr(module, attribute)
+    if not getattr(request, '_timed', False):
+        wrapper = _timed_api_call(request, is_async)
+        wrapper._timed = True
+        setattr(module, attribute, wrapper)
+
+
+class MetricsServer:
+    """HTTP-сервер в отдельном потоке, отдающий метрики реестра по GET path."""
+
+    def __init__(self, metrics: MetricsRegistry, host: str, port: int, path: str = '/metrics'):
+        """
+        :param metrics: Реестр метрик
+        :param host: Адрес для прослушивания (по умолчанию только локальный)
+        :param port: Порт для прослушивания
+        :param path: Путь, по которому отдаются метрики
+        """
+        from utils.webhook import ThreadedHTTPServer
+
+        self.metrics = metrics
+        self.path = path
+        self._httpd = ThreadedHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def server_address(self):
+        return self._httpd.server_address
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != server.path:
+                    return self._reply(404, b"")
+                self._reply(200, server.metrics.render().encode())
+
+            def _reply(self, status: int, body: bytes):
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        logger.info("Метрики доступны на http://%s:%s%s", self.server_address[0], self.server_address[1], self.path)
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
@@ -0,0 +1,191 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence
+
+from utils.message_utils import send_message_parts, send_message_parts_async
+from utils.outbound import on_error
+
+logger = logging.getLogger(__name__)
+
+# Уведомление при нажатии кнопки, которую бот больше не понимает (например, из очень старого сообщения)
+OUTDATED_BUTTON_TEXT = "Кнопка устарела, вызовите команду заново."
+
+# Ответ Telegram на правку, которая ничего не меняет: сообщение уже в нужном виде
+_NOT_MODIFIED = "message is not modified"
+
+
+@dataclass(frozen=True)
+class Send:
+    """Новое сообщение в чат."""
+    text: str
+    reply_markup: Any = None
+    parse_mode: Optional[str] = None
+    disable_web_page_preview: Optional[bool] = None
+
+
+@dataclass(frozen=True)
+class Screen:
+    """Следующий экран в сообщении с нажатой кнопкой (см. show_screen)."""
+    text: str
+    reply_markup: Any = None
+    parse_mode: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Markup:
+    """Новая клавиатура сообщения с нажатой кнопкой (см. replace_markup)."""
+    reply_markup: Any
+
+
+@dataclass(frozen=True)
+class Parts:
+    """Длинный текст, уже разбитый на части (см. send_message_parts)."""
+    parts: Sequence[str]
+    parse_mode: Optional[str] = None
+
+
+def _send_kwargs(reply: Send) -> dict:
+    # Необязательные параметры передаются, только если заданы
+    return {name: value for name, value in (('reply_markup', reply.reply_markup), ('parse_mode', reply.parse_mode),
+                                            ('disable_web_page_preview', reply.disable_web_page_preview))
+            if value is not None}
+
+
+def _edit_impossible(error: Exception) -> bool:
+    """
+    True, если сообщение нельзя отредактировать (удалено, слишком старое, без текста)
+    и вместо правки нужно отправить новое.
+    """
+    return getattr(error, 'error_code', None) == 400 and _NOT_MODIFIED not in str(error)
+
+
+def _not_modified(error: Exception) -> bool:
+    return getattr(error, 'error_code', None) == 400 and _NOT_MODIFIED in str(error)
+
+
+def answer_callback(bot, call, text: Optional[str] = None):
+    """
+    Сразу отвечает на нажатие кнопки, чтобы клиент убрал индикатор загрузки.
+    Ошибка ответа (например, запрос уже устарел) не мешает обработке.
+
+    :param bot: Экземпляр TeleBot
+    :param call: CallbackQuery
+    :param text: Всплывающее уведомление (None — без уведомления)
+    """
+    try:
+        bot.answer_callback_query(call.id, text)
+    except Exception as e:
+        logger.warning("Не удалось ответить на callback %s: %s", call.id, e)
+
+
+def show_screen(bot, call, text: str, reply_markup=None, parse_mode=None):
+    """
+    Показывает следующий экран навигации, редактируя сообщение с нажатой кнопкой.
+    Если сообщение отредактировать нельзя, отправляет новое. С очередью OutboundSender
+    правка не ждёт отправки, и запасной вариант срабатывает уже после ответа Telegram.
+
+    :param bot: Экземпляр TeleBot
+    :param call: CallbackQuery
+    :param text: Текст экрана
+    :param reply_markup: Клавиатура экрана (None — убрать клавиатуру)
+    :param parse_mode: Режим разметки
+    """
+    def fallback(e: Exception):
+        if _not_modified(e):
+            return
+        if not _edit_impossible(e):
+            logger.error("Не удалось показать экран в сообщении %s: %s", call.message.message_id, e)
+            return
+        logger.debug("Сообщение %s нельзя отредактировать (%s), отправляем новое", call.message.message_id, e)
+        bot.send_message(call.message.chat.id, text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+    on_error(lambda: bot.edit_message_text(text, call.message.chat.id, call.message.message_id,
+                                           parse_mode=parse_mode, reply_markup=reply_markup), fallback)
+
+
+def replace_markup(bot, call, reply_markup):
+    """
+    Меняет только клавиатуру сообщения (например, листание календаря). Если сообщение
+    отредактировать нельзя, отправляет новое с тем же текстом.
+
+    :param bot: Экземпляр TeleBot
+    :param call: CallbackQuery
+    :param reply_markup: Новая клавиатура
+    """
+    def fallback(e: Exception):
+        if _not_modified(e):
+            return
+        if not _edit_impossible(e):
+            logger.error("Не удалось изменить клавиатуру сообщения %s: %s", call.message.message_id, e)
+            return
+        logger.debug("Клавиатуру сообщения %s нельзя изменить (%s), отправляем новое", call.message.message_id, e)
+        bot.send_message(call.message.chat.id, call.message.text, reply_markup=reply_markup)
+
+    on_error(lambda: bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id,
+                                                   reply_markup=reply_markup), fallback)
+
+
+async def answer_callback_async(bot, call, text: Optional[str] = None):
+    try:
+        await bot.answer_callback_query(call.id, text)
+    except Exception as e:
+        logger.warning("Не удалось ответить на callback %s: %s", call.id, e)
+
+
+async def show_screen_async(bot, call, text: str, reply_markup=None, parse_mode=None):
+    try:
+        await bot.edit_message_text(text, call.message.chat.id, call.message.message_id,
+                                    parse_mode=parse_mode, reply_markup=reply_markup)
+    except Exception as e:
+        if _not_modified(e):
+            return
+        if not _edit_impossible(e):
+            raise
+        logger.debug("Сообщение %s нельзя отредактировать (%s), отправляем новое", call.message.message_id, e)
+        await bot.send_message(call.message.chat.id, text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+
+async def replace_markup_async(bot, call, reply_markup):
+    try:
+        await bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id,
+                                            reply_markup=reply_markup)
+    except Exception as e:
+        if _not_modified(e):
+            return
+        if not _edit_impossible(e):
+            raise
+        logger.debug("Клавиатуру сообщения %s нельзя изменить (%s), отправляем новое", call.message.message_id, e)
+        await bot.send_message(call.message.chat.id, call.message.text, reply_markup=reply_markup)
+
+
+def deliver(bot, chat_id: int, replies: List, call=None):
+    """
+    Отправляет ответы обработчика из handlers.flows.
+
+    :param bot: Экземпляр TeleBot
+    :param chat_id: ID чата
+    :param replies: Список Send, Screen, Markup и Parts
+    :param call: CallbackQuery с нажатой кнопкой (нужен для Screen и Markup)
+    """
+    for reply in replies:
+        if isinstance(reply, Send):
+            bot.send_message(chat_id, reply.text, **_send_kwargs(reply))
+        elif isinstance(reply, Screen):
+            show_screen(bot, call, reply.text, reply_markup=reply.reply_markup, parse_mode=reply.parse_mode)
+        elif isinstance(reply, Markup):
+            replace_markup(bot, call, reply.reply_markup)
+        else:
+            send_message_parts(bot, chat_id, reply.parts, parse_mode=reply.parse_mode)
+
+
+async def deliver_async(bot, chat_id: int, replies: List, call=None):
+    for reply in replies:
+        if isinstance(reply, Send):
+            await bot.send_message(chat_id, reply.text, **_send_kwargs(reply))
+        elif isinstance(reply, Screen):
+            await show_screen_async(bot, call, reply.text, reply_markup=reply.reply_markup,
+                                    parse_mode=reply.parse_mode)
+        elif isinstance(reply, Markup):
+            await replace_markup_async(bot, call, reply.reply_markup)
+        else:
+            await send_message_parts_async(bot, chat_id, reply.parts, parse_mode=reply.parse_mode)
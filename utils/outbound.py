@@ -0,0 +1,364 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Приоритет отправок из текущего потока/задачи, см. bulk_sends()
+_current_priority = contextvars.ContextVar('outbound_priority', default=PRIORITY_INTERACTIVE)
+
+# Методы бота, которые идут через очередь: имя параметра с ID чата и его позиция
+# (None — метод не привязан к чату и ограничивается только общим лимитом).
+# answer_callback_query сюда не входит: лимиты Telegram считают сообщения, а ответ на нажатие
+# должен убрать индикатор загрузки сразу, а не после массовых отправок
+RATE_LIMITED_METHODS = {
+    'send_message': ('chat_id', 0),
+    'edit_message_text': ('chat_id', 1),
+    'edit_message_reply_markup': ('chat_id', 0),
+}
+
+
+@contextmanager
+def bulk_sends():
+    """Отправки внутри блока получают низкий приоритет и пропускают вперёд ответы другим пользователям."""
+    token = _current_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity накопленных."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена (0 — токен есть)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+def on_error(call: Callable, handle: Callable[[Exception], None]):
+    """
+    Вызывает метод бота и передаёт его ошибку в handle: сразу, если метод выполнился в этом потоке,
+    или после выполнения, если запрос ушёл в очередь OutboundSender (метод вернул Future).
+    Так запасной вариант (например, новое сообщение вместо неудачного редактирования)
+    работает одинаково с очередью и без неё.
+
+    :param call: Функция без аргументов, вызывающая метод бота
+    :param handle: Обработчик ошибки
+    :return: Результат метода или Future
+    """
+    try:
+        result = call()
+    except Exception as e:
+        handle(e)
+        return None
+    if isinstance(result, Future):
+        def done(future: Future):
+            error = future.exception()
+            if error is not None:
+                handle(error)
+
+        result.add_done_callback(done)
+    return result
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Возвращает retry_after из ответа 429 Too Many Requests или None для других ошибок."""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    parameters = (getattr(error, 'result_json', None) or {}).get('parameters') or {}
+    return float(parameters.get('retry_after', 1))
+
+
+class _Job:
+    __slots__ = ('call', 'key', 'chat_id', 'priority', 'future', 'enqueued_at', 'attempts')
+
+    def __init__(self, call: Callable, key, chat_id, priority: int):
+        self.call = call
+        self.key = key
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class OutboundSender:
+    """
+    Очередь исходящих запросов к Telegram с ограничением частоты.
+
+    Лимиты — ведра токенов: общее на бота и отдельное на каждый чат. Запросы одного чата уходят
+    строго по порядку и по одному, разных чатов — параллельно (workers потоков). Из готовых к отправке
+    сначала берутся интерактивные ответы, потом массовые (bulk_sends()). На 429 запрос возвращается
+    в начало очереди своего чата, и чат (или вся очередь для запросов без чата) ждёт retry_after.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3, workers: int = 4,
+                 max_retries: int = 3):
+        """
+        :param global_rate: Запросов в секунду на бота (и размер всплеска)
+        :param chat_rate: Запросов в секунду в один чат
+        :param chat_burst: Сколько запросов в чат можно отправить подряд без ожидания
+        :param workers: Количество потоков, выполняющих запросы
+        :param max_retries: Сколько раз повторять запрос после 429
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.max_retries = max_retries
+
+        self._cond = threading.Condition()
+        self._global = TokenBucket(global_rate, global_rate)
+        self._global_blocked_until = 0.0
+        self._chat_buckets = {}
+        self._blocked_until = {}
+        self._pending = {}
+        # Ключи чатов, готовых к отправке, по приоритету их первого запроса
+        self._ready = (deque(), deque())
+        self._busy = set()
+        self._threads = []
+        self._running = False
+        self._seq = itertools.count()
+        self._next_cleanup = 0.0
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self):
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"outbound-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Очередь исходящих запросов запущена: %s потоков", self.workers)
+
+    def submit(self, call: Callable, chat_id=None, priority: Optional[int] = None) -> Future:
+        """
+        Ставит запрос в очередь.
+
+        :param call: Функция без аргументов, выполняющая запрос
+        :param chat_id: ID чата для лимита чата и порядка отправки (None — только общий лимит)
+        :param priority: PRIORITY_INTERACTIVE или PRIORITY_BULK (по умолчанию — из bulk_sends())
+        :return: Future с результатом запроса
+        """
+        if priority is None:
+            priority = _current_priority.get()
+        key = chat_id if chat_id is not None else ('_', next(self._seq))
+        job = _Job(call, key, chat_id, priority)
+        with self._cond:
+            jobs = self._pending.setdefault(key, deque())
+            jobs.append(job)
+            if len(jobs) == 1 and key not in self._busy:
+                self._ready[priority].append(key)
+            self._cond.notify()
+        return job.future
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _chat_delay(self, key, chat_id, now: float) -> float:
+        delay = self._blocked_until.get(key, 0.0) - now
+        if chat_id is not None:
+            delay = max(delay, self._chat_bucket(chat_id).delay(now))
+        return delay
+
+    def _next_job(self, now: float):
+        """Выбирает следующий запрос под self._cond; возвращает (запрос, None) или (None, сколько ждать)."""
+        delay = max(self._global_blocked_until - now, self._global.delay(now))
+        if delay > 0:
+            return None, delay
+
+        wait = None
+        for ready in self._ready:
+            for _ in range(len(ready)):
+                key = ready.popleft()
+                job = self._pending[key][0]
+                delay = self._chat_delay(key, job.chat_id, now)
+                if delay <= 0:
+                    self._pending[key].popleft()
+                    self._busy.add(key)
+                    self._global.consume(now)
+                    if job.chat_id is not None:
+                        self._chat_bucket(job.chat_id).consume(now)
+                    return job, None
+                ready.append(key)
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _cleanup(self, now: float):
+        """Забывает ведра и блокировки чатов, по которым давно ничего не отправлялось."""
+        self._next_cleanup = now + 60
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items()
+                        if chat_id not in self._pending and bucket.is_full(now)]:
+            del self._chat_buckets[chat_id]
+        for key in [key for key, until in self._blocked_until.items() if until <= now]:
+            del self._blocked_until[key]
+
+    def _finish(self, job: _Job, retry_after: Optional[float] = None):
+        """Освобождает чат после запроса; при retry_after возвращает запрос в начало очереди чата."""
+        with self._cond:
+            now = time.monotonic()
+            self._busy.discard(job.key)
+            jobs = self._pending[job.key]
+            if retry_after is not None:
+                jobs.appendleft(job)
+                if job.chat_id is None:
+                    self._global_blocked_until = now + retry_after
+                else:
+                    self._blocked_until[job.key] = now + retry_after
+            if jobs:
+                self._ready[jobs[0].priority].append(job.key)
+            else:
+                del self._pending[job.key]
+            if now >= self._next_cleanup:
+                self._cleanup(now)
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._running and not self._pending:
+                        return
+                    job, wait = self._next_job(time.monotonic())
+                    if job is not None:
+                        break
+                    self._cond.wait(wait)
+
+            if job.attempts == 0:
+                waited = time.monotonic() - job.enqueued_at
+                with self._cond:
+                    self.total_wait += waited
+                    self.max_wait = max(self.max_wait, waited)
+
+            try:
+                result = job.call()
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is not None and job.attempts < self.max_retries:
+                    job.attempts += 1
+                    with self._cond:
+                        self.retried += 1
+                    logger.warning("429 для чата %s, повтор через %s с", job.chat_id, retry_after)
+                    self._finish(job, retry_after)
+                    continue
+                with self._cond:
+                    self.failed += 1
+                logger.warning("Запрос к Telegram для чата %s не выполнен: %s", job.chat_id, e)
+                self._finish(job)
+                job.future.set_exception(e)
+                continue
+
+            with self._cond:
+                self.sent += 1
+            self._finish(job)
+            job.future.set_result(result)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Отправляет оставшиеся запросы и останавливает потоки."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = [0, 0]
+            for jobs in self._pending.values():
+                for job in jobs:
+                    queued[job.priority] += 1
+            handled = self.sent + self.failed
+            return {
+                "queued_interactive": queued[PRIORITY_INTERACTIVE],
+                "queued_bulk": queued[PRIORITY_BULK],
+                "in_flight": len(self._busy),
+                "chats_waiting": len(self._pending),
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried_429": self.retried,
+                "avg_wait_ms": round(self.total_wait / handled * 1000, 3) if handled else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+    @staticmethod
+    def _chat_id(param, position, args, kwargs):
+        if param is None:
+            return None
+        if param in kwargs:
+            return kwargs[param]
+        return args[position] if len(args) > position else None
+
+    def attach(self, bot):
+        """
+        Пропускает запросы TeleBot из RATE_LIMITED_METHODS через очередь. Вызов не ждёт отправки
+        и возвращает Future: лимит чата (1 в секунду) задерживает только его сообщения, а поток
+        дорожки диспетчера сразу берёт обновления других пользователей. Ошибки отправки пишутся
+        в лог; если нужен запасной вариант, используйте on_error().
+        """
+        for name, (param, position) in RATE_LIMITED_METHODS.items():
+            method = getattr(bot, name)
+
+            @functools.wraps(method)
+            def wrapper(*args, _method=method, _param=param, _position=position, **kwargs):
+                chat_id = self._chat_id(_param, _position, args, kwargs)
+                return self.submit(functools.partial(_method, *args, **kwargs), chat_id)
+
+            setattr(bot, name, wrapper)
+
+    def attach_async(self, bot, loop: asyncio.AbstractEventLoop):
+        """
+        То же для AsyncTeleBot: корутина метода выполняется в цикле loop,
+        а обработчик ждёт своей очереди, не блокируя цикл.
+        """
+        for name, (param, position) in RATE_LIMITED_METHODS.items():
+            method = getattr(bot, name)
+
+            def run(method, args, kwargs):
+                return asyncio.run_coroutine_threadsafe(method(*args, **kwargs), loop).result()
+
+            @functools.wraps(method)
+            async def wrapper(*args, _method=method, _param=param, _position=position, **kwargs):
+                chat_id = self._chat_id(_param, _position, args, kwargs)
+                future = self.submit(functools.partial(run, _method, args, kwargs), chat_id)
+                return await asyncio.wrap_future(future)
+
+            setattr(bot, name, wrapper)
@@ -1,11 +1,13 @@
 import logging
-from collections import defaultdict
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Tuple, Union
 
-from sqlalchemy import and_
 from sqlalchemy.orm import Session
 
-from db_helpers.models import TimeSelection, User, SessionLocal, TimeChoice, NumberChoice, NumberSelection
+from db_helpers.models import ReadSessionLocal
+from db_helpers.queries import range_counts, all_time_counts
+from db_helpers.selection_writer import wait_for_selections
+from db_helpers.users import find_user_id
 import locale
 
 # Настройка логирования
@@ -17,39 +19,167 @@ except locale.Error:
     logger.warning("Не удалось установить русскую локаль, используется системная локаль")
 
 
-def get_user_time_statistics(session: Session, tg_id: int):
+STAT_KINDS = ("time", "numbers")
+
+# Текст при отсутствии выборов и заголовок статистики за всё время
+ALL_TIME_STAT_TEXTS = {
+    "time": ("Вы ещё не добавляли время.", "Статистика временных знаков за все время:"),
+    "numbers": ("Вы ещё не добавляли числа.", "Статистика чисел за все время:"),
+}
+
+
+def _full_days(start_date: datetime, end_date: datetime) -> Tuple[date, date]:
+    """Возвращает первый и последний дни, целиком попадающие в промежуток."""
+    first_day = start_date.date()
+    if start_date.time() != time.min:
+        first_day += timedelta(days=1)
+    last_day = end_date.date()
+    if end_date.time() != time.max:
+        last_day -= timedelta(days=1)
+    return first_day, last_day
+
+
+def aggregate_range_counts(session: Session, user_id: int, stat_type: str,
+                           start_date: datetime, end_date: datetime) -> List[Tuple[Union[str, int], int, str]]:
+    """
+    Считает выборы за промежуток одним запросом: целые дни берутся из daily_choice_counts,
+    сырые выборы читаются только для неполных крайних дней. Части объединяются UNION ALL,
+    а суммирование и сортировка выполняются в БД.
+
+    :param session: Сессия SQLAlchemy
+    :param user_id: ID пользователя в таблице users
+    :param stat_type: Тип статистики ('time' или 'numbers')
+    :param start_date: Начало промежутка (включительно)
+    :param end_date: Конец промежутка (включительно)
+    :return: Список (значение, количество, трактовка), отсортированный по убыванию количества
+    """
+    first_day, last_day = _full_days(start_date, end_date)
+    if first_day > last_day:
+        # Целых дней нет: весь промежуток читается из сырых выборов
+        head, tail = (start_date, start_date), (start_date, end_date)
+    else:
+        head = (start_date, datetime.combine(first_day, time.min))
+        tail = (datetime.combine(last_day + timedelta(days=1), time.min), end_date)
+    return range_counts(session, user_id, stat_type, first_day, last_day, head, tail)
+
+
+def fetch_all_time_counts(session: Session, user_id: int,
+                          stat_type: str) -> List[Tuple[Union[str, int], int, str]]:
+    """
+    Возвращает статистику за всё время из таблицы user_choice_counters.
+
+    :param session: Сессия SQLAlchemy
+    :param user_id: ID пользователя в таблице users
+    :param stat_type: Тип статистики ('time' или 'numbers')
+    :return: Список (значение, количество, трактовка), отсортированный по убыванию количества
+    """
+    return all_time_counts(session, user_id, stat_type)
+
+
+def format_choice_stats(header: str, rows: List[Tuple[Union[str, int], int, str]]) -> str:
+    """
+    Формирует HTML-сообщение со статистикой.
+
+    :param header: Заголовок сообщения (без тегов)
+    :param rows: Строки (значение, количество, трактовка) из запросов db_helpers.queries
+    :return: Текст сообщения
+    """
+    parts = [f"<b>{header}</b>\n\n"]
+    for value, count, interpretation in rows:
+        parts.append(f"<b>{value}</b>: {count} раз(а) - {interpretation}\n\n")
+    return "".join(parts).strip()
+
+
+def get_predefined_range(range_key: str, now: datetime) -> Optional[Tuple[datetime, datetime]]:
     """
-    Получает статистику времен для пользователя
+    Возвращает границы предустановленного промежутка статистики.
+
+    :param range_key: 'this_week', 'last_week' или 'this_month'
+    :param now: Текущий момент
+    :return: (начало, конец) или None для неизвестного промежутка
+    """
+    if range_key == "this_week":
+        start_date = now - timedelta(days=now.weekday())
+        end_date = now
+    elif range_key == "last_week":
+        start_date = now - timedelta(days=now.weekday() + 7)
+        end_date = start_date + timedelta(days=6)
+    elif range_key == "this_month":
+        start_date = now.replace(day=1)
+        end_date = now
+    else:
+        return None
+    return datetime.combine(start_date.date(), time.min), datetime.combine(end_date.date(), time.max)
+
+
+def build_range_stat_message(session: Session, tg_id: int, start_date: datetime, end_date: datetime,
+                             stat_type: str) -> str:
+    """
+    Формирует сообщение со статистикой за промежуток в рамках переданной сессии.
 
     :param session: Сессия SQLAlchemy
     :param tg_id: Telegram ID пользователя
-    :return: Словарь с статистикой
+    :param start_date: Начальная дата
+    :param end_date: Конечная дата
+    :param stat_type: Тип статистики ('time' или 'numbers')
+    :return: Строка с результатами
     """
-    try:
-        user = session.query(User).filter(User.tg_id == tg_id).first()
+    # Выборы пишутся отложенно: сначала дожидаемся записи выборов этого пользователя
+    wait_for_selections(tg_id)
+    user_id = find_user_id(session, tg_id)
 
-        # Если пользователь не найден, возвращаем пустой словарь
-        if not user:
-            logger.warning(f"Пользователь с tg_id {tg_id} не найден")
-            return {}
+    if user_id is None:
+        logger.warning("Пользователь не найден: %s", tg_id)
+        return "Пользователь не найден."
 
-        # Инициализируем словарь для хранения статистики
-        statistics = defaultdict(lambda: {"count": 0, "interpretation": ""})
+    if stat_type not in STAT_KINDS:
+        logger.warning("Неизвестный тип статистики: %s", stat_type)
+        return "Неизвестный тип статистики."
 
-        # Получаем все выборы времени пользователя
-        time_selections = session.query(TimeSelection).filter_by(user_id=user.id).all()
+    rows = aggregate_range_counts(session, user_id, stat_type, start_date, end_date)
+    period = f"с {start_date.strftime('%d %B %Y')} по {end_date.strftime('%d %B %Y')}"
 
-        # Обрабатываем выборы времени
-        for selection in time_selections:
-            time_choice = selection.time_choice.choice
-            interpretation = selection.time_choice.interpretation
-            statistics[time_choice]["count"] += 1
-            statistics[time_choice]["interpretation"] = interpretation
+    if stat_type == "time":
+        if not rows:
+            logger.debug("Нет временных выборов в диапазоне для пользователя %s", user_id)
+            return f"У вас нет выборов времени {period}."
+        return format_choice_stats(f"Статистика времени {period}:", rows)
 
-        return statistics
-    except Exception as e:
-        logger.error(f"Ошибка при получении статистики времени: {e}", exc_info=True)
-        return {}
+    if not rows:
+        logger.debug("Нет числовых выборов в диапазоне для пользователя %s", user_id)
+        return f"У вас нет выборов чисел {period}."
+    return format_choice_stats(f"Статистика чисел {period}:", rows)
+
+
+def build_all_time_stat_message(session: Session, tg_id: int, stat_type: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Формирует статистику за всё время в рамках переданной сессии.
+
+    :param session: Сессия SQLAlchemy
+    :param tg_id: Telegram ID пользователя
+    :param stat_type: Тип статистики ('time' или 'numbers')
+    :return: (текст статистики, None) или (None, короткое уведомление), если показывать нечего
+    """
+    wait_for_selections(tg_id)
+    user_id = find_user_id(session, tg_id)
+
+    if user_id is None:
+        logger.warning("Пользователь не найден: %s", tg_id)
+        return None, "Пользователь не найден."
+
+    if stat_type not in ALL_TIME_STAT_TEXTS:
+        logger.warning("Неизвестный тип статистики: %s", stat_type)
+        return None, "Неизвестный тип статистики."
+
+    empty_text, header = ALL_TIME_STAT_TEXTS[stat_type]
+
+    # Читаем готовые счётчики: O(различных выборов), а не O(всех выборов)
+    rows = fetch_all_time_counts(session, user_id, stat_type)
+    if not rows:
+        logger.debug("Нет выборов типа %s для пользователя %s", stat_type, user_id)
+        return None, empty_text
+
+    return format_choice_stats(header, rows), None
 
 
 def fetch_stat_for_time_range(message, start_date, end_date, stat_type):
@@ -62,74 +192,11 @@ def fetch_stat_for_time_range(message, start_date, end_date, stat_type):
     :param stat_type: Тип статистики ('time' или 'numbers')
     :return: Строка с результатами
     """
-    logger.info(f"Запрос статистики типа {stat_type} с {start_date} по {end_date}")
+    logger.debug("Запрос статистики типа %s с %s по %s", stat_type, start_date, end_date)
 
     try:
-        with SessionLocal() as session:
-            user = session.query(User).filter_by(tg_id=message.chat.id).first()
-
-            if not user:
-                logger.warning(f"Пользователь не найден: {message.chat.id}")
-                return "Пользователь не найден."
-
-            if stat_type == "time":
-                # Получаем выборы времени в указанном диапазоне
-                time_selections = session.query(TimeSelection).filter(
-                    and_(
-                        TimeSelection.user_id == user.id,
-                        TimeSelection.timestamp >= start_date,
-                        TimeSelection.timestamp <= end_date
-                    )
-                ).all()
-
-                if not time_selections:
-                    logger.info(f"Нет временных выборов в диапазоне для пользователя {user.id}")
-                    return f"У вас нет выборов времени с {start_date.strftime('%d %B %Y')} по {end_date.strftime('%d %B %Y')}."
-
-                time_stats = defaultdict(int)
-                for selection in time_selections:
-                    time_stats[selection.time_choice.choice] += 1
-
-                sorted_stats = sorted(time_stats.items(), key=lambda x: x[1], reverse=True)
-
-                response = f"<b>Статистика времени с {start_date.strftime('%d %B %Y')} по {end_date.strftime('%d %B %Y')}:</b>\n\n"
-
-                for time_choice, count in sorted_stats:
-                    interpretation = session.query(TimeChoice).filter_by(choice=time_choice).first()
-                    if interpretation:
-                        response += f"<b>{time_choice}</b>: {count} раз(а) - {interpretation.interpretation}\n\n"
-
-            elif stat_type == "numbers":
-                # Получаем выборы чисел в указанном диапазоне
-                number_selections = session.query(NumberSelection).filter(
-                    and_(
-                        NumberSelection.user_id == user.id,
-                        NumberSelection.timestamp >= start_date,
-                        NumberSelection.timestamp <= end_date
-                    )
-                ).all()
-
-                if not number_selections:
-                    logger.info(f"Нет числовых выборов в диапазоне для пользователя {user.id}")
-                    return f"У вас нет выборов чисел с {start_date.strftime('%d %B %Y')} по {end_date.strftime('%d %B %Y')}."
-
-                number_stats = defaultdict(int)
-                for selection in number_selections:
-                    number_stats[selection.number_choice.number] += 1
-
-                sorted_stats = sorted(number_stats.items(), key=lambda x: x[1], reverse=True)
-
-                response = f"<b>Статистика чисел с {start_date.strftime('%d %B %Y')} по {end_date.strftime('%d %B %Y')}:</b>\n\n"
-
-                for number, count in sorted_stats:
-                    interpretation = session.query(NumberChoice).filter_by(number=number).first()
-                    if interpretation:
-                        response += f"<b>{number}</b>: {count} раз(а) - {interpretation.interpretation}\n\n"
-            else:
-                logger.warning(f"Неизвестный тип статистики: {stat_type}")
-                return "Неизвестный тип статистики."
-
-            return response.strip()
+        with ReadSessionLocal() as session:
+            return build_range_stat_message(session, message.chat.id, start_date, end_date, stat_type)
     except Exception as e:
-        logger.error(f"Ошибка при получении статистики за период: {e}", exc_info=True)
-        return "Произошла ошибка при получении статистики. Пожалуйста, попробуйте позже."
\ No newline at end of file
+        logger.error("Ошибка при получении статистики за период: %s", e, exc_info=True)
+        return "Произошла ошибка при получении статистики. Пожалуйста, попробуйте позже."
@@ -0,0 +1,199 @@
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete
+
+from db_helpers.models import SessionLocal, UserState, upsert_insert
+from db_helpers.queries import user_state_data
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore(ABC):
+    """
+    Хранилище состояний диалога пользователей (см. states.py).
+
+    Состояние — словарь с ключом 'state' и дополнительными данными. Состояние, которое
+    не обновлялось дольше ttl секунд, считается брошенным и удаляется.
+    """
+
+    def __init__(self, ttl: float):
+        """
+        :param ttl: Время жизни состояния в секундах с последнего обращения
+        """
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, user_id: int) -> Optional[dict]:
+        """
+        :param user_id: ID пользователя (чата)
+        :return: Копия словаря состояния или None
+        """
+
+    @abstractmethod
+    def update(self, user_id: int, state: str, additional_data: Optional[dict] = None):
+        """
+        Устанавливает состояние, дополняя существующие данные.
+
+        :param user_id: ID пользователя (чата)
+        :param state: Новое состояние
+        :param additional_data: Данные, которые нужно добавить или обновить
+        """
+
+    @abstractmethod
+    def clear(self, user_id: int):
+        """
+        :param user_id: ID пользователя (чата)
+        """
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Количество хранимых (в том числе ещё не удалённых просроченных) состояний."""
+
+
+class MemoryStateStore(StateStore):
+    """
+    Состояния в памяти процесса: TTL и вытеснение давно не использованных (LRU) при превышении max_size.
+
+    Любое обращение продлевает TTL и переносит запись в конец OrderedDict, поэтому записи
+    упорядочены по сроку истечения, и просроченные снимаются с начала за O(числа просроченных).
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        """
+        :param ttl: Время жизни состояния в секундах с последнего обращения
+        :param max_size: Максимальное количество хранимых состояний
+        """
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def _purge_expired(self, now: float):
+        while self._states:
+            user_id, (expires_at, _) = next(iter(self._states.items()))
+            if expires_at > now:
+                break
+            del self._states[user_id]
+            self.expired += 1
+
+    def _touch(self, user_id: int, data: dict, now: float):
+        self._states[user_id] = (now + self.ttl, data)
+        self._states.move_to_end(user_id)
+
+    def get(self, user_id: int) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._states.get(user_id)
+            if entry is None:
+                return None
+            self._touch(user_id, entry[1], now)
+            return dict(entry[1])
+
+    def update(self, user_id: int, state: str, additional_data: Optional[dict] = None):
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._states.get(user_id)
+            data = dict(entry[1]) if entry else {}
+            data['state'] = state
+            if additional_data:
+                data.update(additional_data)
+            self._touch(user_id, data, now)
+
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+                self.evicted += 1
+
+    def clear(self, user_id: int):
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    raise TypeError(f"Значение типа {type(value).__name__} нельзя сохранить в состоянии")
+
+
+def _decode(obj: dict):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    if '__date__' in obj:
+        return date.fromisoformat(obj['__date__'])
+    return obj
+
+
+class SqlStateStore(StateStore):
+    """
+    Состояния в таблице user_states (SQLite/Postgres): переживают перезапуск и общие для всех процессов бота.
+
+    TTL отсчитывается от последнего изменения; просроченные строки не читаются и периодически удаляются.
+    """
+
+    def __init__(self, ttl: float, session_factory=SessionLocal, purge_interval: float = 600):
+        """
+        :param ttl: Время жизни состояния в секундах с последнего изменения
+        :param session_factory: Фабрика сессий SQLAlchemy
+        :param purge_interval: Как часто (в секундах) удалять просроченные строки
+        """
+        super().__init__(ttl)
+        self.session_factory = session_factory
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+
+    def _load(self, session, user_id: int) -> Optional[dict]:
+        row = user_state_data(session, user_id, datetime.now())
+        return json.loads(row, object_hook=_decode) if row is not None else None
+
+    def get(self, user_id: int) -> Optional[dict]:
+        with self.session_factory() as session:
+            return self._load(session, user_id)
+
+    def update(self, user_id: int, state: str, additional_data: Optional[dict] = None):
+        with self.session_factory() as session:
+            data = self._load(session, user_id) or {}
+            data['state'] = state
+            if additional_data:
+                data.update(additional_data)
+
+            values = {'data': json.dumps(data, default=_encode),
+                      'expires_at': datetime.now() + timedelta(seconds=self.ttl)}
+            stmt = upsert_insert(session)(UserState).values(chat_id=user_id, **values)
+            session.execute(stmt.on_conflict_do_update(index_elements=[UserState.chat_id], set_=values))
+            session.commit()
+        self._maybe_purge()
+
+    def clear(self, user_id: int):
+        with self.session_factory() as session:
+            session.execute(delete(UserState).where(UserState.chat_id == user_id))
+            session.commit()
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        with self.session_factory() as session:
+            deleted = session.execute(delete(UserState).where(UserState.expires_at <= datetime.now())).rowcount
+            session.commit()
+        if deleted:
+            logger.info("Удалено просроченных состояний: %s", deleted)
+
+    def __len__(self) -> int:
+        with self.session_factory() as session:
+            return session.query(UserState).count()
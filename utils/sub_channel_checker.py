@@ -1,16 +1,322 @@
+import asyncio
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import Config
+from utils.keyboards import keyboard_registry
+
+logger = logging.getLogger(__name__)
+
 required_channel_ids = [-1001399964263, -1002147509062]
+# Ссылки на те же каналы для кнопок в ответе пользователю без подписки
+required_channel_links = [("Артём ВВШ", "https://t.me/strong_mvp"), ("Главком", "https://t.me/arsenmarkarian")]
+
+# Статусы 'member', 'administrator', 'creator' означают подписку
+SUBSCRIBED_STATUSES = frozenset(('member', 'administrator', 'creator'))
+# Только администратор канала может узнать статус произвольного пользователя
+ADMIN_STATUSES = frozenset(('administrator', 'creator'))
+
+# Ответ на команду пользователю без подписки (с кнопками-ссылками на каналы)
+SUBSCRIPTION_REQUIRED_TEXT = "Бот доступен подписчикам наших каналов. Подпишитесь на каналы ниже и повторите команду."
+
+
+def _build_subscription_keyboard() -> InlineKeyboardMarkup:
+    markup = InlineKeyboardMarkup(row_width=1)
+    markup.add(*(InlineKeyboardButton(title, url=url) for title, url in required_channel_links))
+    return markup
+
+
+def subscription_keyboard() -> str:
+    """Кнопки-ссылки на обязательные каналы."""
+    return keyboard_registry.get_static('subscription', _build_subscription_keyboard)
+
+
+class SubscriptionChecker:
+    """
+    Проверка подписки пользователя на каналы.
+
+    Каналы проверяются параллельно, результаты кэшируются по (user_id, channel_id) с разными TTL
+    для подписки и её отсутствия, а одновременные проверки одной пары объединяются в один запрос
+    get_chat_member. При ошибке API используется устаревший положительный результат, если он есть.
+    """
+
+    def __init__(self, bot, channel_ids=None, positive_ttl: float = 600, negative_ttl: float = 30,
+                 max_size: int = 50000, max_workers: int = 8, timeout: float = 10):
+        """
+        :param bot: Экземпляр TeleBot
+        :param channel_ids: ID обязательных каналов (по умолчанию required_channel_ids)
+        :param positive_ttl: Сколько секунд помнить, что пользователь подписан
+        :param negative_ttl: Сколько секунд помнить, что пользователь не подписан
+        :param max_size: Максимальное количество кэшированных пар (user_id, channel_id)
+        :param max_workers: Количество потоков для запросов get_chat_member
+        :param timeout: Сколько секунд ждать ответа по одному каналу
+        """
+        self.bot = bot
+        self.channel_ids = list(required_channel_ids if channel_ids is None else channel_ids)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.timeout = timeout
+        self._cache = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._executor = self._create_executor(max_workers)
+
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.api_calls = 0
+        self.errors = 0
+
+    def _create_executor(self, max_workers: int):
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sub-check')
+
+    def _start_fetch(self, user_id: int, channel_id: int):
+        return self._executor.submit(self._fetch, user_id, channel_id)
+
+    def _fetch(self, user_id: int, channel_id: int) -> bool:
+        try:
+            self._count_api_call()
+            return self._remember(user_id, channel_id, self.bot.get_chat_member(channel_id, user_id).status)
+        finally:
+            self._done(user_id, channel_id)
+
+    def _count_api_call(self):
+        with self._lock:
+            self.api_calls += 1
+
+    def _remember(self, user_id: int, channel_id: int, status: str) -> bool:
+        key = (user_id, channel_id)
+        subscribed = status in SUBSCRIBED_STATUSES
+        ttl = self.positive_ttl if subscribed else self.negative_ttl
+        with self._lock:
+            self._cache[key] = (time.monotonic() + ttl, subscribed)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return subscribed
+
+    def _done(self, user_id: int, channel_id: int):
+        with self._lock:
+            self._in_flight.pop((user_id, channel_id), None)
+
+    def _pending(self, user_id: int) -> Optional[List[Tuple[int, object]]]:
+        """
+        Смотрит кэш и запускает (или находит уже запущенные) запросы по остальным каналам.
+
+        :return: None, если по кэшу пользователь не подписан, иначе [(channel_id, future)]
+        """
+        now = time.monotonic()
+        pending = []
+        with self._lock:
+            for channel_id in self.channel_ids:
+                key = (user_id, channel_id)
+                entry = self._cache.get(key)
+                if entry is not None and entry[0] > now:
+                    self.hits += 1
+                    if not entry[1]:
+                        return None
+                    continue
+
+                future = self._in_flight.get(key)
+                if future is None:
+                    self.misses += 1
+                    future = self._start_fetch(user_id, channel_id)
+                    self._in_flight[key] = future
+                else:
+                    self.deduplicated += 1
+                pending.append((channel_id, future))
+        return pending
+
+    def _on_error(self, user_id: int, channel_id: int, error: Exception) -> bool:
+        """Ошибка запроса: True, если можно положиться на прошлый положительный результат."""
+        with self._lock:
+            self.errors += 1
+            entry = self._cache.get((user_id, channel_id))
+        stale = entry is not None and entry[1]
+        logger.warning("Ошибка проверки подписки на канал %s: %s, %s", channel_id, error,
+                       'используем прошлый результат' if stale else 'считаем, что не подписан')
+        return stale
+
+    def is_subscribed(self, user_id: int) -> bool:
+        """
+        Проверяет, подписан ли пользователь на все каналы.
+
+        :param user_id: Telegram ID пользователя
+        :return: True, если пользователь подписан на все каналы
+        """
+        pending = self._pending(user_id)
+        if pending is None:
+            return False
+
+        subscribed = True
+        for channel_id, future in pending:
+            try:
+                if not future.result(timeout=self.timeout):
+                    subscribed = False
+            except Exception as e:
+                if not self._on_error(user_id, channel_id, e):
+                    subscribed = False
+        return subscribed
 
+    def _report_access(self, channel_id: int, status: Optional[str], error: Optional[Exception] = None) -> bool:
+        if status in ADMIN_STATUSES:
+            return True
+        logger.warning("Бот не администратор канала %s (%s): get_chat_member не сможет проверить подписку, "
+                       "и на команды будет отвечено как неподписанным", channel_id, error or status)
+        return False
 
-def is_user_subscribed(user_id, bot):
-    """Проверяет, подписан ли пользователь на все каналы из списка по ID"""
-    for channel_id in required_channel_ids:
+    def check_access(self) -> bool:
+        """
+        Проверяет при запуске, что бот — администратор обязательных каналов. Без этого
+        get_chat_member возвращает ошибку и проверка отказывает всем; пишет предупреждение в лог.
+
+        :return: True, если доступ есть ко всем каналам
+        """
+        try:
+            bot_id = self.bot.get_me().id
+        except Exception as e:
+            logger.warning("Не удалось проверить права бота в обязательных каналах: %s", e)
+            return False
+
+        access = True
+        for channel_id in self.channel_ids:
+            try:
+                access &= self._report_access(channel_id, self.bot.get_chat_member(channel_id, bot_id).status)
+            except Exception as e:
+                access &= self._report_access(channel_id, None, e)
+        return access
+
+    def invalidate(self, user_id: int):
+        """Забывает результаты проверок пользователя (например, после нажатия «Я подписался»)."""
+        with self._lock:
+            for channel_id in self.channel_ids:
+                self._cache.pop((user_id, channel_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "in_flight": len(self._in_flight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "deduplicated": self.deduplicated,
+                "api_calls": self.api_calls,
+                "errors": self.errors,
+            }
+
+
+class AsyncSubscriptionChecker(SubscriptionChecker):
+    """
+    SubscriptionChecker для AsyncTeleBot: get_chat_member выполняется корутиной в цикле событий,
+    одновременные проверки одной пары ждут одну задачу. Потоки не нужны.
+    """
+
+    def _create_executor(self, max_workers: int):
+        return None
+
+    def _start_fetch(self, user_id: int, channel_id: int):
+        return asyncio.ensure_future(self._fetch(user_id, channel_id))
+
+    async def _fetch(self, user_id: int, channel_id: int) -> bool:
+        try:
+            self._count_api_call()
+            member = await self.bot.get_chat_member(channel_id, user_id)
+            return self._remember(user_id, channel_id, member.status)
+        finally:
+            self._done(user_id, channel_id)
+
+    async def is_subscribed(self, user_id: int) -> bool:
+        pending = self._pending(user_id)
+        if pending is None:
+            return False
+
+        subscribed = True
+        for channel_id, task in pending:
+            try:
+                # shield: таймаут одного ожидающего не отменяет запрос, который ждут другие
+                if not await asyncio.wait_for(asyncio.shield(task), self.timeout):
+                    subscribed = False
+            except Exception as e:
+                if not self._on_error(user_id, channel_id, e):
+                    subscribed = False
+        return subscribed
+
+    async def check_access(self) -> bool:
         try:
-            # Получаем статус пользователя в канале
-            status = bot.get_chat_member(channel_id, user_id).status
-            # Статусы 'member', 'administrator', 'creator' означают подписку
-            if status not in ['member', 'administrator', 'creator']:
-                return False
+            bot_id = (await self.bot.get_me()).id
         except Exception as e:
-            print(f"Ошибка проверки подписки на канал {channel_id}: {e}")
+            logger.warning("Не удалось проверить права бота в обязательных каналах: %s", e)
             return False
-    return True
+
+        access = True
+        for channel_id in self.channel_ids:
+            try:
+                access &= self._report_access(channel_id, (await self.bot.get_chat_member(channel_id, bot_id)).status)
+            except Exception as e:
+                access &= self._report_access(channel_id, None, e)
+        return access
+
+
+_checkers = {}
+_checkers_lock = threading.Lock()
+
+
+def get_subscription_checker(bot) -> SubscriptionChecker:
+    """
+    Возвращает общую проверку подписки для бота, создавая её по настройкам при первом вызове:
+    AsyncSubscriptionChecker для AsyncTeleBot, SubscriptionChecker для TeleBot.
+    """
+    with _checkers_lock:
+        checker = _checkers.get(id(bot))
+        if checker is None:
+            checker_class = AsyncSubscriptionChecker if inspect.iscoroutinefunction(bot.get_chat_member) \
+                else SubscriptionChecker
+            checker = checker_class(bot, positive_ttl=Config.SUBSCRIPTION_POSITIVE_TTL,
+                                          negative_ttl=Config.SUBSCRIPTION_NEGATIVE_TTL)
+            _checkers[id(bot)] = checker
+        return checker
+
+
+def _gated(handler, bot, checker: SubscriptionChecker):
+    """Обёртка обработчика сообщения: не подписанному пользователю вместо ответа — просьба подписаться."""
+    if inspect.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def async_wrapper(message, *args, **kwargs):
+            if await checker.is_subscribed(message.from_user.id):
+                return await handler(message, *args, **kwargs)
+            await bot.send_message(message.chat.id, SUBSCRIPTION_REQUIRED_TEXT,
+                                   reply_markup=subscription_keyboard())
+
+        return async_wrapper
+
+    @functools.wraps(handler)
+    def wrapper(message, *args, **kwargs):
+        if checker.is_subscribed(message.from_user.id):
+            return handler(message, *args, **kwargs)
+        bot.send_message(message.chat.id, SUBSCRIPTION_REQUIRED_TEXT, reply_markup=subscription_keyboard())
+
+    return wrapper
+
+
+def require_subscription(bot, checker: SubscriptionChecker):
+    """
+    Пропускает к зарегистрированным обработчикам команд (TeleBot и AsyncTeleBot) только подписчиков
+    обязательных каналов. Благодаря кэшу проверка повторной команды не обращается к API.
+
+    :param bot: Бот, обработчики которого нужно закрыть проверкой
+    :param checker: Проверка подписки (для AsyncTeleBot — AsyncSubscriptionChecker)
+    """
+    for handler in bot.message_handlers:
+        if getattr(handler['function'], '_gated', False):
+            continue
+        handler['function'] = _gated(handler['function'], bot, checker)
+        handler['function']._gated = True
@@ -0,0 +1,94 @@
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from telebot import types
+
+from utils.dispatcher import UpdateDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadedHTTPServer(ThreadingHTTPServer):
+    # По умолчанию backlog всего 5: при всплеске соединений клиенты получают reset
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class WebhookServer:
+    """
+    HTTP-сервер, принимающий обновления от Telegram и передающий их в UpdateDispatcher.
+
+    Если очередь дорожки заполнена дольше enqueue_timeout диспетчера, вебхук отвечает 503,
+    и Telegram повторит доставку позже (backpressure).
+    """
+
+    def __init__(self, dispatcher: UpdateDispatcher, host: str, port: int, path: str,
+                 secret_token: Optional[str] = None):
+        """
+        :param dispatcher: Диспетчер, по дорожкам которого раскладываются обновления
+        :param host: Адрес для прослушивания
+        :param port: Порт для прослушивания
+        :param path: Путь вебхука (например, /webhook)
+        :param secret_token: Ожидаемое значение X-Telegram-Bot-Api-Secret-Token
+        """
+        self.dispatcher = dispatcher
+        self.path = path
+        self.secret_token = secret_token
+        self._httpd = ThreadedHTTPServer((host, port), self._make_handler())
+
+    @property
+    def server_address(self):
+        return self._httpd.server_address
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    return self._reply(404)
+                if server.secret_token and \
+                        self.headers.get('X-Telegram-Bot-Api-Secret-Token') != server.secret_token:
+                    return self._reply(403)
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    update = types.Update.de_json(json.loads(self.rfile.read(length)))
+                except Exception as e:
+                    logger.warning("Некорректное обновление на вебхуке: %s", e)
+                    return self._reply(400)
+
+                # 503 заставит Telegram повторить доставку, когда дорожка разгрузится
+                self._reply(200 if server.dispatcher.submit(update) else 503)
+
+            def _reply(self, status: int, body: bytes = b""):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        logger.info("Вебхук слушает %s:%s%s", self.server_address[0], self.server_address[1], self.path)
+        self._httpd.serve_forever()
+
+    def stop(self):
+        """Прерывает serve_forever(); вызывается из другого потока (например, по сигналу)."""
+        self._httpd.shutdown()
+
+    def shutdown(self, drain_timeout: Optional[float] = None) -> bool:
+        """
+        Останавливает приём обновлений и дожидается обработки уже принятых.
+
+        :param drain_timeout: Максимальное время ожидания очереди в секундах
+        :return: True, если очередь обработана полностью
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        return self.dispatcher.drain(drain_timeout)